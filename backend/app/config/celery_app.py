@@ -1,5 +1,8 @@
 import os
 from celery import Celery
+from celery.signals import before_task_publish, task_prerun, worker_init
+from prometheus_client import start_http_server
+from app.utils.metrics import get_request_id, start_request
 
 # Redis is running locally on port 6379, using DB 0
 celery_app = Celery(
@@ -19,7 +22,7 @@ celery_app.conf.update(
         worker_concurrency=1,
     )
 
-celery_app.autodiscover_tasks(['app.utils.reminder_utils', 'app.utils.doc_utils']) 
+celery_app.autodiscover_tasks(['app.utils.reminder_utils', 'app.utils.doc_utils', 'app.utils.chat_utils']) 
 
 
 # Load periodic tasks from this file
@@ -32,7 +35,32 @@ celery_app.conf.beat_schedule = {
             "hour": 9,
             "day_of_week": 1
         }
+    },
+    # Safety net for chat turns whose background write never completed
+    "flush-pending-chat-turns": {
+        "task": "app.utils.chat_utils.flush_pending_chat_turns",
+        "schedule": 60.0
     }
 }
 
 celery_app.conf.timezone = "Asia/Karachi"
+
+
+@before_task_publish.connect
+def attach_request_id(headers=None, **kwargs):
+    # Tasks queued while serving a request carry its id
+    request_id = get_request_id()
+    if request_id and headers is not None:
+        headers.setdefault("request_id", request_id)
+
+@task_prerun.connect
+def bind_request_id(task=None, **kwargs):
+    request_id = task.request.get("request_id") or (task.request.headers or {}).get("request_id")
+    start_request(request_id)
+
+@worker_init.connect
+def start_metrics_server(**kwargs):
+    # The worker has no web server of its own, so Prometheus scrapes it on a separate port
+    port = int(os.getenv("CELERY_METRICS_PORT", "9101"))
+    if port:
+        start_http_server(port)
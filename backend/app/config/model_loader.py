@@ -1,18 +1,163 @@
+import asyncio
+import os
+from typing import Dict, Optional
+import httpx
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+from langchain_core.runnables import Runnable
 from langchain_groq.chat_models import ChatGroq
+from app.config.settings import get_settings
+
+
+settings = get_settings()
+
+# Canned replies of the fake backend, one per stage
+FAKE_RESPONSES = {
+    "classification": '["personal"]',
+    "generation": "This is a placeholder answer from the fake LLM backend.",
+    "summarization": "The user and the assistant talked about the user's week.",
+}
+
+
+class ModelProfile:
+    """Model and client settings for one stage of the RAG pipeline"""
+
+    def __init__(
+        self,
+        model_name: str,
+        temperature: float,
+        max_tokens: Optional[int],
+        timeout: float,
+        max_retries: int,
+        hedge_after_ms: int = 0,
+        max_connections: int = 20,
+    ):
+        self.model_name = model_name
+        self.temperature = temperature
+        self.max_tokens = max_tokens
+        self.timeout = timeout
+        self.max_retries = max_retries
+        # Start a duplicate request if the first hasn't answered after this long, 0 disables it
+        self.hedge_after_ms = hedge_after_ms
+        self.max_connections = max_connections
+
+
+def get_model_profiles() -> Dict[str, ModelProfile]:
+    return {
+        "classification": ModelProfile(
+            model_name=settings.RAG_CLASSIFICATION_MODEL,
+            temperature=settings.RAG_CLASSIFICATION_TEMP,
+            max_tokens=settings.RAG_CLASSIFICATION_MAX_TOKENS,
+            timeout=settings.RAG_CLASSIFICATION_TIMEOUT,
+            max_retries=settings.RAG_CLASSIFICATION_RETRIES,
+            hedge_after_ms=settings.RAG_CLASSIFICATION_HEDGE_MS,
+        ),
+        "generation": ModelProfile(
+            model_name=settings.RAG_GENERATION_MODEL,
+            temperature=settings.RAG_GENERATION_TEMP,
+            max_tokens=settings.RAG_GENERATION_MAX_TOKENS,
+            timeout=settings.RAG_GENERATION_TIMEOUT,
+            max_retries=settings.RAG_GENERATION_RETRIES,
+        ),
+        # Runs in the Celery worker, off the answer path
+        "summarization": ModelProfile(
+            model_name=settings.RAG_SUMMARY_MODEL,
+            temperature=0.0,
+            max_tokens=settings.RAG_SUMMARY_MAX_TOKENS,
+            timeout=settings.RAG_SUMMARY_TIMEOUT,
+            max_retries=settings.RAG_GENERATION_RETRIES,
+            max_connections=2,
+        ),
+    }
+
+
+class HedgedLLM(Runnable):
+    """Sends a second copy of a request when the first is slow and returns whichever finishes first.
+
+    Only async single-shot calls are hedged, and the slower request is cancelled. Sync calls and
+    streaming go straight to the wrapped model on the caller's thread.
+    """
+
+    def __init__(self, llm: Runnable, hedge_after_ms: int):
+        self.llm = llm
+        self.hedge_after = hedge_after_ms / 1000
+        self.stats = {"calls": 0, "hedged": 0}
+
+    def invoke(self, input, config=None, **kwargs):
+        # A thread stuck in an HTTP call can't be abandoned, so racing two would only hold both
+        self.stats["calls"] += 1
+        return self.llm.invoke(input, config, **kwargs)
+
+    async def ainvoke(self, input, config=None, **kwargs):
+        self.stats["calls"] += 1
+        # Tasks copy the caller's context, so request ids and spans carry over
+        primary = asyncio.ensure_future(self.llm.ainvoke(input, config, **kwargs))
+        pending = {primary}
+        try:
+            done, pending = await asyncio.wait(pending, timeout=self.hedge_after)
+            if done:
+                return primary.result()
+
+            self.stats["hedged"] += 1
+            pending.add(asyncio.ensure_future(self.llm.ainvoke(input, config, **kwargs)))
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+            return primary.result()
+        finally:
+            # The loser, or both if the caller was cancelled
+            for task in pending:
+                task.cancel()
+
+    def stream(self, input, config=None, **kwargs):
+        return self.llm.stream(input, config, **kwargs)
+
+    def astream(self, input, config=None, **kwargs):
+        return self.llm.astream(input, config, **kwargs)
 
-import os
 
 class LLMManager:
-    def __init__(self):
+    """Builds one chat model per pipeline stage from its ModelProfile.
+
+    The "groq" backend gives every stage its own pooled HTTP clients, timeout and retries.
+    The "fake" backend returns canned, deterministic replies and needs no API key.
+    """
+
+    def __init__(self, backend: str = settings.LLM_BACKEND, profiles: Optional[Dict[str, ModelProfile]] = None):
+        self.backend = backend
+        self.profiles = profiles or get_model_profiles()
         self.api_key = os.getenv("GROQ_API_KEY")
 
-        if not self.api_key:
+        if self.backend == "groq" and not self.api_key:
             raise ValueError("GROQ_API_KEY environment variable is required")
+        if self.backend not in ("groq", "fake"):
+            raise ValueError(f"Unknown LLM backend: {self.backend}")
 
-        self.shared_llm = ChatGroq(
-            model_name="llama-3.3-70b-versatile",
-            temperature=0.7,
+        self.llms = {stage: self._build_llm(stage, profile) for stage, profile in self.profiles.items()}
+        # Kept for callers that predate per-stage models
+        self.shared_llm = self.llms["generation"]
+
+    def _build_llm(self, stage: str, profile: ModelProfile) -> Runnable:
+        if self.backend == "fake":
+            return FakeListChatModel(responses=[FAKE_RESPONSES.get(stage, "")])
+
+        limits = httpx.Limits(max_connections=profile.max_connections, max_keepalive_connections=profile.max_connections)
+        llm = ChatGroq(
+            model_name=profile.model_name,
+            temperature=profile.temperature,
+            max_tokens=profile.max_tokens,
+            request_timeout=profile.timeout,
+            max_retries=profile.max_retries,
+            http_client=httpx.Client(limits=limits, timeout=profile.timeout),
+            http_async_client=httpx.AsyncClient(limits=limits, timeout=profile.timeout),
         )
+        if profile.hedge_after_ms > 0:
+            return HedgedLLM(llm, profile.hedge_after_ms)
+        return llm
+
+    def get_llm(self, stage: str) -> Runnable:
+        return self.llms[stage]
 
 
 llm_manager_instance = None
@@ -1,4 +1,8 @@
 import os
+import json
+import time
+import threading
+from typing import Dict, List, Optional, Set, Tuple
 from dotenv import load_dotenv
 from qdrant_client import QdrantClient
 from langchain.vectorstores import Qdrant as QdrantStore
@@ -6,15 +10,22 @@ from langchain.embeddings import HuggingFaceEmbeddings
 from qdrant_client.models import VectorParams
 from qdrant_client.models import PayloadSchemaType
 from qdrant_client.models import OptimizersConfigDiff
+from qdrant_client.models import HnswConfigDiff
+from qdrant_client.models import KeywordIndexParams, KeywordIndexType
 from qdrant_client.http.models import PayloadSchemaType 
+from app.config.redis_client import redis_client
+from app.config.settings import get_settings
 
 
 load_dotenv()
+settings = get_settings()
 
 QDRANT_API_KEY = os.getenv("QDRANT_API_KEY")
 QDRANT_URL = os.getenv("QDRANT_URL")
 
-embeddings = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
+EMBEDDING_MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+
+embeddings = HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL_NAME)
 
 
 if not all([QDRANT_URL, QDRANT_API_KEY]):
@@ -23,54 +34,154 @@ if not all([QDRANT_URL, QDRANT_API_KEY]):
 # Connect to Qdrant Cloud
 qdrant_client = QdrantClient(
     url=QDRANT_URL,
-    api_key=QDRANT_API_KEY
+    api_key=QDRANT_API_KEY,
+    prefer_grpc=settings.QDRANT_PREFER_GRPC
 )
 
-def check_index_exists(client: QdrantClient, collection_name: str, field_name: str) -> bool:
-    """Check if an index exists for a given field in the collection."""
-    try:
-        collection_info = client.get_collection(collection_name)
-        
-        if hasattr(collection_info, 'payload_schema') and collection_info.payload_schema:
-            exists = field_name in collection_info.payload_schema
-            return exists
-        return False
-        
-    except Exception as e:
-        print(f"Error checking index for {field_name}: {e}")
-        return False
+REQUIRED_INDEXES = ["metadata.file_type", "metadata.week_start"]
+
+# Shared-collection mode: all users in one collection, separated by this payload field
+MULTITENANT = settings.QDRANT_MULTITENANT
+SHARED_COLLECTION_NAME = settings.QDRANT_SHARED_COLLECTION
+TENANT_FIELD = "metadata.user_id"
+
+
+def get_required_indexes(collection_name: str) -> List[str]:
+    if collection_name == SHARED_COLLECTION_NAME:
+        return REQUIRED_INDEXES + [TENANT_FIELD]
+    return REQUIRED_INDEXES
+
+
+class CollectionRegistry:
+    """Remembers which collections exist and which payload indexes they have.
+
+    Lookups hit a process-local dict first and Redis second, so every worker shares
+    what any of them has already created and Qdrant is only asked once per collection.
+    Local entries are re-read from Redis after `local_ttl` seconds, so a collection deleted
+    or migrated by another process (forget()) stops being trusted here too.
+    Collections found missing are remembered for `absent_ttl` seconds, so users who never
+    uploaded don't cost a Qdrant round trip on every question.
+    """
+
+    REDIS_KEY = "qdrant:collections"  # hash: collection name -> JSON list of indexed fields
+    ABSENT_KEY_PREFIX = "qdrant:collections:absent"
+
+    def __init__(
+        self,
+        redis_client,
+        absent_ttl: float = settings.QDRANT_ABSENT_COLLECTION_TTL,
+        local_ttl: float = settings.QDRANT_REGISTRY_LOCAL_TTL,
+    ):
+        self.redis_client = redis_client
+        self.absent_ttl = absent_ttl
+        self.local_ttl = local_ttl
+        # collection name -> (indexed fields, monotonic time the entry expires)
+        self._local: Dict[str, Tuple[Set[str], float]] = {}
+        # collection name -> monotonic time the "absent" entry expires
+        self._absent: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def get_indexes(self, collection_name: str) -> Optional[Set[str]]:
+        """Indexed fields of a known collection, or None if the collection is unknown"""
+        with self._lock:
+            entry = self._local.get(collection_name)
+            if entry is not None:
+                if entry[1] > time.monotonic():
+                    return entry[0]
+                del self._local[collection_name]
+
+        try:
+            raw = self.redis_client.hget(self.REDIS_KEY, collection_name)
+        except Exception as e:
+            print(f"Collection registry lookup failed: {e}")
+            return None
+        if raw is None:
+            return None
+
+        indexes = set(json.loads(raw))
+        with self._lock:
+            self._local[collection_name] = (indexes, time.monotonic() + self.local_ttl)
+        return indexes
+
+    def is_ready(self, collection_name: str) -> bool:
+        indexes = self.get_indexes(collection_name)
+        return indexes is not None and set(get_required_indexes(collection_name)).issubset(indexes)
+
+    def is_absent(self, collection_name: str) -> bool:
+        """Whether the collection was recently found missing"""
+        with self._lock:
+            expires_at = self._absent.get(collection_name)
+            if expires_at is not None:
+                if expires_at > time.monotonic():
+                    return True
+                del self._absent[collection_name]
+
+        try:
+            ttl_ms = self.redis_client.pttl(f"{self.ABSENT_KEY_PREFIX}:{collection_name}")
+        except Exception as e:
+            print(f"Collection registry lookup failed: {e}")
+            return False
+        if ttl_ms is None or ttl_ms <= 0:
+            return False
+        with self._lock:
+            self._absent[collection_name] = time.monotonic() + ttl_ms / 1000
+        return True
+
+    def mark_absent(self, collection_name: str) -> None:
+        with self._lock:
+            self._absent[collection_name] = time.monotonic() + self.absent_ttl
+        try:
+            self.redis_client.set(f"{self.ABSENT_KEY_PREFIX}:{collection_name}", 1, px=int(self.absent_ttl * 1000))
+        except Exception as e:
+            print(f"Collection registry update failed: {e}")
+
+    def mark_ready(self, collection_name: str, indexes: Set[str]) -> None:
+        indexes = set(indexes)
+        with self._lock:
+            self._local[collection_name] = (indexes, time.monotonic() + self.local_ttl)
+            self._absent.pop(collection_name, None)
+        try:
+            self.redis_client.hset(self.REDIS_KEY, collection_name, json.dumps(sorted(indexes)))
+            self.redis_client.delete(f"{self.ABSENT_KEY_PREFIX}:{collection_name}")
+        except Exception as e:
+            print(f"Collection registry update failed: {e}")
+
+    def mark_existing(self, collection_name: str) -> None:
+        """Record a collection found on the query path, without claiming any indexes"""
+        with self._lock:
+            if collection_name not in self._local:
+                self._local[collection_name] = (set(), time.monotonic() + self.local_ttl)
+            self._absent.pop(collection_name, None)
+        try:
+            # Never overwrite the full entry of a worker that has already indexed it
+            self.redis_client.hsetnx(self.REDIS_KEY, collection_name, json.dumps([]))
+        except Exception as e:
+            print(f"Collection registry update failed: {e}")
+
+    def forget(self, collection_name: str) -> None:
+        with self._lock:
+            self._local.pop(collection_name, None)
+        try:
+            self.redis_client.hdel(self.REDIS_KEY, collection_name)
+        except Exception as e:
+            print(f"Collection registry delete failed: {e}")
+
 
-def setup_qdrant_index(client: QdrantClient, collection_name: str):
-    """Create indexes for nested metadata fields"""
-    try:
-        # Use the correct nested field names
-        required_indexes = ["metadata.file_type", "metadata.week_start"]
-
-        for field_name in required_indexes:
-            if not check_index_exists(client, collection_name, field_name):
-                client.create_payload_index(
-                    collection_name=collection_name,
-                    field_name=field_name, 
-                    field_schema=PayloadSchemaType.KEYWORD,
-                    wait=True
-                )
-            else:
-                # Index already exists, no action needed
-                pass
-
-    except Exception as e:
-        if "already exists" not in str(e).lower():
-            raise
-
-def get_user_vector_store(user_id: str) -> QdrantStore:
-    collection_name = f"user_{user_id}_docs"
-
-    try:
-        qdrant_client.get_collection(collection_name)
-
-    except Exception as e:        
-        # Create collection
-        qdrant_client.create_collection(
+collection_registry = CollectionRegistry(redis_client)
+
+
+def ensure_collection(client: QdrantClient, collection_name: str) -> None:
+    """Create the collection and its payload indexes unless the registry already knows them"""
+    if collection_registry.is_ready(collection_name):
+        return
+
+    shared = collection_name == SHARED_COLLECTION_NAME
+
+    if client.collection_exists(collection_name):
+        collection_info = client.get_collection(collection_name)
+        existing_indexes = set((collection_info.payload_schema or {}).keys())
+    else:
+        client.create_collection(
             collection_name=collection_name,
             vectors_config=VectorParams(
                 size=384,
@@ -80,16 +191,83 @@ def get_user_vector_store(user_id: str) -> QdrantStore:
                 deleted_threshold=0.2,
                 vacuum_min_vector_number=100,
                 default_segment_number=0,
-                indexing_threshold=4,
+                # The shared collection keeps Qdrant's default so it isn't re-indexed on every upload
+                indexing_threshold=20000 if shared else 4,
                 flush_interval_sec=5
-            )
+            ),
+            # Shared mode: no global graph, one small graph per tenant instead
+            hnsw_config=HnswConfigDiff(m=0, payload_m=16) if shared else None
         )
-    
-    # Always setup indexes (for both new and existing collections)
-    setup_qdrant_index(qdrant_client, collection_name)
+        existing_indexes = set()
+
+    for field_name in get_required_indexes(collection_name):
+        if field_name in existing_indexes:
+            continue
+        if field_name == TENANT_FIELD:
+            # is_tenant lets Qdrant co-locate each user's points on disk
+            field_schema = KeywordIndexParams(type=KeywordIndexType.KEYWORD, is_tenant=True)
+        else:
+            field_schema = PayloadSchemaType.KEYWORD
+        try:
+            client.create_payload_index(
+                collection_name=collection_name,
+                field_name=field_name,
+                field_schema=field_schema,
+                wait=True
+            )
+        except Exception as e:
+            if "already exists" not in str(e).lower():
+                raise
+        existing_indexes.add(field_name)
+
+    collection_registry.mark_ready(collection_name, existing_indexes)
+
+
+def is_collection_ready(collection_name: str) -> bool:
+    """Whether the collection can be searched, answered from the registry.
+
+    Makes no schema calls. A collection the registry doesn't know is probed once for
+    existence: a missing one is remembered as absent for a short while, and an existing
+    one (created before the registry) is registered with unknown indexes, which the next
+    upload or scripts/register_collections.py fill in.
+    """
+    if collection_registry.get_indexes(collection_name) is not None:
+        return True
+    if collection_registry.is_absent(collection_name):
+        return False
+    if not qdrant_client.collection_exists(collection_name):
+        collection_registry.mark_absent(collection_name)
+        return False
+    # Searchable without its payload indexes, only slower; ensure_collection still sees it as not ready
+    collection_registry.mark_existing(collection_name)
+    return True
+
+
+def get_user_collection_name(user_id: str) -> str:
+    if MULTITENANT:
+        return SHARED_COLLECTION_NAME
+    return f"user_{user_id}_docs"
+
+
+def get_tenant_id(user_id: str) -> Optional[str]:
+    """Value searches must filter metadata.user_id on, or None when each user has their own collection"""
+    return user_id if MULTITENANT else None
+
+
+def get_user_vector_store(user_id: str, ensure: bool = False, embedding_model=None) -> QdrantStore:
+    """Return a store handle for the user's collection.
+
+    The query path passes ensure=False and makes no schema calls; ingestion passes
+    ensure=True so the collection and its indexes exist before points are written.
+    `embedding_model` overrides the shared embeddings, e.g. with a cached wrapper.
+    """
+    collection_name = get_user_collection_name(user_id)
+
+    if ensure:
+        ensure_collection(qdrant_client, collection_name)
 
     return QdrantStore(
         client=qdrant_client,
         collection_name=collection_name,
-        embeddings=embeddings
-    )
\ No newline at end of file
+        embeddings=embedding_model or embeddings
+    )
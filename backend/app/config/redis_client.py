@@ -1,8 +1,31 @@
+import os
 import redis
+import redis.asyncio as aioredis
 
-redis_client = redis.Redis(
-    host="localhost",  # or "127.0.0.1"
-    port=6379,
-    db=0,
-    decode_responses=True  # returns strings instead of bytes
-)
+REDIS_URL = os.getenv("REDIS_URL")
+
+if REDIS_URL:
+    redis_client = redis.Redis.from_url(REDIS_URL, decode_responses=True)
+else:
+    redis_client = redis.Redis(
+        host="localhost",  # or "127.0.0.1"
+        port=6379,
+        db=0,
+        decode_responses=True  # returns strings instead of bytes
+    )
+
+# Raw bytes client for binary values such as embedding vectors
+if REDIS_URL:
+    binary_redis_client = redis.Redis.from_url(REDIS_URL, decode_responses=False)
+else:
+    binary_redis_client = redis.Redis(host="localhost", port=6379, db=0, decode_responses=False)
+
+def create_async_redis_client() -> aioredis.Redis:
+    """New asyncio client for the same server. Connections are bound to the event loop
+    that first uses them, so code running its own loop (e.g. Celery tasks) needs its own client."""
+    if REDIS_URL:
+        return aioredis.Redis.from_url(REDIS_URL, decode_responses=True)
+    return aioredis.Redis(host="localhost", port=6379, db=0, decode_responses=True)
+
+# Shared client for the API's event loop
+async_redis_client = create_async_redis_client()
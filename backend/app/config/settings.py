@@ -1,3 +1,4 @@
+from typing import Dict
 from pydantic import Field
 from pydantic_settings import BaseSettings
 
@@ -5,11 +6,81 @@ class Settings(BaseSettings):
     RAG_RETRIEVAL_K: int = Field(2, description="Number of documents to retrieve for RAG")
     RAG_CLASSIFICATION_TEMP: float = Field(0.0, description="Temperature for classification LLM")
     RAG_GENERATION_TEMP: float = Field(0.1, description="Temperature for generation LLM")
+    LLM_BACKEND: str = Field("groq", description="Chat model backend: groq, or fake for deterministic canned replies")
+    RAG_CLASSIFICATION_MODEL: str = Field("llama-3.1-8b-instant", description="Model used to classify questions")
+    RAG_CLASSIFICATION_MAX_TOKENS: int = Field(32, description="Max tokens of a classification reply")
+    RAG_CLASSIFICATION_TIMEOUT: float = Field(5, description="Seconds before a classification request times out")
+    RAG_CLASSIFICATION_HEDGE_MS: int = Field(400, description="Send a duplicate classification request after this many ms without a reply; 0 disables it")
+    RAG_GENERATION_MODEL: str = Field("llama-3.3-70b-versatile", description="Model used to answer questions")
+    RAG_GENERATION_MAX_TOKENS: int = Field(1024, description="Max tokens of a generated answer")
+    RAG_GENERATION_TIMEOUT: float = Field(60, description="Seconds before a generation request times out")
+    RAG_GENERATION_RETRIES: int = Field(2, description="How many times to retry a failed generation request")
     RAG_MAX_QUESTION_LENGTH: int = Field(1000, description="Max length of incoming question")
     RAG_CLASSIFICATION_RETRIES: int = Field(2, description="How many times to retry classification on error")
     RAG_CACHE_TTL: int = Field(300, description="Cache time-to-live in seconds")
     RAG_STREAMING_DELAY_MS: int = Field(100, description="Delay in milliseconds between streaming tokens")
-    RAG_MAX_CONCURRENT_STREAMS: int = Field(10, description="Max concurrent streaming requests to prevent overload")
+    RAG_MAX_CONCURRENT_STREAMS: int = Field(10, description="Max concurrent streaming requests across all API workers")
+    RAG_ADMISSION_MAX_QUEUE: int = Field(100, description="Max questions waiting for a stream slot in one worker")
+    RAG_ADMISSION_MAX_QUEUE_PER_USER: int = Field(3, description="Max questions one user may have waiting for a stream slot")
+    RAG_ADMISSION_MAX_WAIT_SECONDS: float = Field(15, description="Seconds a question may wait for a stream slot before a 429")
+    RAG_ADMISSION_LEASE_SECONDS: float = Field(120, description="Seconds a stream slot survives without a refresh, e.g. after a worker crash")
+    RAG_LOCAL_CLASSIFIER_ENABLED: bool = Field(True, description="Classify questions with local embeddings before asking the LLM")
+    RAG_LOCAL_CLASSIFIER_THRESHOLD: float = Field(0.45, description="Min prototype similarity to trust the local classifier; below it the LLM decides")
+    RAG_LOCAL_CLASSIFIER_MARGIN: float = Field(0.05, description="Categories scoring within this margin of the best one are also returned")
+    RAG_CLASSIFICATION_CACHE_SIZE: int = Field(2048, description="Max number of question classifications kept in memory")
+    RAG_CHAT_HISTORY_TURNS: int = Field(4, description="Number of recent chat turns included verbatim in the generation prompt; older ones reach it through the chat summary")
+    CHAT_SUMMARY_ENABLED: bool = Field(True, description="Keep a rolling summary of turns older than RAG_CHAT_HISTORY_TURNS and add it to the prompt")
+    CHAT_SUMMARY_MAX_WORDS: int = Field(150, description="Target length of a chat summary")
+    CHAT_SUMMARY_BATCH_TURNS: int = Field(20, description="Max turns folded into the summary per summarization call")
+    CHAT_SUMMARY_DELAY_SECONDS: float = Field(5, description="Delay before summarizing a chat, so the turn's write-behind flush lands first")
+    RAG_SUMMARY_MODEL: str = Field("llama-3.1-8b-instant", description="Model used to summarize older chat turns")
+    RAG_SUMMARY_MAX_TOKENS: int = Field(300, description="Max tokens of a chat summary")
+    RAG_SUMMARY_TIMEOUT: float = Field(30, description="Seconds before a summarization request times out")
+    CHAT_MESSAGES_PAGE_SIZE: int = Field(50, description="Default number of messages returned per chat history page")
+    CHAT_CACHE_TURNS: int = Field(20, description="Recent turns per chat kept in Redis for history reads")
+    CHAT_CACHE_TTL: int = Field(86400, description="Seconds a chat's cached recent turns live in Redis")
+    CHAT_FLUSH_BATCH_SIZE: int = Field(50, description="Max pending turns written to the database in one call")
+    CHAT_FLUSH_MAX_RETRIES: int = Field(5, description="Attempts per batch when writing pending turns to the database")
+    RAG_CONTEXT_BUILDER_ENABLED: bool = Field(True, description="Over-fetch chunks and pack them into a token-budgeted context instead of joining RAG_RETRIEVAL_K chunks")
+    RAG_CONTEXT_FETCH_K_PER_CATEGORY: int = Field(4, description="Chunks retrieved per predicted category before packing")
+    RAG_CONTEXT_TOKENS_PER_CATEGORY: int = Field(500, description="Default context token budget for each file type")
+    RAG_CONTEXT_CATEGORY_BUDGETS: Dict[str, int] = Field({}, description="Per category overrides of the context token budget, e.g. {\"reflection\": 800}; stored file type names such as \"reflections\" map to their category")
+    RAG_CONTEXT_MAX_TOKENS: int = Field(1500, description="Upper bound on context tokens across all file types")
+    RAG_CONTEXT_MMR: bool = Field(False, description="Rerank retrieved chunks with MMR to favour diverse ones")
+    RAG_CONTEXT_MMR_LAMBDA: float = Field(0.7, description="MMR trade-off: 1 ranks by relevance only, 0 by diversity only")
+    RAG_ANSWER_CACHE_ENABLED: bool = Field(True, description="Replay cached answers to repeated questions against unchanged documents")
+    RAG_ANSWER_CACHE_SIMILARITY: float = Field(0.95, description="Min cosine similarity between questions to reuse an answer; 1 allows exact matches only")
+    RAG_ANSWER_CACHE_TTL: int = Field(86400, description="Seconds a user's cached answers live in Redis")
+    RAG_ANSWER_CACHE_MAX_ENTRIES: int = Field(200, description="Max cached answers per user and week selection")
+    RAG_SPECULATIVE_RETRIEVAL: bool = Field(True, description="Fetch retrieval candidates while the question is being classified")
+    RAG_SPECULATIVE_K: int = Field(12, description="Candidates fetched without a file_type filter during speculative retrieval")
+    RAG_QUERY_EMBEDDING_CACHE_SIZE: int = Field(1024, description="Max number of question embeddings kept in memory")
+    RAG_LOCAL_SEARCH_ENABLED: bool = Field(True, description="Search small per-user corpora in memory instead of querying Qdrant")
+    RAG_LOCAL_SEARCH_MAX_POINTS: int = Field(2000, description="Users with more points than this are always searched in Qdrant")
+    RAG_LOCAL_SEARCH_MAX_USERS: int = Field(64, description="Max number of per-user vector snapshots kept in memory")
+    RAG_LOCAL_SEARCH_VERSION_CHECK_SECONDS: float = Field(5, description="Seconds between checks that a user's in-memory vectors are still current")
+    RAG_PIPELINE_CACHE_SIZE: int = Field(256, description="Max number of per-user RAG pipelines kept in memory")
+    RAG_PIPELINE_IDLE_TTL: int = Field(900, description="Seconds after which an unused per-user RAG pipeline is dropped")
+    QDRANT_MULTITENANT: bool = Field(False, description="Store all users in one Qdrant collection, separated by metadata.user_id")
+    QDRANT_SHARED_COLLECTION: str = Field("user_docs", description="Name of the shared collection used in multitenant mode")
+    PDF_EXTRACT_BACKEND: str = Field("pypdf", description="PDF text extraction backend: pypdf or pypdfium2")
+    PDF_EXTRACT_WORKERS: int = Field(2, description="Processes used to extract PDF pages; 1 extracts inline")
+    PDF_PAGES_PER_TASK: int = Field(8, description="Pages extracted per worker task")
+    EMBED_BATCH_SIZE: int = Field(64, description="Chunks embedded and written to Qdrant per batch during ingestion")
+    QDRANT_ABSENT_COLLECTION_TTL: float = Field(10, description="Seconds a missing collection is remembered before the query path checks Qdrant again")
+    QDRANT_REGISTRY_LOCAL_TTL: float = Field(30, description="Seconds a worker trusts its in-memory copy of a registry entry before re-reading Redis")
+    QDRANT_PREFER_GRPC: bool = Field(False, description="Talk to Qdrant over gRPC instead of REST")
+    QDRANT_UPSERT_MAX_IN_FLIGHT: int = Field(2, description="Concurrent Qdrant upsert requests during ingestion")
+    QDRANT_UPSERT_WAIT: bool = Field(False, description="Wait for each ingestion upsert to be applied; the last batch always waits")
+    EMBED_QUERY_BATCH_SIZE: int = Field(32, description="Max questions embedded together in one forward pass")
+    EMBED_QUERY_BATCH_WAIT_MS: float = Field(5, description="Milliseconds to wait for more questions before embedding a batch")
+    EMBED_QUERY_BATCH_TIMEOUT: float = Field(10, description="Seconds a worker thread waits on the batcher before embedding the question itself")
+    EMBEDDING_CACHE_TTL: int = Field(30 * 24 * 3600, description="Seconds a cached chunk embedding is kept in Redis")
+    DB_EXECUTOR_POOL_SIZE: int = Field(16, description="Worker threads for blocking Supabase calls made from async code")
+    LOG_REQUEST_SPANS: bool = Field(False, description="Print the per-stage timings of every question and upload; the metrics record them either way")
+    AUTH_TOKEN_CACHE_SIZE: int = Field(2048, description="Max number of verified access tokens kept in memory")
+    AUTH_REMOTE_CACHE_TTL: int = Field(60, description="Seconds to trust a token verified through the Supabase auth API")
+    AUTH_JWT_AUDIENCE: str = Field("authenticated", description="Expected audience claim of Supabase access tokens")
     CLASSIFICATION_PROMPT: str = Field("""
         You are a helpful assistant. Your task is to classify a user's question into ONE OR MORE of the following categories:
 
@@ -68,6 +139,19 @@ class Settings(BaseSettings):
 
                 Answer:
                 """, description="Prompt for generation LLM to answer user questions based on context")
+    CHAT_SUMMARY_PROMPT: str = Field("""
+                You maintain a running summary of a conversation between a user and their personal assistant.
+                Update the summary with the new turns below. Keep facts the user shared, their goals, decisions
+                and open questions; drop greetings and repetition. Write at most {max_words} words in plain prose.
+
+                Current summary:
+                {summary}
+
+                New turns:
+                {turns}
+
+                Updated summary:
+                """, description="Prompt used to fold older chat turns into the chat's rolling summary")
 
 # Singleton accessor
 def get_settings() -> Settings:
@@ -6,6 +6,11 @@ load_dotenv()
 
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_SERVICE_KEY = os.getenv("SUPABASE_SERVICE_KEY")
+# Used to verify access tokens locally (HS256 projects use the secret, asymmetric ones the JWKS)
+SUPABASE_JWT_SECRET = os.getenv("SUPABASE_JWT_SECRET")
+SUPABASE_JWKS_URL = os.getenv("SUPABASE_JWKS_URL") or (
+    f"{SUPABASE_URL.rstrip('/')}/auth/v1/.well-known/jwks.json" if SUPABASE_URL else None
+)
 
 if not all([SUPABASE_URL, SUPABASE_SERVICE_KEY]):
     raise ValueError("Missing environment variables.")
@@ -1,6 +1,8 @@
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from app.config.supabase_client import  supabase
+from app.utils.db_executor import run_in_db_executor
+from app.services.auth_services.token_verifier_service import get_token_verifier
+from app.utils.metrics import track_stage
 
 security = HTTPBearer()
 
@@ -8,14 +10,19 @@ async def verify_token(
     credentials: HTTPAuthorizationCredentials = Depends(security),
 ) -> str:
     token = credentials.credentials
+    verifier = get_token_verifier()
 
-    try:
-        response = supabase.auth.get_user(token)
-        user = response.user
+    with track_stage("api", "auth"):
+        # Fast path: already verified and not yet expired
+        user_id = verifier.get_cached(token)
+        if user_id:
+            return user_id
 
-        if not user:
-            raise HTTPException(status_code=403, detail="Invalid token")
-        return user.id 
+        try:
+            user_id = await run_in_db_executor(verifier.verify, token)
+        except Exception as e:
+            raise HTTPException(status_code=403, detail="Token verification failed.")
 
-    except Exception as e:
-        raise HTTPException(status_code=403, detail="Token verification failed.")
\ No newline at end of file
+    if not user_id:
+        raise HTTPException(status_code=403, detail="Invalid token")
+    return user_id
@@ -1,13 +1,18 @@
-from fastapi import FastAPI, HTTPException
+import asyncio
+from fastapi import FastAPI, HTTPException, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
 from app.routes.user import router as user_router
 from app.routes.doc import router as doc_router
-from app.routes.qa import router as qa_router
+from app.routes.qa import router as qa_router, rag_service
 from app.routes.user import router as user_router
 from app.routes.chat import router as chat_router
 
 from app.utils.exception import http_exception_handler
 from app.utils.exception import rag_exception_handler, RAGException
+from app.utils.exception import admission_rejected_handler, AdmissionRejectedException
+from app.services.chat_services.chat_write_behind_service import get_chat_write_behind_service
+from app.services.qa_services.embedding_batcher_service import get_embedding_batcher
+from app.utils.metrics import REQUEST_ID_HEADER, render_metrics, start_request
 
 app = FastAPI(title="Week Plan Chat", version="1.0.0")
 
@@ -19,11 +24,47 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.middleware("http")
+async def assign_request_id(request: Request, call_next):
+    # Reuse the caller's id if it sent one, so logs line up across services
+    request_id = start_request(request.headers.get(REQUEST_ID_HEADER))
+    response = await call_next(request)
+    response.headers[REQUEST_ID_HEADER] = request_id
+    return response
+
+@app.on_event("startup")
+async def flush_leftover_chat_turns():
+    # Turns queued by a worker that died before flushing them
+    asyncio.create_task(get_chat_write_behind_service().flush_all_pending())
+
+@app.on_event("startup")
+async def start_embedding_batcher():
+    get_embedding_batcher().start()
+
+@app.on_event("startup")
+async def warm_up_rag():
+    # Loading prototypes and LLM clients here keeps the first question from blocking the loop
+    await rag_service.warm_up()
+
+@app.on_event("shutdown")
+async def drain_chat_turns():
+    await get_chat_write_behind_service().drain()
+
+@app.on_event("shutdown")
+async def stop_embedding_batcher():
+    await get_embedding_batcher().stop()
+
 # Health check endpoint
 @app.get("/health")
 async def health_check():
     return {"status": "healthy"}
 
+# Prometheus scrape endpoint
+@app.get("/metrics")
+async def metrics():
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
+
 # Routers
 app.include_router(user_router, prefix="/api/users", tags=["Users"])
 app.include_router(user_router, prefix="/api/auth", tags=["Auth"])
@@ -34,4 +75,5 @@ app.include_router(chat_router, prefix="/api/chat", tags=["Chat"])
 # Error handling
 app.add_exception_handler(HTTPException, http_exception_handler)
 app.add_exception_handler(RAGException, rag_exception_handler)
+app.add_exception_handler(AdmissionRejectedException, admission_rejected_handler)
 
@@ -1,19 +1,25 @@
-from fastapi import APIRouter, Depends
+from typing import Optional
+from fastapi import APIRouter, Depends, Query
 from gotrue import List
 from app.dependencies.auth import verify_token
 from app.services.chat_services.chat_db_service import ChatDBService
-from app.schemas.chat_schema import ChatResponseModel
+from app.services.chat_services.chat_write_behind_service import get_chat_write_behind_service
+from app.schemas.chat_schema import ChatResponseModel, ChatMessagesPageModel
+from app.config.settings import get_settings
 from fastapi.responses import JSONResponse
 
 
 router = APIRouter()
 chat_db_service = ChatDBService()
+# Chat reads go through the write-behind queue, so turns not flushed yet still show up
+chat_service = get_chat_write_behind_service()
+settings = get_settings()
 
 @router.get("/my-chats", response_model=List[ChatResponseModel])
 async def get_user_chats(user_id: str = Depends(verify_token)):
 
     try:
-        chat_sessions = chat_db_service.get_user_chats(user_id)
+        chat_sessions = await chat_db_service.aget_user_chats(user_id)
         return JSONResponse(
             content={
                 "data": chat_sessions,
@@ -33,10 +39,15 @@ async def get_user_chats(user_id: str = Depends(verify_token)):
         )
 
 @router.get("/my-chats/{chat_id}", response_model=ChatResponseModel)
-async def get_chat_session(chat_id: str, user_id: str = Depends(verify_token)):
+async def get_chat_session(
+    chat_id: str,
+    limit: int = Query(settings.CHAT_MESSAGES_PAGE_SIZE, ge=1, le=200),
+    user_id: str = Depends(verify_token)
+):
 
     try:
-        chat_session = chat_db_service.get_chat_session(user_id, chat_id)
+        # Only the latest page of messages; older ones come from /messages with next_cursor
+        chat_session = await chat_service.aget_chat_session(user_id, chat_id, limit)
         return JSONResponse(
                 content={
                     "data": chat_session,
@@ -54,3 +65,31 @@ async def get_chat_session(chat_id: str, user_id: str = Depends(verify_token)):
             },
             status_code=500
         )
+
+@router.get("/my-chats/{chat_id}/messages", response_model=ChatMessagesPageModel)
+async def get_chat_messages(
+    chat_id: str,
+    before: Optional[int] = Query(None, description="Cursor from a previous page; returns messages older than it"),
+    limit: int = Query(settings.CHAT_MESSAGES_PAGE_SIZE, ge=1, le=200),
+    user_id: str = Depends(verify_token)
+):
+
+    try:
+        messages, next_cursor = await chat_service.aget_chat_messages(user_id, chat_id, limit, before)
+        return JSONResponse(
+            content={
+                "data": {"messages": messages, "next_cursor": next_cursor},
+                "message": "Chat messages retrieved successfully",
+                "status": "success"
+            },
+            status_code=200
+        )
+    except Exception as e:
+        return JSONResponse(
+            content={
+                "data": None,
+                "message": f"Error retrieving chat messages: {str(e)}",
+                "status": "error"
+            },
+            status_code=500
+        )
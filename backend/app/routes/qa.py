@@ -1,12 +1,15 @@
 from fastapi import APIRouter, Depends
 from fastapi.responses import JSONResponse, StreamingResponse
+from starlette.background import BackgroundTask
 from app.dependencies.auth import verify_token
 from app.schemas.qa_schema import QuestionRequest
 from app.services.qa_services.streaming_rag_service import RAGService
+from app.services.qa_services.admission_control_service import get_admission_controller
 
 
 router = APIRouter()
 rag_service = RAGService()
+admission_controller = get_admission_controller()
 
 # streaming endpoint
 @router.post("/ask-stream")
@@ -18,17 +21,35 @@ async def ask_question_stream(
     chat_id = question_request.chat_id
     week_start = question_request.week_start
 
+    # Waits for a free stream slot; a 429 with Retry-After is raised if none frees up in time
+    lease = await admission_controller.acquire(user_id)
     try:
         stream = rag_service.run_question_streaming(question, user_id, chat_id, week_start)
 
-        return StreamingResponse(stream, media_type="text/event-stream") 
+        # Stop proxies from buffering the token stream
+        return StreamingResponse(
+            admission_controller.guard(lease, stream),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+            # The guard releases the slot when the stream ends; this covers a stream that never starts
+            background=BackgroundTask(lease.release)
+        )
     except Exception as e:
+        await lease.release()
         print(f"Streaming error: {e}")
         return JSONResponse(
             status_code=500,
             content={"error": str(e), "type": "InternalServerError"}
         )
 
+@router.get("/stream-stats")
+async def get_stream_stats(user_id: str = Depends(verify_token)):
+    return {
+        "streams": rag_service.stats,
+        "admission": await admission_controller.get_metrics(),
+        "answer_cache": rag_service.answer_cache.stats if rag_service.answer_cache else None,
+    }
+
 
 
 # non streaming endpoint
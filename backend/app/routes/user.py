@@ -9,9 +9,9 @@ router = APIRouter()
 user_db_service = UserDBService()
 
 @router.get("/me", response_model=UserProfileResponse)
-def get_current_user_info(userId: str = Depends(verify_token)):
+async def get_current_user_info(userId: str = Depends(verify_token)):
     try:
-        user = user_db_service.get_user(userId)
+        user = await user_db_service.aget_user(userId)
         return JSONResponse(
             content={
                 "data": user,
@@ -14,8 +14,18 @@ class ChatResponse(BaseModel):
     status: ChatStatus = Field(..., description="Status of the chat response.")
     messages_count: int = Field(..., description="Number of messages in the chat response.")
     updated_at: str = Field(..., description="Timestamp when the chat response was last updated.")
+    next_cursor: Optional[int] = Field(None, description="Cursor for the next (older) page of messages, if any.")
 
 class ChatResponseModel(BaseModel):
     data: Optional[ChatResponse] = Field(None, description="Chat session data")
     message: str = Field(..., description="Response message")
-    status: str = Field(..., description="Response status (success/error)")
\ No newline at end of file
+    status: str = Field(..., description="Response status (success/error)")
+
+class ChatMessagesPage(BaseModel):
+    messages: List[dict] = Field(..., description="Messages in this page, oldest first.")
+    next_cursor: Optional[int] = Field(None, description="Cursor for the next (older) page of messages, if any.")
+
+class ChatMessagesPageModel(BaseModel):
+    data: Optional[ChatMessagesPage] = Field(None, description="Page of chat messages")
+    message: str = Field(..., description="Response message")
+    status: str = Field(..., description="Response status (success/error)")
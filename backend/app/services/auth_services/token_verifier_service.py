@@ -0,0 +1,140 @@
+import time
+import threading
+from collections import OrderedDict
+from typing import Optional, Tuple
+import jwt
+from jwt import PyJWKClient
+from app.config.supabase_client import supabase, SUPABASE_JWT_SECRET, SUPABASE_JWKS_URL
+from app.config.settings import get_settings
+
+
+settings = get_settings()
+
+LOCAL_ALGORITHMS = ["HS256", "RS256", "ES256"]
+
+
+class TokenVerifier:
+    """Verifies Supabase access tokens locally, falling back to the auth API only when it has to"""
+
+    def __init__(
+        self,
+        jwt_secret: Optional[str] = SUPABASE_JWT_SECRET,
+        jwks_url: Optional[str] = SUPABASE_JWKS_URL,
+        audience: str = settings.AUTH_JWT_AUDIENCE,
+        max_cache_size: int = settings.AUTH_TOKEN_CACHE_SIZE,
+        remote_cache_ttl: int = settings.AUTH_REMOTE_CACHE_TTL,
+    ):
+        self.jwt_secret = jwt_secret
+        self.jwks_client = PyJWKClient(jwks_url, cache_keys=True) if jwks_url else None
+        self.audience = audience
+        self.max_cache_size = max_cache_size
+        self.remote_cache_ttl = remote_cache_ttl
+        self.supabase = supabase
+
+        # token -> (user_id, expires_at), least recently used first
+        self._cache: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_cached(self, token: str) -> Optional[str]:
+        """Return the user id for a previously verified, still valid token"""
+        with self._lock:
+            entry = self._cache.get(token)
+            if entry is None:
+                return None
+            user_id, expires_at = entry
+            if expires_at <= time.time():
+                del self._cache[token]
+                return None
+            self._cache.move_to_end(token)
+            return user_id
+
+    def _remember(self, token: str, user_id: str, expires_at: float) -> None:
+        if self.max_cache_size <= 0:
+            return
+        with self._lock:
+            self._cache[token] = (user_id, expires_at)
+            self._cache.move_to_end(token)
+            while len(self._cache) > self.max_cache_size:
+                self._cache.popitem(last=False)
+
+    def _get_signing_key(self, token: str, algorithm: str):
+        if algorithm == "HS256":
+            return self.jwt_secret
+        if self.jwks_client is None:
+            return None
+        try:
+            return self.jwks_client.get_signing_key_from_jwt(token).key
+        except jwt.PyJWKClientError as e:
+            # JWKS unreachable or key id unknown - let the auth API decide
+            print(f"JWKS lookup failed: {e}")
+            return None
+
+    def _verify_locally(self, token: str) -> Optional[Tuple[str, float]]:
+        """Verify the signature and claims locally.
+
+        Returns None when the token cannot be checked locally (no key configured,
+        unsupported algorithm), raises jwt.InvalidTokenError when it is rejected.
+        """
+        algorithm = jwt.get_unverified_header(token).get("alg")
+        if algorithm not in LOCAL_ALGORITHMS:
+            return None
+
+        key = self._get_signing_key(token, algorithm)
+        if not key:
+            return None
+
+        claims = jwt.decode(
+            token,
+            key,
+            algorithms=[algorithm],
+            audience=self.audience,
+            options={"require": ["exp", "sub"]},
+        )
+        return claims["sub"], float(claims["exp"])
+
+    def _verify_remotely(self, token: str) -> Optional[Tuple[str, float]]:
+        response = self.supabase.auth.get_user(token)
+        user = response.user
+        if not user:
+            return None
+
+        expires_at = time.time() + self.remote_cache_ttl
+        try:
+            claims = jwt.decode(token, options={"verify_signature": False})
+            if "exp" in claims:
+                expires_at = min(expires_at, float(claims["exp"]))
+        except jwt.InvalidTokenError:
+            pass
+        return user.id, expires_at
+
+    def verify(self, token: str) -> Optional[str]:
+        """Return the user id the token belongs to, or None if it is invalid.
+
+        Blocking - may fetch JWKS or call the auth API, so run it off the event loop.
+        """
+        user_id = self.get_cached(token)
+        if user_id:
+            return user_id
+
+        try:
+            result = self._verify_locally(token)
+        except jwt.InvalidTokenError:
+            return None
+
+        if result is None:
+            result = self._verify_remotely(token)
+            if result is None:
+                return None
+
+        user_id, expires_at = result
+        self._remember(token, user_id, expires_at)
+        return user_id
+
+
+token_verifier_instance = None
+
+def get_token_verifier():
+    global token_verifier_instance
+    if token_verifier_instance is None:
+        token_verifier_instance = TokenVerifier()
+    return token_verifier_instance
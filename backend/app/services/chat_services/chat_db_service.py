@@ -1,39 +1,138 @@
-from typing import Optional, List
+from typing import Optional, List, Tuple
 from app.config.supabase_client import supabase
 from fastapi import HTTPException
+from app.utils.db_executor import run_in_db_executor
+
+# Chat row without the legacy `messages` array, which now lives in chat_messages
+CHAT_COLUMNS = "id,user_id,status,messages_count,created_at,updated_at"
+MESSAGE_COLUMNS = "id,turn_id,user_input,assistant_response,created_at"
+SUMMARY_COLUMNS = "summary,summary_message_id"
 
 
 class ChatDBService:
     def __init__(self):
         self.table_name = "chats"
+        self.messages_table_name = "chat_messages"
         self.supabase = supabase
     
-    def get_chat_session(self, user_id:str, chat_id:str) -> Optional[dict]:
+    def get_chat_session(self, user_id:str, chat_id:str, limit: int = 50, before: Optional[int] = None) -> Optional[dict]:
+        """Chat row with one page of its most recent messages (oldest first) and a cursor for older ones"""
         try:
-            response = self.supabase.table(self.table_name).select("*").eq("id", chat_id).eq("user_id", user_id).execute()
-            if response.data:
-                return response.data[0]
-            else:
+            response = self.supabase.table(self.table_name).select(CHAT_COLUMNS).eq("id", chat_id).eq("user_id", user_id).execute()
+            if not response.data:
                 return None
+
+            chat_session = response.data[0]
+            messages, next_cursor = self.get_chat_messages(user_id, chat_id, limit, before)
+            chat_session["messages"] = messages
+            chat_session["next_cursor"] = next_cursor
+            return chat_session
+        except HTTPException:
+            raise
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Database query error: {str(e)}")
+
+    def get_chat_messages(self, user_id: str, chat_id: str, limit: int, before: Optional[int] = None) -> Tuple[List[dict], Optional[int]]:
+        """Page of messages older than `before` (oldest first) and the cursor for the next page, if any"""
+        try:
+            query = (
+                self.supabase.table(self.messages_table_name)
+                .select(MESSAGE_COLUMNS)
+                .eq("chat_id", chat_id)
+                .eq("user_id", user_id)
+            )
+            if before is not None:
+                query = query.lt("id", before)
+            # Fetch one extra row to know whether an older page exists
+            response = query.order("id", desc=True).limit(limit + 1).execute()
+            rows = response.data or []
+
+            next_cursor = rows[limit - 1]["id"] if len(rows) > limit else None
+            return list(reversed(rows[:limit])), next_cursor
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Database query error: {str(e)}")
+
+    def get_recent_messages(self, chat_id: str, user_id: str, limit: int) -> List[dict]:
+        """Last `limit` turns of a chat, oldest first"""
+        messages, _ = self.get_chat_messages(user_id, chat_id, limit)
+        return messages
+
+    def get_messages_between(self, user_id: str, chat_id: str, after: int, before: Optional[int], limit: int) -> List[dict]:
+        """Up to `limit` messages with after < id < before, oldest first"""
+        try:
+            query = (
+                self.supabase.table(self.messages_table_name)
+                .select(MESSAGE_COLUMNS)
+                .eq("chat_id", chat_id)
+                .eq("user_id", user_id)
+                .gt("id", after)
+            )
+            if before is not None:
+                query = query.lt("id", before)
+            response = query.order("id").limit(limit).execute()
+            return response.data or []
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Database query error: {str(e)}")
+
+    def get_chat_summary(self, user_id: str, chat_id: str) -> Optional[dict]:
+        """The chat's rolling summary and the id of the last message folded into it"""
+        try:
+            response = self.supabase.table(self.table_name).select(SUMMARY_COLUMNS).eq("id", chat_id).eq("user_id", user_id).execute()
+            return response.data[0] if response.data else None
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"Database query error: {str(e)}")
 
+    def update_chat_summary(self, chat_id: str, summary: str, message_id: int, previous_message_id: int) -> bool:
+        """Store a new summary unless another writer moved it past `previous_message_id` first"""
+        try:
+            response = (
+                self.supabase.table(self.table_name)
+                .update({"summary": summary, "summary_message_id": message_id})
+                .eq("id", chat_id)
+                .eq("summary_message_id", previous_message_id)
+                .execute()
+            )
+            return bool(response.data)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Database update error: {str(e)}")
+
+    def append_chat_messages(self, chat_id: str, user_id: Optional[str], messages: List[dict]) -> int:
+        """Append turns atomically, creating the chat if needed; returns the new message count"""
+        try:
+            response = self.supabase.rpc("append_chat_messages", {
+                "p_chat_id": chat_id,
+                "p_user_id": user_id,
+                "p_messages": [
+                    {
+                        "user_input": msg["user_input"],
+                        "assistant_response": msg["assistant_response"],
+                        # Lets the RPC skip turns that were already written by an earlier retry
+                        "turn_id": msg.get("turn_id"),
+                    }
+                    for msg in messages
+                ],
+            }).execute()
+            return response.data
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Database update error: {str(e)}")
+
     def create_chat_session(self, user_id: str, chat_id: str, messages: List[dict]) -> None:
         try:
-            messages_count = len(messages)
             self.supabase.table(self.table_name).insert({
                 "user_id": user_id,
                 "id": chat_id,
-                "messages": messages,
+                "messages": [],
                 "status": "active",
-                "messages_count": messages_count,
+                "messages_count": 0,
             }).execute()
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"Database insert error: {str(e)}")
+        if messages:
+            self.append_chat_messages(chat_id, user_id, messages)
 
     def get_or_create_chat_session(self, chat_id: str, user_id: str) -> dict:
         try:
-            response = self.supabase.table(self.table_name).select("*").eq("id", chat_id).execute()
+            response = self.supabase.table(self.table_name).select(CHAT_COLUMNS).eq("id", chat_id).execute()
 
             if not response.data:
                 response = self.supabase.table(self.table_name).insert({
@@ -50,37 +149,50 @@ class ChatDBService:
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"Database query error: {str(e)}")
 
-    def update_chat_session(self, chat_id: str, newMessages: List[dict]=None, status: str = None) -> None:
-        try:
-            response = self.supabase.table(self.table_name).select("messages").eq("id", chat_id).single().execute()
-            if not response.data:
-                raise ValueError("Chat session not found")
-            
-            updated_data = {}
-            if newMessages:
-                existing_messages = response.data["messages"] or []
-                updated_messages = existing_messages + newMessages
-                updated_count = len(updated_messages)
-
-                updated_data = {
-                    "messages": updated_messages,
-                    "messages_count": updated_count
-                }
-
-            if status:
-                updated_data["status"] = status
-
-            self.supabase.table(self.table_name).update(updated_data).eq("id", chat_id).execute()
+    def update_chat_session(self, chat_id: str, newMessages: List[dict]=None, status: str = None, user_id: str = None) -> None:
+        if newMessages:
+            self.append_chat_messages(chat_id, user_id, newMessages)
 
-        except Exception as e:
-            raise HTTPException(status_code=500, detail=f"Database update error: {str(e)}")
+        if status:
+            try:
+                self.supabase.table(self.table_name).update({"status": status}).eq("id", chat_id).execute()
+            except Exception as e:
+                raise HTTPException(status_code=500, detail=f"Database update error: {str(e)}")
         
     def get_user_chats(self, user_id:str) -> List[dict]:
         try:
-            response = self.supabase.table(self.table_name).select("*").eq("user_id", user_id).execute()
+            response = self.supabase.table(self.table_name).select(CHAT_COLUMNS).eq("user_id", user_id).execute()
             if response.data:
                 return response.data
             else:
                 return None
         except Exception as e:
-            raise HTTPException(status_code=500, detail=f"Database query error: {str(e)}")
\ No newline at end of file
+            raise HTTPException(status_code=500, detail=f"Database query error: {str(e)}")
+
+    # Async variants for request handlers and the streaming chain
+    async def aget_chat_session(self, user_id: str, chat_id: str, limit: int = 50, before: Optional[int] = None) -> Optional[dict]:
+        return await run_in_db_executor(self.get_chat_session, user_id, chat_id, limit, before)
+
+    async def aget_chat_messages(self, user_id: str, chat_id: str, limit: int, before: Optional[int] = None) -> Tuple[List[dict], Optional[int]]:
+        return await run_in_db_executor(self.get_chat_messages, user_id, chat_id, limit, before)
+
+    async def aget_recent_messages(self, chat_id: str, user_id: str, limit: int) -> List[dict]:
+        return await run_in_db_executor(self.get_recent_messages, chat_id, user_id, limit)
+
+    async def aget_chat_summary(self, user_id: str, chat_id: str) -> Optional[dict]:
+        return await run_in_db_executor(self.get_chat_summary, user_id, chat_id)
+
+    async def aappend_chat_messages(self, chat_id: str, user_id: Optional[str], messages: List[dict]) -> int:
+        return await run_in_db_executor(self.append_chat_messages, chat_id, user_id, messages)
+
+    async def acreate_chat_session(self, user_id: str, chat_id: str, messages: List[dict]) -> None:
+        return await run_in_db_executor(self.create_chat_session, user_id, chat_id, messages)
+
+    async def aget_or_create_chat_session(self, chat_id: str, user_id: str) -> dict:
+        return await run_in_db_executor(self.get_or_create_chat_session, chat_id, user_id)
+
+    async def aupdate_chat_session(self, chat_id: str, newMessages: List[dict]=None, status: str = None, user_id: str = None) -> None:
+        return await run_in_db_executor(self.update_chat_session, chat_id, newMessages, status, user_id)
+
+    async def aget_user_chats(self, user_id: str) -> List[dict]:
+        return await run_in_db_executor(self.get_user_chats, user_id)
@@ -0,0 +1,165 @@
+import asyncio
+from contextvars import copy_context
+from typing import List, Optional
+from langchain.prompts import PromptTemplate
+from langchain_core.output_parsers import StrOutputParser
+from app.config.redis_client import redis_client, async_redis_client
+from app.config.settings import get_settings
+from app.utils.metrics import track_stage
+from .chat_db_service import ChatDBService
+
+
+settings = get_settings()
+
+
+class ChatSummaryService:
+    """Keeps a rolling summary of the turns that have dropped out of a chat's prompt window.
+
+    The prompt carries the last `raw_turns` turns verbatim plus this summary, so its size stays
+    bounded however long the chat gets. After a turn is saved a Celery task folds any older,
+    unsummarized turns into the summary; the answer path only ever reads it, from Redis.
+    The summary row records the id of the last message folded in, and updates are conditional
+    on that id, so two summarizers racing on one chat can't fold the same turns twice.
+    """
+
+    def __init__(
+        self,
+        chat_db_service: ChatDBService,
+        redis_client=async_redis_client,
+        sync_redis_client=redis_client,
+        raw_turns: int = settings.RAG_CHAT_HISTORY_TURNS,
+        max_words: int = settings.CHAT_SUMMARY_MAX_WORDS,
+        batch_turns: int = settings.CHAT_SUMMARY_BATCH_TURNS,
+        delay: float = settings.CHAT_SUMMARY_DELAY_SECONDS,
+        cache_ttl: int = settings.CHAT_CACHE_TTL,
+        lock_timeout: int = 120,
+    ):
+        self.chat_db_service = chat_db_service
+        self.redis_client = redis_client
+        self.sync_redis_client = sync_redis_client
+        self.raw_turns = raw_turns
+        self.max_words = max_words
+        self.batch_turns = batch_turns
+        self.delay = delay
+        self.cache_ttl = cache_ttl
+        self.lock_timeout = lock_timeout
+        self.prompt = PromptTemplate.from_template(settings.CHAT_SUMMARY_PROMPT)
+
+    @staticmethod
+    def _summary_key(chat_id: str, user_id: str) -> str:
+        # Scoped to the owner like the recent-turns cache, reads from other users never hit it
+        return f"chat:{chat_id}:summary:{user_id}"
+
+    @staticmethod
+    def _lock_key(chat_id: str) -> str:
+        return f"chat:{chat_id}:summary_lock"
+
+    # Read path: the generation prompt
+    async def aget_summary(self, chat_id: str, user_id: str) -> str:
+        """The chat's summary, from Redis when cached; an empty string if it has none yet"""
+        key = self._summary_key(chat_id, user_id)
+        try:
+            cached = await self.redis_client.get(key)
+            if cached is not None:
+                return cached
+        except Exception as e:
+            print(f"Chat summary cache read failed: {e}")
+
+        row = await self.chat_db_service.aget_chat_summary(user_id, chat_id)
+        summary = (row or {}).get("summary") or ""
+        try:
+            # Cache empty summaries too, so short chats don't hit the database every turn
+            await self.redis_client.set(key, summary, ex=self.cache_ttl)
+        except Exception as e:
+            print(f"Chat summary cache fill failed: {e}")
+        return summary
+
+    def needs_summary(self, recent_turns: int) -> bool:
+        """Whether a chat whose history read returned `recent_turns` now has turns outside the window"""
+        # The read asked for raw_turns, so a full window plus the turn just saved means one fell out
+        return recent_turns + 1 > self.raw_turns
+
+    def schedule(self, chat_id: str, user_id: str) -> None:
+        """Queue a summarization of the chat; never raises"""
+        # Imported here, the task module imports this one
+        from app.utils.chat_utils import summarize_chat_task
+        try:
+            summarize_chat_task.apply_async(args=[chat_id, user_id], countdown=self.delay)
+        except Exception as e:
+            print(f"Scheduling chat summary for {chat_id} failed: {e}")
+
+    def aschedule(self, chat_id: str, user_id: str) -> None:
+        """Queue a summarization without holding up the caller, publishing to the broker off the loop"""
+        # In the request's context, so the task is published with its request id
+        asyncio.get_running_loop().run_in_executor(None, copy_context().run, self.schedule, chat_id, user_id)
+
+    # Write path: the Celery task
+    @staticmethod
+    def _format_turns(turns: List[dict]) -> str:
+        return "\n".join(f"User: {turn['user_input']}\nAssistant: {turn['assistant_response']}" for turn in turns)
+
+    def _window_start(self, chat_id: str, user_id: str) -> Optional[int]:
+        """Id of the oldest turn still shown verbatim, or None if the chat fits in the window"""
+        if self.raw_turns <= 0:
+            return None
+        recent, _ = self.chat_db_service.get_chat_messages(user_id, chat_id, self.raw_turns)
+        if len(recent) < self.raw_turns:
+            return 0
+        return recent[0]["id"]
+
+    def summarize(self, chat_id: str, user_id: str, llm) -> int:
+        """Fold turns older than the prompt window into the summary; returns how many were folded"""
+        lock = self.sync_redis_client.lock(self._lock_key(chat_id), timeout=self.lock_timeout)
+        if not lock.acquire(blocking=False):
+            # Another worker is summarizing this chat and will see these turns
+            return 0
+
+        chain = self.prompt | llm | StrOutputParser()
+        folded = 0
+        try:
+            row = self.chat_db_service.get_chat_summary(user_id, chat_id)
+            if row is None:
+                return 0
+            summary = row.get("summary") or ""
+            last_id = row.get("summary_message_id") or 0
+
+            window_start = self._window_start(chat_id, user_id)
+            if window_start == 0:
+                return 0
+
+            while True:
+                turns = self.chat_db_service.get_messages_between(user_id, chat_id, last_id, window_start, self.batch_turns)
+                if not turns:
+                    break
+
+                with track_stage("chat", "summarization"):
+                    new_summary = chain.invoke({
+                        "summary": summary or "(none yet)",
+                        "turns": self._format_turns(turns),
+                        "max_words": self.max_words,
+                    }).strip()
+                if not self.chat_db_service.update_chat_summary(chat_id, new_summary, turns[-1]["id"], last_id):
+                    print(f"Chat {chat_id} summary changed underneath us, leaving it to the newer write")
+                    break
+
+                summary, last_id = new_summary, turns[-1]["id"]
+                folded += len(turns)
+                try:
+                    self.sync_redis_client.set(self._summary_key(chat_id, user_id), summary, ex=self.cache_ttl)
+                except Exception as e:
+                    print(f"Chat summary cache update failed: {e}")
+        finally:
+            try:
+                lock.release()
+            except Exception as e:
+                print(f"Releasing summary lock for chat {chat_id} failed: {e}")
+        return folded
+
+
+chat_summary_instance = None
+
+def get_chat_summary_service() -> ChatSummaryService:
+    global chat_summary_instance
+    if chat_summary_instance is None:
+        chat_summary_instance = ChatSummaryService(ChatDBService())
+    return chat_summary_instance
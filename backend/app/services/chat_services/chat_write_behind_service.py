@@ -0,0 +1,275 @@
+import json
+import uuid
+import asyncio
+from typing import List, Optional, Set, Tuple
+from redis.exceptions import WatchError
+from app.config.redis_client import async_redis_client
+from app.config.settings import get_settings
+from .chat_db_service import ChatDBService
+
+
+settings = get_settings()
+
+
+class ChatWriteBehindService:
+    """Serves recent chat turns from Redis and writes new turns to the database in the background.
+
+    New turns are pushed to a per-chat pending list in Redis and the call returns straight away.
+    A flusher drains each chat's pending list in order while holding a per-chat Redis lock, so turns
+    reach the database in the order they were asked even with several workers. Every turn carries a
+    turn_id, which makes retried writes idempotent. Chats with unflushed turns are tracked in a set,
+    so anything left behind by a crashed worker is picked up by flush_all_pending().
+    Turns the database rejects outright (bad ids, a chat owned by someone else) are moved to a
+    dead-letter list instead of blocking the turns queued behind them.
+    """
+
+    PENDING_CHATS_KEY = "chat:pending"
+    DEAD_LETTER_KEY = "chat:dead_letter"
+    # Postgres error classes that no retry can fix: data exceptions, integrity violations, raised errors
+    NON_RETRYABLE_SQLSTATES = ("22", "23", "P0")
+
+    def __init__(
+        self,
+        chat_db_service: ChatDBService,
+        redis_client=async_redis_client,
+        cache_turns: int = settings.CHAT_CACHE_TURNS,
+        cache_ttl: int = settings.CHAT_CACHE_TTL,
+        batch_size: int = settings.CHAT_FLUSH_BATCH_SIZE,
+        max_retries: int = settings.CHAT_FLUSH_MAX_RETRIES,
+        lock_timeout: int = 60,
+        dead_letter_max: int = 10000,
+    ):
+        self.chat_db_service = chat_db_service
+        self.redis_client = redis_client
+        self.cache_turns = cache_turns
+        self.cache_ttl = cache_ttl
+        self.batch_size = batch_size
+        self.max_retries = max_retries
+        self.lock_timeout = lock_timeout
+        self.dead_letter_max = dead_letter_max
+        self._flush_tasks: Set[asyncio.Task] = set()
+
+    @staticmethod
+    def _recent_key(chat_id: str, user_id: str) -> str:
+        # Scoped to the owner, so knowing a chat_id isn't enough to read its cached turns
+        return f"chat:{chat_id}:recent:{user_id}"
+
+    @staticmethod
+    def _pending_key(chat_id: str) -> str:
+        return f"chat:{chat_id}:pending"
+
+    @staticmethod
+    def _lock_key(chat_id: str) -> str:
+        return f"chat:{chat_id}:flush_lock"
+
+    @staticmethod
+    def _as_turn(message: dict) -> dict:
+        return {
+            "turn_id": message.get("turn_id"),
+            "user_input": message["user_input"],
+            "assistant_response": message["assistant_response"],
+        }
+
+    async def aget_recent_messages(self, chat_id: str, user_id: str, limit: int) -> List[dict]:
+        """Last `limit` turns of a chat, oldest first, from Redis when cached"""
+        recent_key = self._recent_key(chat_id, user_id)
+        try:
+            cached = await self.redis_client.lrange(recent_key, -limit, -1)
+            if cached:
+                return [json.loads(turn) for turn in cached]
+        except Exception as e:
+            print(f"Chat cache read failed: {e}")
+            return await self.chat_db_service.aget_recent_messages(chat_id, user_id, limit)
+
+        # Cache miss: the database plus any turns not flushed yet. The pending list is watched from
+        # before the database read, so a turn appended or flushed meanwhile aborts the fill rather
+        # than leaving a cached snapshot without it that later appends keep alive
+        pending_key = self._pending_key(chat_id)
+        messages = None
+        try:
+            async with self.redis_client.pipeline(transaction=True) as pipe:
+                await pipe.watch(pending_key)
+                messages = [
+                    self._as_turn(msg)
+                    for msg in await self.chat_db_service.aget_recent_messages(chat_id, user_id, max(limit, self.cache_turns))
+                ]
+                pending = [json.loads(item) for item in await pipe.lrange(pending_key, 0, -1)]
+                messages = self._merge_pending(messages, pending, user_id)
+
+                if messages:
+                    pipe.multi()
+                    pipe.delete(recent_key)
+                    pipe.rpush(recent_key, *[json.dumps(msg) for msg in messages[-self.cache_turns:]])
+                    pipe.expire(recent_key, self.cache_ttl)
+                    await pipe.execute()
+        except WatchError:
+            # The next read fills it
+            print(f"Chat {chat_id} changed while its cache was being filled, leaving it empty")
+        except Exception as e:
+            print(f"Chat cache fill failed: {e}")
+            if messages is None:
+                return await self.chat_db_service.aget_recent_messages(chat_id, user_id, limit)
+
+        return messages[-limit:]
+
+    def _merge_pending(self, messages: List[dict], pending: List[dict], user_id: str) -> List[dict]:
+        """`messages` followed by the user's queued turns that aren't among them yet"""
+        stored_ids = {msg["turn_id"] for msg in messages if msg.get("turn_id")}
+        return messages + [
+            self._as_turn(item) for item in pending
+            if item["user_id"] == user_id and item["turn_id"] not in stored_ids
+        ]
+
+    async def _aget_pending(self, chat_id: str) -> List[dict]:
+        try:
+            return [json.loads(item) for item in await self.redis_client.lrange(self._pending_key(chat_id), 0, -1)]
+        except Exception as e:
+            print(f"Reading queued turns of chat {chat_id} failed: {e}")
+            return []
+
+    async def aget_chat_session(self, user_id: str, chat_id: str, limit: int) -> Optional[dict]:
+        """Chat row with its latest page of messages, turns not flushed yet appended to that page"""
+        # Queued turns are read first: one flushed in between then shows up in the database read
+        pending = await self._aget_pending(chat_id)
+        chat_session = await self.chat_db_service.aget_chat_session(user_id, chat_id, limit)
+        if chat_session is None:
+            return None
+        messages = self._merge_pending(chat_session["messages"], pending, user_id)
+        chat_session["messages_count"] = (chat_session.get("messages_count") or 0) + len(messages) - len(chat_session["messages"])
+        chat_session["messages"] = messages
+        return chat_session
+
+    async def aget_chat_messages(
+        self, user_id: str, chat_id: str, limit: int, before: Optional[int] = None
+    ) -> Tuple[List[dict], Optional[int]]:
+        """Page of messages like ChatDBService.aget_chat_messages; the newest page includes queued turns"""
+        if before is not None:
+            # Older pages only hold turns already in the database
+            return await self.chat_db_service.aget_chat_messages(user_id, chat_id, limit, before)
+        pending = await self._aget_pending(chat_id)
+        messages, next_cursor = await self.chat_db_service.aget_chat_messages(user_id, chat_id, limit)
+        return self._merge_pending(messages, pending, user_id), next_cursor
+
+    async def aappend_chat_messages(self, chat_id: str, user_id: str, messages: List[dict]) -> None:
+        """Queue turns for a background write; returns once they are in Redis"""
+        turns = [self._as_turn({**msg, "turn_id": msg.get("turn_id") or str(uuid.uuid4())}) for msg in messages]
+        recent_key = self._recent_key(chat_id, user_id)
+        try:
+            async with self.redis_client.pipeline(transaction=True) as pipe:
+                pipe.rpush(self._pending_key(chat_id), *[json.dumps({"user_id": user_id, **turn}) for turn in turns])
+                pipe.sadd(self.PENDING_CHATS_KEY, chat_id)
+                # Only extend a cache that already holds the chat's history, never start a partial one
+                pipe.rpushx(recent_key, *[json.dumps(turn) for turn in turns])
+                pipe.ltrim(recent_key, -self.cache_turns, -1)
+                pipe.expire(recent_key, self.cache_ttl)
+                await pipe.execute()
+        except Exception as e:
+            print(f"Chat write-behind unavailable, writing directly: {e}")
+            await self.chat_db_service.aappend_chat_messages(chat_id, user_id, turns)
+            return
+
+        self._schedule_flush(chat_id)
+
+    def _schedule_flush(self, chat_id: str) -> None:
+        task = asyncio.get_running_loop().create_task(self._flush_safely(chat_id))
+        # Keep a reference so the task isn't garbage collected mid-flight
+        self._flush_tasks.add(task)
+        task.add_done_callback(self._flush_tasks.discard)
+
+    async def _flush_safely(self, chat_id: str) -> None:
+        try:
+            await self.flush_chat(chat_id)
+        except Exception as e:
+            print(f"Flushing chat {chat_id} failed, turns stay queued: {e}")
+
+    @classmethod
+    def _is_retryable(cls, error: Exception) -> bool:
+        # ChatDBService wraps database errors in an HTTPException, the original is its context
+        cause = error.__cause__ or error.__context__ or error
+        if isinstance(cause, (KeyError, TypeError, ValueError)):
+            return False
+        code = str(getattr(cause, "code", "") or "")
+        return not code.startswith(cls.NON_RETRYABLE_SQLSTATES)
+
+    async def _write_with_retry(self, chat_id: str, user_id: Optional[str], turns: List[dict]) -> None:
+        for attempt in range(self.max_retries):
+            try:
+                await self.chat_db_service.aappend_chat_messages(chat_id, user_id, turns)
+                return
+            except Exception as e:
+                if attempt == self.max_retries - 1 or not self._is_retryable(e):
+                    raise
+                delay = min(0.5 * 2 ** attempt, 10)
+                print(f"Chat write failed (attempt {attempt + 1}), retrying in {delay}s: {e}")
+                await asyncio.sleep(delay)
+
+    async def flush_chat(self, chat_id: str) -> None:
+        """Write a chat's pending turns to the database, oldest first"""
+        pending_key = self._pending_key(chat_id)
+        lock = self.redis_client.lock(self._lock_key(chat_id), timeout=self.lock_timeout)
+        if not await lock.acquire(blocking=False):
+            # Another flusher is draining this chat and will pick these turns up
+            return
+
+        batch_size = self.batch_size
+        try:
+            while True:
+                raw = await self.redis_client.lrange(pending_key, 0, batch_size - 1)
+                if not raw:
+                    await self.redis_client.srem(self.PENDING_CHATS_KEY, chat_id)
+                    break
+
+                items = [json.loads(item) for item in raw]
+                # One write per owner: the leading run of turns queued by the same user
+                user_id = items[0]["user_id"]
+                count = next((i for i, item in enumerate(items) if item["user_id"] != user_id), len(items))
+                try:
+                    await self._write_with_retry(chat_id, user_id, [self._as_turn(item) for item in items[:count]])
+                except Exception as e:
+                    if self._is_retryable(e):
+                        raise
+                    if count > 1:
+                        # Find the turn the database rejects by writing one at a time
+                        batch_size = 1
+                        continue
+                    await self._dead_letter(chat_id, raw[0], e)
+                    count = 1
+                await self.redis_client.ltrim(pending_key, count, -1)
+        finally:
+            try:
+                await lock.release()
+            except Exception as e:
+                print(f"Releasing flush lock for chat {chat_id} failed: {e}")
+
+        # A turn queued after our last read may have skipped its own flush while we held the lock
+        if await self.redis_client.llen(pending_key):
+            self._schedule_flush(chat_id)
+
+    async def _dead_letter(self, chat_id: str, raw_item: str, error: Exception) -> None:
+        """Park a turn the database will never accept, so the turns behind it can be written"""
+        reason = str(getattr(error, "detail", error))
+        print(f"Chat {chat_id}: turn rejected by the database, moved to {self.DEAD_LETTER_KEY}: {reason}")
+        entry = {**json.loads(raw_item), "chat_id": chat_id, "error": reason}
+        async with self.redis_client.pipeline(transaction=True) as pipe:
+            pipe.rpush(self.DEAD_LETTER_KEY, json.dumps(entry))
+            pipe.ltrim(self.DEAD_LETTER_KEY, -self.dead_letter_max, -1)
+            await pipe.execute()
+
+    async def flush_all_pending(self) -> None:
+        """Flush every chat that still has queued turns, e.g. after a worker restart"""
+        for chat_id in await self.redis_client.smembers(self.PENDING_CHATS_KEY):
+            await self._flush_safely(chat_id)
+
+    async def drain(self) -> None:
+        """Wait for in-flight background flushes, used on shutdown"""
+        if self._flush_tasks:
+            await asyncio.gather(*list(self._flush_tasks), return_exceptions=True)
+
+
+chat_write_behind_instance = None
+
+def get_chat_write_behind_service() -> ChatWriteBehindService:
+    global chat_write_behind_instance
+    if chat_write_behind_instance is None:
+        chat_write_behind_instance = ChatWriteBehindService(ChatDBService())
+    return chat_write_behind_instance
@@ -25,6 +25,8 @@ class DocumentUploadService:
 
         temp_paths = await self.file_manager.save_temporary_files(list(files_dict.values()), user_id, list(files_dict.keys()))
 
+        # Processing bumps the user's document version when it finishes, which retires
+        # their cached RAG pipeline in every API worker
         process_documents_task.delay(temp_paths, user_id, week_start)
 
         return {"message": "Document processing started in the background"}
@@ -0,0 +1,28 @@
+from app.config.redis_client import redis_client
+
+
+class DocVersionService:
+    """Per-user document version in Redis, bumped whenever a user's documents change.
+
+    Caches derived from a user's documents remember the version they were built from
+    and treat a different current version as stale, in every worker at once.
+    """
+
+    KEY_PREFIX = "docs:version"
+
+    def __init__(self, redis_client=redis_client):
+        self.redis_client = redis_client
+
+    def _make_key(self, user_id: str) -> str:
+        return f"{self.KEY_PREFIX}:{user_id}"
+
+    def get_version(self, user_id: str) -> int:
+        try:
+            return int(self.redis_client.get(self._make_key(user_id)) or 0)
+        except Exception as e:
+            print(f"Document version lookup failed: {e}")
+            # Unknown version: callers rebuild rather than trust a cache
+            return -1
+
+    def bump_version(self, user_id: str) -> int:
+        return int(self.redis_client.incr(self._make_key(user_id)))
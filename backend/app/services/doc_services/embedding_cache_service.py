@@ -0,0 +1,75 @@
+import hashlib
+from typing import List, Optional
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from app.config.redis_client import binary_redis_client
+from app.config.settings import get_settings
+
+
+settings = get_settings()
+
+
+class CachedEmbeddings(Embeddings):
+    """Embeddings wrapper that caches document vectors in Redis by content hash.
+
+    Keys are sha256(model name + chunk text) and values raw float32 bytes, so a chunk
+    uploaded again next week (or by another user) is never re-embedded. Only the
+    misses of a batch are sent to the wrapped model, in a single call.
+    """
+
+    KEY_PREFIX = "emb"
+
+    def __init__(self, embeddings: Embeddings, model_name: str, redis_client=binary_redis_client, ttl: Optional[int] = settings.EMBEDDING_CACHE_TTL):
+        self.embeddings = embeddings
+        self.model_name = model_name
+        self.redis_client = redis_client
+        self.ttl = ttl
+        self.stats = {"hits": 0, "misses": 0}
+
+    def _make_key(self, text: str) -> str:
+        digest = hashlib.sha256(f"{self.model_name}\0{text}".encode("utf-8")).hexdigest()
+        return f"{self.KEY_PREFIX}:{digest}"
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+
+        keys = [self._make_key(text) for text in texts]
+        try:
+            cached = self.redis_client.mget(keys)
+        except Exception as e:
+            print(f"Embedding cache read failed: {e}")
+            cached = [None] * len(texts)
+
+        vectors: List[Optional[List[float]]] = [
+            np.frombuffer(raw, dtype=np.float32).tolist() if raw else None for raw in cached
+        ]
+        # Duplicate chunks within the batch are embedded once
+        missing = {}
+        for i, vector in enumerate(vectors):
+            if vector is None:
+                missing.setdefault(texts[i], []).append(i)
+
+        self.stats["hits"] += len(texts) - sum(len(positions) for positions in missing.values())
+        self.stats["misses"] += len(missing)
+        if not missing:
+            return vectors
+
+        missing_texts = list(missing)
+        new_vectors = self.embeddings.embed_documents(missing_texts)
+
+        try:
+            with self.redis_client.pipeline(transaction=False) as pipe:
+                for text, vector in zip(missing_texts, new_vectors):
+                    pipe.set(self._make_key(text), np.asarray(vector, dtype=np.float32).tobytes(), ex=self.ttl)
+                pipe.execute()
+        except Exception as e:
+            print(f"Embedding cache write failed: {e}")
+
+        for text, vector in zip(missing_texts, new_vectors):
+            for i in missing[text]:
+                vectors[i] = list(vector)
+        return vectors
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embeddings.embed_query(text)
@@ -0,0 +1,105 @@
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterator, List, Tuple
+from langchain_core.documents import Document
+from app.config.settings import get_settings
+
+
+settings = get_settings()
+
+
+# Backends are module-level functions so they can be pickled into worker processes
+def _count_pages_pypdf(path: str) -> int:
+    from pypdf import PdfReader
+    return len(PdfReader(path).pages)
+
+def _extract_pages_pypdf(path: str, start: int, end: int) -> List[str]:
+    from pypdf import PdfReader
+    reader = PdfReader(path)
+    return [reader.pages[i].extract_text() or "" for i in range(start, end)]
+
+def _count_pages_pypdfium2(path: str) -> int:
+    import pypdfium2 as pdfium
+    pdf = pdfium.PdfDocument(path)
+    try:
+        return len(pdf)
+    finally:
+        pdf.close()
+
+def _extract_pages_pypdfium2(path: str, start: int, end: int) -> List[str]:
+    import pypdfium2 as pdfium
+    pdf = pdfium.PdfDocument(path)
+    try:
+        texts = []
+        for i in range(start, end):
+            page = pdf[i]
+            text_page = page.get_textpage()
+            texts.append(text_page.get_text_range())
+            text_page.close()
+            page.close()
+        return texts
+    finally:
+        pdf.close()
+
+
+PDF_BACKENDS = {
+    "pypdf": (_count_pages_pypdf, _extract_pages_pypdf),
+    "pypdfium2": (_count_pages_pypdfium2, _extract_pages_pypdfium2),
+}
+
+
+class PDFPageExtractor:
+    """Extracts PDF pages as Documents, in order, from a pool of worker processes.
+
+    Files are cut into page ranges and at most 2 * max_workers ranges are in flight,
+    so memory stays bounded however large the PDFs are. max_workers <= 1 extracts
+    inline, which is also what to use where child processes aren't allowed.
+    """
+
+    def __init__(
+        self,
+        backend: str = settings.PDF_EXTRACT_BACKEND,
+        max_workers: int = settings.PDF_EXTRACT_WORKERS,
+        pages_per_task: int = settings.PDF_PAGES_PER_TASK,
+    ):
+        if backend not in PDF_BACKENDS:
+            raise ValueError(f"Unknown PDF backend '{backend}', expected one of {list(PDF_BACKENDS)}")
+        self.backend = backend
+        self.max_workers = max_workers
+        self.pages_per_task = pages_per_task
+
+    def _iter_tasks(self, file_paths: List[Tuple[str, str]]) -> Iterator[Tuple[str, str, int, int]]:
+        count_pages, _ = PDF_BACKENDS[self.backend]
+        for file_path, file_type in file_paths:
+            page_count = count_pages(file_path)
+            for start in range(0, page_count, self.pages_per_task):
+                yield file_path, file_type, start, min(start + self.pages_per_task, page_count)
+
+    @staticmethod
+    def _to_documents(file_path: str, file_type: str, start: int, texts: List[str]) -> Iterator[Document]:
+        for offset, text in enumerate(texts):
+            yield Document(
+                page_content=text,
+                metadata={"source": file_path, "page": start + offset, "file_type": file_type},
+            )
+
+    def iter_pages(self, file_paths: List[Tuple[str, str]]) -> Iterator[Document]:
+        _, extract_pages = PDF_BACKENDS[self.backend]
+        tasks = self._iter_tasks(file_paths)
+
+        if self.max_workers <= 1:
+            for file_path, file_type, start, end in tasks:
+                yield from self._to_documents(file_path, file_type, start, extract_pages(file_path, start, end))
+            return
+
+        with ProcessPoolExecutor(max_workers=self.max_workers) as pool:
+            in_flight = deque()
+            for file_path, file_type, start, end in tasks:
+                in_flight.append((file_path, file_type, start, pool.submit(extract_pages, file_path, start, end)))
+                if len(in_flight) >= self.max_workers * 2:
+                    file_path, file_type, start, future = in_flight.popleft()
+                    yield from self._to_documents(file_path, file_type, start, future.result())
+
+            while in_flight:
+                file_path, file_type, start, future = in_flight.popleft()
+                yield from self._to_documents(file_path, file_type, start, future.result())
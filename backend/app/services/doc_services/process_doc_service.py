@@ -4,6 +4,8 @@ from .file_mngmnt_service import LocalFileManager
 from fastapi import HTTPException
 from typing import List
 from ..user_services.user_db_service import UserDBService
+from .doc_version_service import DocVersionService
+from app.utils.metrics import log_spans, track_stage
 
 
 class ProcessDocumentService:
@@ -14,21 +16,28 @@ class ProcessDocumentService:
         self.vector_store_embed_service = QdrantVectorStoreEmbedService()
         self.file_manager = LocalFileManager()
         self.user_db_service = UserDBService()
+        self.doc_version_service = DocVersionService()
 
     def process_documents_sync(self, temp_paths: List[str], user_id: str, week_start: str) -> dict:
         """Process documents synchronously"""
         try:
             # Upload files to storage
-            public_urls = self.storage_db_service.upload_files(temp_paths, user_id, week_start)
+            with track_stage("ingestion", "storage_upload"):
+                public_urls = self.storage_db_service.upload_files(temp_paths, user_id, week_start)
 
             # Save metadata to database
-            self.storage_db_service.save_document_metadata(temp_paths, user_id, week_start, public_urls)
+            with track_stage("ingestion", "metadata_save"):
+                self.storage_db_service.save_document_metadata(temp_paths, user_id, week_start, public_urls)
 
             # Embed documents
             self.vector_store_embed_service.embed_documents(temp_paths, user_id, week_start)
 
             # Update user weeks in the database
-            self.user_db_service.update_user_weeks(user_id, week_start)
+            with track_stage("ingestion", "user_weeks_update"):
+                self.user_db_service.update_user_weeks(user_id, week_start)
+
+            # Tell every worker that caches built from this user's documents are stale
+            self.doc_version_service.bump_version(user_id)
         except Exception as e:
             print(f"Error processing documents: {e}")
             raise HTTPException(status_code=500, detail=str(e))
@@ -36,6 +45,7 @@ class ProcessDocumentService:
             if temp_paths:
                 # Cleanup temporary files
                 self.file_manager.cleanup_files(temp_paths)
+            log_spans(f"Processed documents of user {user_id} for week {week_start}")
 
     # async def process_documents(self, files: List[UploadFile], user_id: str, file_types: List[str], week_start: str) -> dict:
     #     """Process documents through the entire pipeline"""
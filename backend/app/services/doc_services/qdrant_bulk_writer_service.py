@@ -0,0 +1,92 @@
+import time
+from contextvars import copy_context
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable, List, Tuple
+from langchain_core.documents import Document
+from qdrant_client import QdrantClient
+from qdrant_client.models import PointStruct
+from app.config.settings import get_settings
+from app.utils.metrics import track_stage
+
+
+settings = get_settings()
+
+
+class QdrantBulkWriter:
+    """Embeds and upserts batches of chunks, overlapping embedding with uploads.
+
+    While batch N is embedded on the calling thread, earlier batches upload on a small
+    thread pool (at most `max_in_flight` at once). Uploads use `wait` semantics from the
+    settings; with wait=False the last batch is held back and sent with wait=True once
+    all earlier ones are acknowledged, which acts as the consistency barrier since Qdrant
+    applies a collection's updates in order.
+    Payloads use the same layout as the LangChain Qdrant store so search is unchanged.
+    """
+
+    def __init__(
+        self,
+        client: QdrantClient,
+        collection_name: str,
+        embeddings,
+        max_in_flight: int = settings.QDRANT_UPSERT_MAX_IN_FLIGHT,
+        wait: bool = settings.QDRANT_UPSERT_WAIT,
+    ):
+        self.client = client
+        self.collection_name = collection_name
+        self.embeddings = embeddings
+        self.max_in_flight = max(1, max_in_flight)
+        self.wait = wait
+
+    def _to_points(self, batch: List[Tuple[str, Document]]) -> List[PointStruct]:
+        with track_stage("ingestion", "embed"):
+            vectors = self.embeddings.embed_documents([doc.page_content for _, doc in batch])
+        return [
+            PointStruct(
+                id=point_id,
+                vector=list(vector),
+                payload={"page_content": doc.page_content, "metadata": doc.metadata},
+            )
+            for (point_id, doc), vector in zip(batch, vectors)
+        ]
+
+    def _upsert(self, points: List[PointStruct], wait: bool) -> None:
+        with track_stage("ingestion", "upsert"):
+            self.client.upsert(collection_name=self.collection_name, points=points, wait=wait)
+
+    def write(self, batches: Iterable[List[Tuple[str, Document]]]) -> dict:
+        """Embed and upload (point_id, document) batches; returns point count and throughput"""
+        started_at = time.perf_counter()
+        point_count = 0
+        held_back = None
+
+        with ThreadPoolExecutor(max_workers=self.max_in_flight, thread_name_prefix="qdrant-upsert") as pool:
+            in_flight = deque()
+            for batch in batches:
+                if not batch:
+                    continue
+                points = self._to_points(batch)
+                point_count += len(points)
+
+                if held_back is not None:
+                    if len(in_flight) >= self.max_in_flight:
+                        in_flight.popleft().result()
+                    # Run in a copy of our context so upload time lands in this request's spans
+                    in_flight.append(pool.submit(copy_context().run, self._upsert, held_back, self.wait))
+                held_back = points
+
+            # Every earlier batch must be acknowledged before the final one goes out
+            while in_flight:
+                in_flight.popleft().result()
+
+        if held_back is not None:
+            self._upsert(held_back, True)
+
+        elapsed = time.perf_counter() - started_at
+        stats = {
+            "points": point_count,
+            "seconds": round(elapsed, 3),
+            "points_per_second": round(point_count / elapsed, 1) if elapsed > 0 else None,
+        }
+        print(f"Qdrant bulk write to {self.collection_name}: {stats}")
+        return stats
@@ -1,32 +1,122 @@
-from typing import Tuple, List
-from langchain.document_loaders import PyPDFLoader
+import time
+import uuid
+import hashlib
+from itertools import islice
+from typing import Iterable, Iterator, Tuple, List
+from langchain_core.documents import Document
 from langchain.text_splitter import RecursiveCharacterTextSplitter
-from app.config.qdrant_client import get_user_vector_store
+from qdrant_client.models import Filter, FieldCondition, MatchValue, MatchAny, HasIdCondition, FilterSelector
+from app.config.qdrant_client import get_user_vector_store, get_tenant_id, embeddings, EMBEDDING_MODEL_NAME
+from app.config.settings import get_settings
+from .embedding_cache_service import CachedEmbeddings
+from .pdf_extraction_service import PDFPageExtractor
+from .qdrant_bulk_writer_service import QdrantBulkWriter
+from app.utils.metrics import record_stage, track_stage
 
 
+settings = get_settings()
+
+# Fixed namespace so the same chunk always maps to the same point id
+POINT_ID_NAMESPACE = uuid.UUID("6f1c2a8e-5b0d-4c1e-9a57-3d2f4e8b7c10")
+
+
+def make_point_id(user_id: str, week_start: str, file_type: str, text: str) -> str:
+    chunk_hash = hashlib.sha256(text.encode("utf-8")).hexdigest()
+    return str(uuid.uuid5(POINT_ID_NAMESPACE, f"{user_id}:{week_start}:{file_type}:{chunk_hash}"))
+
+
+def iter_batches(items: Iterable, size: int) -> Iterator[list]:
+    iterator = iter(items)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
 
 class QdrantVectorStoreEmbedService:
-    def __init__(self, chunk_size: int = 1000, chunk_overlap: int = 200):
+    def __init__(self, chunk_size: int = 1000, chunk_overlap: int = 200, batch_size: int = settings.EMBED_BATCH_SIZE):
         self.chunk_size = chunk_size
         self.chunk_overlap = chunk_overlap
+        self.batch_size = batch_size
+        self.pdf_extractor = PDFPageExtractor()
         self.text_splitter = RecursiveCharacterTextSplitter(
             chunk_size=chunk_size, 
             chunk_overlap=chunk_overlap
         )
+        # Weekly re-uploads mostly repeat last week's chunks, only embed what is new
+        self.embeddings = CachedEmbeddings(embeddings, EMBEDDING_MODEL_NAME)
+
+    def _week_filter(self, user_id: str, week_start: str, file_types: List[str]) -> Filter:
+        conditions = [
+            FieldCondition(key="metadata.week_start", match=MatchValue(value=week_start)),
+            FieldCondition(key="metadata.file_type", match=MatchAny(any=file_types)),
+        ]
+        tenant_id = get_tenant_id(user_id)
+        if tenant_id:
+            conditions.append(FieldCondition(key="metadata.user_id", match=MatchValue(value=tenant_id)))
+        return Filter(must=conditions)
     
+    def _iter_chunks(self, file_paths: List[Tuple[str, str]], user_id: str, week_start: str) -> Iterator[Document]:
+        """Pages stream out of the extractor and are split one at a time, never all held at once"""
+        # Extraction and splitting interleave with embedding, so their time is summed per stage
+        extract_seconds = split_seconds = 0.0
+        pages = self.pdf_extractor.iter_pages(file_paths)
+        try:
+            while True:
+                started_at = time.perf_counter()
+                page = next(pages, None)
+                extract_seconds += time.perf_counter() - started_at
+                if page is None:
+                    break
+
+                page.metadata['week_start'] = week_start
+                # Tenant key in the shared collection, harmless in per-user collections
+                page.metadata['user_id'] = user_id
+                started_at = time.perf_counter()
+                chunks = self.text_splitter.split_documents([page])
+                split_seconds += time.perf_counter() - started_at
+                yield from chunks
+        finally:
+            record_stage("ingestion", "extract", extract_seconds)
+            record_stage("ingestion", "split", split_seconds)
+
+    def _iter_new_chunks(self, client, collection_name: str, file_paths: List[Tuple[str, str]], user_id: str, week_start: str, stats: dict) -> Iterator[List[Tuple[str, Document]]]:
+        """Batches of (point_id, chunk) that Qdrant doesn't have yet; every id seen is added to stats['seen_ids']"""
+        seen_ids = stats["seen_ids"]
+        for batch in iter_batches(self._iter_chunks(file_paths, user_id, week_start), self.batch_size):
+            # Identical chunks of the same week and file collapse into one point
+            chunks = {}
+            for doc in batch:
+                point_id = make_point_id(user_id, week_start, doc.metadata["file_type"], doc.page_content)
+                if point_id not in seen_ids:
+                    seen_ids.add(point_id)
+                    chunks[point_id] = doc
+            if not chunks:
+                continue
+
+            # Re-upload of a week: only chunks Qdrant doesn't have yet are embedded and written
+            existing = client.retrieve(collection_name, ids=list(chunks), with_payload=False, with_vectors=False)
+            existing_ids = {str(point.id) for point in existing}
+            stats["unchanged"] += len(existing_ids)
+
+            new_chunks = [(point_id, doc) for point_id, doc in chunks.items() if point_id not in existing_ids]
+            if new_chunks:
+                yield new_chunks
+
     def embed_documents(self, file_paths: List[Tuple[str, str]], user_id: str, week_start: str) -> None:
-        documents = []
-        
-        for file_path, file_type in file_paths:
-            loader = PyPDFLoader(file_path)
-            docs = loader.load()
-            
-            for doc in docs:
-                doc.metadata['file_type'] = file_type
-                doc.metadata['week_start'] = week_start
-                
-            documents.extend(docs)
-
-        split_docs = self.text_splitter.split_documents(documents)
-        vectorstore = get_user_vector_store(user_id)
-        vectorstore.add_documents(split_docs)
\ No newline at end of file
+        vectorstore = get_user_vector_store(user_id, ensure=True, embedding_model=self.embeddings)
+        client, collection_name = vectorstore.client, vectorstore.collection_name
+
+        # Only ids are kept for the whole upload; documents live for one batch
+        stats = {"seen_ids": set(), "unchanged": 0}
+        writer = QdrantBulkWriter(client, collection_name, self.embeddings)
+        write_stats = writer.write(self._iter_new_chunks(client, collection_name, file_paths, user_id, week_start, stats))
+        seen_ids = stats["seen_ids"]
+
+        # One filtered delete drops whatever this week's files no longer contain,
+        # including points written with random ids before ids were deterministic
+        stale_filter = self._week_filter(user_id, week_start, [file_type for _, file_type in file_paths])
+        if seen_ids:
+            stale_filter.must_not = [HasIdCondition(has_id=list(seen_ids))]
+        with track_stage("ingestion", "stale_delete"):
+            client.delete(collection_name, points_selector=FilterSelector(filter=stale_filter), wait=True)
+
+        print(f"Embedded week {week_start} for user {user_id}: {write_stats['points']} new, {stats['unchanged']} unchanged chunks")
@@ -0,0 +1,273 @@
+import asyncio
+import math
+import time
+import uuid
+from collections import OrderedDict, deque
+from typing import AsyncGenerator, Deque, Dict, Optional
+from app.config.redis_client import async_redis_client
+from app.config.settings import get_settings
+from app.utils.exception import AdmissionRejectedException
+from app.utils.metrics import ADMISSION_QUEUE_SECONDS, ADMISSION_REJECTED
+
+
+settings = get_settings()
+
+# Drop expired leases, then take a slot if one is free. KEYS[1]: lease zset, ARGV: now, expiry, limit, lease id
+ACQUIRE_SCRIPT = """
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', ARGV[1])
+if redis.call('ZCARD', KEYS[1]) < tonumber(ARGV[3]) then
+    redis.call('ZADD', KEYS[1], ARGV[2], ARGV[4])
+    return 1
+end
+return 0
+"""
+
+
+class StreamLease:
+    """One admitted stream; release() is idempotent so every exit path can call it"""
+
+    def __init__(self, controller: "AdmissionController", lease_id: str, user_id: str, queued_ms: float):
+        self.controller = controller
+        self.lease_id = lease_id
+        self.user_id = user_id
+        self.queued_ms = queued_ms
+        self.started_at = time.monotonic()
+        self.released = False
+
+    async def release(self) -> None:
+        if self.released:
+            return
+        self.released = True
+        await self.controller._release(self)
+
+
+class AdmissionController:
+    """Caps concurrent RAG streams across all API workers.
+
+    Active streams hold leases in a Redis sorted set scored by expiry, so a crashed worker's
+    slots free themselves; leases are refreshed while their stream runs. Requests that find
+    no free slot wait in per-user queues served round-robin, so one user's burst can't starve
+    others. A request is rejected with a Retry-After hint when the queue is full, the user
+    already has too many waiting, or no slot frees up within `max_wait` seconds.
+    """
+
+    LEASES_KEY = "rag:streams:leases"
+
+    def __init__(
+        self,
+        redis_client=async_redis_client,
+        max_streams: int = settings.RAG_MAX_CONCURRENT_STREAMS,
+        max_queue: int = settings.RAG_ADMISSION_MAX_QUEUE,
+        max_queue_per_user: int = settings.RAG_ADMISSION_MAX_QUEUE_PER_USER,
+        max_wait: float = settings.RAG_ADMISSION_MAX_WAIT_SECONDS,
+        lease_ttl: float = settings.RAG_ADMISSION_LEASE_SECONDS,
+        poll_interval: float = 0.1,
+    ):
+        self.redis_client = redis_client
+        self.max_streams = max_streams
+        self.max_queue = max_queue
+        self.max_queue_per_user = max_queue_per_user
+        self.max_wait = max_wait
+        self.lease_ttl = lease_ttl
+        self.poll_interval = poll_interval
+        self._acquire_script = redis_client.register_script(ACQUIRE_SCRIPT)
+        self._queues: "OrderedDict[str, Deque[asyncio.Future]]" = OrderedDict()
+        self._leases: Dict[str, StreamLease] = {}
+        self._local_active = 0
+        self._wakeup: Optional[asyncio.Event] = None
+        self._dispatcher: Optional[asyncio.Task] = None
+        self._last_refresh = 0.0
+        # Recent stream duration, used to estimate Retry-After
+        self._avg_stream_seconds = 10.0
+        self.stats = {
+            "admitted": 0,
+            "queued": 0,
+            "rejected_queue_full": 0,
+            "rejected_timeout": 0,
+            "last_queue_ms": 0.0,
+            "max_queue_ms": 0.0,
+            "total_queue_ms": 0.0,
+        }
+
+    @property
+    def queue_depth(self) -> int:
+        return sum(len(queue) for queue in self._queues.values())
+
+    def _retry_after(self) -> int:
+        waves = (self.queue_depth + 1) / max(self.max_streams, 1)
+        return max(1, math.ceil(waves * self._avg_stream_seconds))
+
+    async def _try_acquire(self, lease_id: str) -> bool:
+        now = time.time()
+        try:
+            acquired = await self._acquire_script(
+                keys=[self.LEASES_KEY], args=[now, now + self.lease_ttl, self.max_streams, lease_id]
+            )
+            return bool(acquired)
+        except Exception as e:
+            print(f"Shared stream admission unavailable, limiting this worker only: {e}")
+            return self._local_active < self.max_streams
+
+    def _admit(self, lease_id: str, user_id: str, queued_ms: float) -> StreamLease:
+        lease = StreamLease(self, lease_id, user_id, queued_ms)
+        self._leases[lease_id] = lease
+        self._local_active += 1
+        self.stats["admitted"] += 1
+        return lease
+
+    async def acquire(self, user_id: str) -> StreamLease:
+        """Wait for a stream slot; raises AdmissionRejectedException when none can be had"""
+        started_at = time.monotonic()
+        lease_id = str(uuid.uuid4())
+        # Nobody is waiting: take a free slot straight away rather than queueing behind no one
+        if not self._queues and await self._try_acquire(lease_id):
+            ADMISSION_QUEUE_SECONDS.observe(0)
+            return self._admit(lease_id, user_id, 0.0)
+
+        user_queue = self._queues.get(user_id)
+        if self.queue_depth >= self.max_queue or (user_queue and len(user_queue) >= self.max_queue_per_user):
+            self.stats["rejected_queue_full"] += 1
+            ADMISSION_REJECTED.labels("queue_full").inc()
+            raise AdmissionRejectedException("Too many questions in flight, try again shortly", self._retry_after())
+
+        future = asyncio.get_running_loop().create_future()
+        self._queues.setdefault(user_id, deque()).append(future)
+        self.stats["queued"] += 1
+        self._ensure_dispatcher()
+
+        try:
+            lease_id = await asyncio.wait_for(asyncio.shield(future), self.max_wait)
+        except asyncio.TimeoutError:
+            if future.done() and not future.cancelled():
+                # Admitted just as the wait ran out, keep the slot
+                lease_id = future.result()
+            else:
+                future.cancel()
+                self._discard(user_id, future)
+                self.stats["rejected_timeout"] += 1
+                ADMISSION_REJECTED.labels("timeout").inc()
+                raise AdmissionRejectedException("Timed out waiting for a free stream slot", self._retry_after())
+        except asyncio.CancelledError:
+            # Client went away while queued, give back a slot granted in the meantime
+            if future.done() and not future.cancelled():
+                await self._release_id(future.result())
+            else:
+                future.cancel()
+                self._discard(user_id, future)
+            raise
+
+        queued_ms = (time.monotonic() - started_at) * 1000
+        self.stats["last_queue_ms"] = queued_ms
+        self.stats["max_queue_ms"] = max(self.stats["max_queue_ms"], queued_ms)
+        self.stats["total_queue_ms"] += queued_ms
+        ADMISSION_QUEUE_SECONDS.observe(queued_ms / 1000)
+        return self._admit(lease_id, user_id, queued_ms)
+
+    def _discard(self, user_id: str, future: asyncio.Future) -> None:
+        queue = self._queues.get(user_id)
+        if queue is None:
+            return
+        try:
+            queue.remove(future)
+        except ValueError:
+            pass
+        if not queue:
+            self._queues.pop(user_id, None)
+
+    def _ensure_dispatcher(self) -> None:
+        if self._wakeup is None:
+            self._wakeup = asyncio.Event()
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = asyncio.get_running_loop().create_task(self._dispatch())
+
+    async def _dispatch(self) -> None:
+        """Hand free slots to queued requests, one user at a time"""
+        while self._queues:
+            user_id, queue = next(iter(self._queues.items()))
+            future = queue[0]
+            if future.done():
+                self._discard(user_id, future)
+                continue
+
+            lease_id = str(uuid.uuid4())
+            if await self._try_acquire(lease_id):
+                queue.popleft()
+                # Rotate the user to the back so the next slot goes to someone else
+                self._queues.pop(user_id)
+                if queue:
+                    self._queues[user_id] = queue
+                if future.done():
+                    await self._release_id(lease_id)
+                else:
+                    future.set_result(lease_id)
+                continue
+
+            # Full: wait for a local release, or poll for slots freed by other workers
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _release_id(self, lease_id: str) -> None:
+        try:
+            await self.redis_client.zrem(self.LEASES_KEY, lease_id)
+        except Exception as e:
+            print(f"Releasing stream lease failed, it expires on its own: {e}")
+
+    async def _release(self, lease: StreamLease) -> None:
+        self._leases.pop(lease.lease_id, None)
+        self._local_active -= 1
+        duration = time.monotonic() - lease.started_at
+        self._avg_stream_seconds = 0.9 * self._avg_stream_seconds + 0.1 * duration
+        await self._release_id(lease.lease_id)
+        if self._wakeup is not None:
+            self._wakeup.set()
+        await self._refresh_leases()
+
+    async def _refresh_leases(self) -> None:
+        """Push back the expiry of this worker's live leases so long streams keep their slot"""
+        now = time.time()
+        if not self._leases or now - self._last_refresh < self.lease_ttl / 3:
+            return
+        self._last_refresh = now
+        try:
+            await self.redis_client.zadd(
+                self.LEASES_KEY, {lease_id: now + self.lease_ttl for lease_id in self._leases}, xx=True
+            )
+        except Exception as e:
+            print(f"Refreshing stream leases failed: {e}")
+
+    async def guard(self, lease: StreamLease, stream: AsyncGenerator[str, None]) -> AsyncGenerator[str, None]:
+        """Yield from a stream and release its lease however it ends"""
+        try:
+            async for chunk in stream:
+                await self._refresh_leases()
+                yield chunk
+        finally:
+            await lease.release()
+
+    async def get_metrics(self) -> dict:
+        try:
+            active_global = await self.redis_client.zcount(self.LEASES_KEY, time.time(), "+inf")
+        except Exception:
+            active_global = None
+        admitted = self.stats["admitted"]
+        return {
+            **self.stats,
+            "avg_queue_ms": self.stats["total_queue_ms"] / admitted if admitted else 0.0,
+            "active_local": self._local_active,
+            "active_global": active_global,
+            "max_streams": self.max_streams,
+            "queue_depth": self.queue_depth,
+            "queued_users": len(self._queues),
+        }
+
+
+admission_controller_instance = None
+
+def get_admission_controller() -> AdmissionController:
+    global admission_controller_instance
+    if admission_controller_instance is None:
+        admission_controller_instance = AdmissionController()
+    return admission_controller_instance
@@ -0,0 +1,133 @@
+import base64
+import hashlib
+import json
+from typing import List, Optional, Tuple
+import numpy as np
+from app.config.redis_client import redis_client
+from app.config.settings import get_settings
+from app.services.doc_services.doc_version_service import DocVersionService
+from app.utils.metrics import track_stage
+from .question_classifier_service import CachedQuestionClassifier
+from .query_embedding_service import QueryEmbedder, get_query_embedder
+
+
+settings = get_settings()
+
+
+class AnswerCache:
+    """Caches generated answers per user, week selection and document version.
+
+    Each scope is one Redis hash keyed by the normalized question. A lookup tries the exact
+    question first, then compares the question's embedding with every cached question in the
+    scope and takes the closest one above `similarity_threshold`. The user's document version
+    is part of the key, so finishing an upload retires every answer built on the old documents;
+    they expire with the hash. Answers depend on the chat history in the prompt, which isn't
+    part of the key, so callers only use the cache for a chat's first question.
+    """
+
+    KEY_PREFIX = "rag:answers"
+
+    def __init__(
+        self,
+        redis_client=redis_client,
+        query_embedder: Optional[QueryEmbedder] = None,
+        doc_version_service: Optional[DocVersionService] = None,
+        similarity_threshold: float = settings.RAG_ANSWER_CACHE_SIMILARITY,
+        ttl: int = settings.RAG_ANSWER_CACHE_TTL,
+        max_entries: int = settings.RAG_ANSWER_CACHE_MAX_ENTRIES,
+    ):
+        self.redis_client = redis_client
+        self._query_embedder = query_embedder
+        self.doc_version_service = doc_version_service or DocVersionService()
+        self.similarity_threshold = similarity_threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.stats = {"exact_hits": 0, "semantic_hits": 0, "misses": 0, "stored": 0}
+
+    @property
+    def query_embedder(self) -> QueryEmbedder:
+        # Resolved on first use, so building the cache doesn't load the embedding model
+        if self._query_embedder is None:
+            self._query_embedder = get_query_embedder()
+        return self._query_embedder
+
+    def _make_key(self, user_id: str, week_start: List[str], version: int) -> str:
+        weeks = ",".join(sorted(set(week_start or [])))
+        digest = hashlib.sha256(weeks.encode("utf-8")).hexdigest()[:16]
+        return f"{self.KEY_PREFIX}:{user_id}:{version}:{digest}"
+
+    @staticmethod
+    def _make_field(question: str) -> str:
+        return hashlib.sha256(CachedQuestionClassifier.normalize(question).encode("utf-8")).hexdigest()
+
+    def _embed(self, question: str) -> np.ndarray:
+        # Shares the embedder's cache, so a miss doesn't embed the question again for retrieval
+        vector = np.asarray(self.query_embedder.embed(question), dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def lookup(self, user_id: str, week_start: List[str], question: str) -> Tuple[Optional[str], int]:
+        """Cached answer or None, and the document version the answer must belong to"""
+        version = self.doc_version_service.get_version(user_id)
+        if version < 0:
+            # Can't tell whether cached answers are current
+            return None, version
+
+        with track_stage("rag", "answer_cache"):
+            key = self._make_key(user_id, week_start, version)
+            try:
+                raw = self.redis_client.hget(key, self._make_field(question))
+                if raw:
+                    self.stats["exact_hits"] += 1
+                    return json.loads(raw)["answer"], version
+
+                if self.similarity_threshold < 1:
+                    entries = [json.loads(entry) for entry in self.redis_client.hvals(key)]
+                    if entries:
+                        vectors = np.stack([
+                            np.frombuffer(base64.b64decode(entry["embedding"]), dtype=np.float32) for entry in entries
+                        ])
+                        scores = vectors @ self._embed(question)
+                        best = int(np.argmax(scores))
+                        if scores[best] >= self.similarity_threshold:
+                            self.stats["semantic_hits"] += 1
+                            return entries[best]["answer"], version
+            except Exception as e:
+                print(f"Answer cache lookup failed: {e}")
+                return None, version
+
+        self.stats["misses"] += 1
+        return None, version
+
+    def store(self, user_id: str, week_start: List[str], question: str, answer: str, version: int) -> None:
+        """Remember an answer under the document version it was generated from"""
+        if version < 0 or not answer:
+            return
+        key = self._make_key(user_id, week_start, version)
+        entry = {
+            "question": question,
+            "answer": answer,
+            "embedding": base64.b64encode(self._embed(question).tobytes()).decode("ascii"),
+        }
+        try:
+            if self.redis_client.hlen(key) >= self.max_entries:
+                # Full: make room by dropping an arbitrary entry
+                victims = self.redis_client.hrandfield(key, 1)
+                if victims:
+                    self.redis_client.hdel(key, *victims)
+            pipe = self.redis_client.pipeline()
+            pipe.hset(key, self._make_field(question), json.dumps(entry))
+            pipe.expire(key, self.ttl)
+            pipe.execute()
+            self.stats["stored"] += 1
+        except Exception as e:
+            print(f"Answer cache write failed: {e}")
+
+
+answer_cache_instance = None
+
+def get_answer_cache() -> AnswerCache:
+    global answer_cache_instance
+    if answer_cache_instance is None:
+        answer_cache_instance = AnswerCache()
+    return answer_cache_instance
@@ -0,0 +1,141 @@
+import re
+from typing import Dict, List, Optional, Tuple
+from langchain_core.documents import Document
+from app.config.settings import get_settings
+from app.utils.qa_utils import canonical_file_type, normalize_classification
+
+
+settings = get_settings()
+
+NO_CONTEXT_MESSAGE = "No relevant documents found in your personal knowledge base."
+
+
+def estimate_tokens(text: str) -> int:
+    # ~4 characters per token for English text, close enough for budgeting without a tokenizer
+    return (len(text) + 3) // 4
+
+
+def find_overlap(first: str, second: str, min_overlap: int, max_overlap: int) -> int:
+    """Length of the longest suffix of `first` that is also a prefix of `second`, 0 if shorter than min_overlap"""
+    longest = min(len(first), len(second), max_overlap)
+    for size in range(longest, min_overlap - 1, -1):
+        if first.endswith(second[:size]):
+            return size
+    return 0
+
+
+def merge_chunks(text: str, chunk: str, min_overlap: int, max_overlap: int) -> Optional[str]:
+    """`text` extended by an overlapping or contained `chunk`, or None if the two don't overlap"""
+    if chunk in text:
+        return text
+    if text in chunk:
+        return chunk
+    overlap = find_overlap(text, chunk, min_overlap, max_overlap)
+    if overlap:
+        return text + chunk[overlap:]
+    overlap = find_overlap(chunk, text, min_overlap, max_overlap)
+    if overlap:
+        return chunk[:-overlap] + text
+    return None
+
+
+class ContextBuilder:
+    """Turns over-fetched chunks into the shortest context that still covers the question.
+
+    Retrieval asks for `fetch_k_per_category` chunks per predicted category. Candidates are
+    optionally reordered with MMR, then packed in order: a chunk overlapping one already
+    packed from the same page only adds its new text, and each file_type stops taking
+    chunks once its token budget is spent. MMR measures redundancy by word overlap, which
+    catches the text shared by neighbouring chunks without needing their vectors.
+    """
+
+    def __init__(
+        self,
+        fetch_k_per_category: int = settings.RAG_CONTEXT_FETCH_K_PER_CATEGORY,
+        default_budget: int = settings.RAG_CONTEXT_TOKENS_PER_CATEGORY,
+        category_budgets: Optional[Dict[str, int]] = None,
+        max_tokens: int = settings.RAG_CONTEXT_MAX_TOKENS,
+        use_mmr: bool = settings.RAG_CONTEXT_MMR,
+        mmr_lambda: float = settings.RAG_CONTEXT_MMR_LAMBDA,
+        min_overlap: int = 30,
+        max_overlap: int = 500,
+    ):
+        self.fetch_k_per_category = fetch_k_per_category
+        self.default_budget = default_budget
+        category_budgets = category_budgets if category_budgets is not None else settings.RAG_CONTEXT_CATEGORY_BUDGETS
+        self.category_budgets = {canonical_file_type(name): budget for name, budget in category_budgets.items()}
+        self.max_tokens = max_tokens
+        self.use_mmr = use_mmr
+        self.mmr_lambda = mmr_lambda
+        self.min_overlap = min_overlap
+        self.max_overlap = max_overlap
+
+    def fetch_k(self, classification) -> int:
+        return self.fetch_k_per_category * len(normalize_classification(classification))
+
+    def budget_for(self, file_type: str) -> int:
+        return self.category_budgets.get(canonical_file_type(file_type), self.default_budget)
+
+    @staticmethod
+    def _words(text: str) -> set:
+        return set(re.findall(r"\w+", text.lower()))
+
+    def _mmr(self, docs: List[Document]) -> List[Document]:
+        """Reorder by relevance (retrieval rank) traded against similarity to chunks already picked"""
+        words = [self._words(doc.page_content) for doc in docs]
+        relevance = [1 - i / len(docs) for i in range(len(docs))]
+        remaining = list(range(len(docs)))
+        picked: List[int] = []
+        while remaining:
+            def score(i: int) -> float:
+                redundancy = max(
+                    (len(words[i] & words[j]) / (len(words[i] | words[j]) or 1) for j in picked),
+                    default=0.0,
+                )
+                return self.mmr_lambda * relevance[i] - (1 - self.mmr_lambda) * redundancy
+            best = max(remaining, key=score)
+            picked.append(best)
+            remaining.remove(best)
+        return [docs[i] for i in picked]
+
+    def build(self, docs: List[Document]) -> Tuple[str, int]:
+        """Context string and the number of chunks it draws on"""
+        if not docs:
+            return NO_CONTEXT_MESSAGE, 0
+        if self.use_mmr and len(docs) > 2:
+            docs = self._mmr(docs)
+
+        # Contiguous text per page: [(source, page, file_type), text]
+        blocks: List[list] = []
+        spent: Dict[str, int] = {}
+        total = 0
+        used = 0
+        for doc in docs:
+            file_type = canonical_file_type(doc.metadata.get("file_type", "unknown"))
+            key = (doc.metadata.get("source"), doc.metadata.get("page"), file_type)
+
+            # A chunk overlapping one already packed from the same page only costs the text it adds
+            block, text = None, doc.page_content
+            for candidate in blocks:
+                if candidate[0] == key:
+                    merged = merge_chunks(candidate[1], doc.page_content, self.min_overlap, self.max_overlap)
+                    if merged is not None:
+                        block, text = candidate, merged
+                        break
+            cost = estimate_tokens(text) - (estimate_tokens(block[1]) if block else 0)
+
+            over_budget = spent.get(file_type, 0) + cost > self.budget_for(file_type) or total + cost > self.max_tokens
+            # The top chunk is always kept, so a small budget never leaves the context empty
+            if over_budget and blocks:
+                continue
+
+            if block:
+                block[1] = text
+            else:
+                blocks.append([key, text])
+            spent[file_type] = spent.get(file_type, 0) + cost
+            total += cost
+            used += 1
+
+        context = "\n\n".join(f"[File Type: {key[2]}]:\n{text}" for key, text in blocks)
+        return context, used
@@ -0,0 +1,146 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import List, Optional, Tuple
+from app.config.qdrant_client import embeddings
+from app.config.settings import get_settings
+
+
+settings = get_settings()
+
+
+class EmbeddingBatcher:
+    """Collects concurrent query embeddings into batched forward passes.
+
+    Callers put their text on an asyncio queue and await a future. A worker task on the
+    server's event loop takes up to `max_batch_size` texts, waiting at most `max_wait_ms`
+    after the first one for more to arrive, and embeds them in one call on a dedicated
+    thread so the loop never runs the model. Sync code running in worker threads (the
+    retrieval runnables) goes through embed(), which hands the text to the loop and embeds
+    it directly if no result comes back within `result_timeout`; on the loop's own thread
+    embed() raises, async code awaits aembed(). Without a started batcher, e.g. in Celery,
+    texts are embedded directly. stop() fails every waiting caller.
+    """
+
+    def __init__(
+        self,
+        embeddings,
+        max_batch_size: int = settings.EMBED_QUERY_BATCH_SIZE,
+        max_wait_ms: float = settings.EMBED_QUERY_BATCH_WAIT_MS,
+        result_timeout: float = settings.EMBED_QUERY_BATCH_TIMEOUT,
+    ):
+        self.embeddings = embeddings
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.result_timeout = result_timeout
+        # One thread: batches run back to back, never competing for the CPU
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="query-embed")
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        # Batch being embedded right now, failed by stop() if the worker is cancelled mid-batch
+        self._current: List[Tuple[str, asyncio.Future]] = []
+        self.stats = {"batches": 0, "texts": 0, "max_batch": 0, "direct_fallbacks": 0}
+
+    def start(self) -> None:
+        """Start the worker on the running loop, called from app startup"""
+        if self._worker is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue()
+        self._worker = self._loop.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._worker is None:
+            return
+        worker, self._worker = self._worker, None
+        worker.cancel()
+        try:
+            await worker
+        except asyncio.CancelledError:
+            pass
+
+        # Nobody will answer these any more; embed() callers fall back to embedding directly
+        error = RuntimeError("Embedding batcher stopped")
+        pending = list(self._current)
+        while not self._queue.empty():
+            pending.append(self._queue.get_nowait())
+        for _, future in pending:
+            if not future.done():
+                future.set_exception(error)
+        self._current = []
+        self._loop = None
+
+    async def _collect(self) -> List[Tuple[str, asyncio.Future]]:
+        batch = [await self._queue.get()]
+        deadline = self._loop.time() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - self._loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self) -> None:
+        while True:
+            batch = await self._collect()
+            self._current = batch
+            texts = [text for text, _ in batch]
+            try:
+                vectors = await self._loop.run_in_executor(self.executor, self.embeddings.embed_documents, texts)
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            self.stats["batches"] += 1
+            self.stats["texts"] += len(texts)
+            self.stats["max_batch"] = max(self.stats["max_batch"], len(texts))
+            for (_, future), vector in zip(batch, vectors):
+                if not future.done():
+                    future.set_result(list(vector))
+            self._current = []
+
+    async def aembed(self, text: str) -> List[float]:
+        if self._worker is None or asyncio.get_running_loop() is not self._loop:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, self.embeddings.embed_query, text)
+        future = self._loop.create_future()
+        await self._queue.put((text, future))
+        return await future
+
+    def embed(self, text: str) -> List[float]:
+        loop = self._loop
+        if loop is not None and self._on_loop_thread(loop):
+            # Waiting here would deadlock, and embedding inline would stall every request on the loop
+            raise RuntimeError("EmbeddingBatcher.embed() called on the event loop thread, await aembed() instead")
+        if self._worker is None or loop is None or not loop.is_running():
+            return self.embeddings.embed_query(text)
+        future = asyncio.run_coroutine_threadsafe(self.aembed(text), loop)
+        try:
+            return future.result(timeout=self.result_timeout)
+        except Exception as e:
+            # Stopped, stuck or dead loop: don't leave the request hanging on it
+            future.cancel()
+            self.stats["direct_fallbacks"] += 1
+            reason = "timed out" if isinstance(e, FutureTimeoutError) else str(e)
+            print(f"Batched query embedding failed ({reason}), embedding directly")
+            return self.embeddings.embed_query(text)
+
+    @staticmethod
+    def _on_loop_thread(loop: asyncio.AbstractEventLoop) -> bool:
+        try:
+            return asyncio.get_running_loop() is loop
+        except RuntimeError:
+            return False
+
+
+embedding_batcher_instance = None
+
+def get_embedding_batcher() -> EmbeddingBatcher:
+    global embedding_batcher_instance
+    if embedding_batcher_instance is None:
+        embedding_batcher_instance = EmbeddingBatcher(embeddings)
+    return embedding_batcher_instance
@@ -0,0 +1,157 @@
+import time
+from typing import List, Optional
+import numpy as np
+from langchain_core.documents import Document
+from qdrant_client import QdrantClient
+from app.config.qdrant_client import qdrant_client
+from app.config.settings import get_settings
+from app.services.doc_services.doc_version_service import DocVersionService
+from app.utils.lru_cache import LRUCache
+from app.utils.qa_utils import create_tenant_filter, normalize_week_start, stored_file_types
+
+
+settings = get_settings()
+
+
+class UserVectorSnapshot:
+    """One user's points held in memory: a normalized float32 matrix plus payload columns"""
+
+    def __init__(self, version: int, vectors: Optional[np.ndarray] = None, payloads: Optional[List[dict]] = None, too_large: bool = False):
+        self.version = version
+        self.checked_at = time.monotonic()
+        self.too_large = too_large
+        self.payloads = payloads or []
+        self.matrix = vectors if vectors is not None else np.zeros((0, 0), dtype=np.float32)
+        metadata = [payload.get("metadata") or {} for payload in self.payloads]
+        self.file_types = np.array([m.get("file_type") for m in metadata], dtype=object)
+        self.week_starts = np.array([m.get("week_start") for m in metadata], dtype=object)
+
+
+class LocalVectorIndex:
+    """Exact cosine search over small per-user corpora kept in memory.
+
+    A user's points are loaded with scroll on first use and kept in a bounded LRU.
+    Snapshots are dropped when the user's document version (bumped after every upload)
+    changes, which is checked at most every `version_check_interval` seconds. Users with
+    more than `max_points` points are remembered as too large and left to Qdrant.
+    """
+
+    def __init__(
+        self,
+        client: QdrantClient,
+        max_users: int = settings.RAG_LOCAL_SEARCH_MAX_USERS,
+        max_points: int = settings.RAG_LOCAL_SEARCH_MAX_POINTS,
+        version_check_interval: float = settings.RAG_LOCAL_SEARCH_VERSION_CHECK_SECONDS,
+        doc_version_service: Optional[DocVersionService] = None,
+    ):
+        self.client = client
+        self.max_points = max_points
+        self.version_check_interval = version_check_interval
+        self.doc_version_service = doc_version_service or DocVersionService()
+        self.snapshots = LRUCache(max_size=max_users)
+        self.stats = {"local_searches": 0, "loads": 0, "qdrant_fallbacks": 0}
+
+    def _load(self, user_id: str, collection_name: str, tenant_id: Optional[str], version: int) -> UserVectorSnapshot:
+        tenant_filter = create_tenant_filter(tenant_id) if tenant_id else None
+        point_count = self.client.count(collection_name, count_filter=tenant_filter, exact=True).count
+        if point_count > self.max_points:
+            return UserVectorSnapshot(version, too_large=True)
+
+        vectors, payloads = [], []
+        offset = None
+        while True:
+            points, offset = self.client.scroll(
+                collection_name=collection_name,
+                scroll_filter=tenant_filter,
+                limit=256,
+                offset=offset,
+                with_payload=True,
+                with_vectors=True,
+            )
+            for point in points:
+                vectors.append(point.vector)
+                payloads.append(point.payload or {})
+            if offset is None:
+                break
+
+        matrix = np.asarray(vectors, dtype=np.float32).reshape(len(vectors), -1)
+        if len(matrix):
+            matrix /= np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+        self.stats["loads"] += 1
+        return UserVectorSnapshot(version, matrix, payloads)
+
+    def _get_snapshot(self, user_id: str, collection_name: str, tenant_id: Optional[str]) -> UserVectorSnapshot:
+        snapshot = self.snapshots.get(user_id)
+        if snapshot is not None and time.monotonic() - snapshot.checked_at < self.version_check_interval:
+            return snapshot
+
+        version = self.doc_version_service.get_version(user_id)
+        if snapshot is not None and version >= 0 and snapshot.version == version:
+            snapshot.checked_at = time.monotonic()
+            return snapshot
+
+        snapshot = self._load(user_id, collection_name, tenant_id, version)
+        self.snapshots.set(user_id, snapshot)
+        return snapshot
+
+    def covers(self, user_id: str, collection_name: str, tenant_id: Optional[str]) -> bool:
+        """Whether searches for this user are served from memory; loads the snapshot if needed"""
+        return not self._get_snapshot(user_id, collection_name, tenant_id).too_large
+
+    def search(
+        self,
+        user_id: str,
+        collection_name: str,
+        tenant_id: Optional[str],
+        query_vector: List[float],
+        k: int,
+        classification: Optional[List[str]] = None,
+        week_start: Optional[List[str]] = None,
+    ) -> Optional[List[Document]]:
+        """Top-k documents by cosine similarity, or None when the user should be searched in Qdrant.
+
+        With `classification` the same file_type/week_start rules as create_search_filter apply;
+        without it every point of the user is a candidate, matching the unfiltered fallback.
+        """
+        snapshot = self._get_snapshot(user_id, collection_name, tenant_id)
+        if snapshot.too_large:
+            self.stats["qdrant_fallbacks"] += 1
+            return None
+
+        self.stats["local_searches"] += 1
+        if not snapshot.payloads:
+            return []
+
+        mask = np.ones(len(snapshot.payloads), dtype=bool)
+        if classification is not None:
+            mask &= np.isin(snapshot.file_types, stored_file_types(classification))
+            week_starts = normalize_week_start(week_start)
+            if week_starts:
+                mask &= np.isin(snapshot.week_starts, week_starts)
+
+        candidates = np.flatnonzero(mask)
+        if not len(candidates):
+            return []
+
+        query = np.asarray(query_vector, dtype=np.float32)
+        query /= max(float(np.linalg.norm(query)), 1e-12)
+        scores = snapshot.matrix[candidates] @ query
+
+        top_count = min(k, len(candidates))
+        top = np.argpartition(-scores, top_count - 1)[:top_count]
+        top = top[np.argsort(-scores[top])]
+
+        documents = []
+        for i in candidates[top]:
+            payload = snapshot.payloads[i]
+            documents.append(Document(page_content=payload.get("page_content", ""), metadata=payload.get("metadata") or {}))
+        return documents
+
+
+local_vector_index_instance = None
+
+def get_local_vector_index() -> LocalVectorIndex:
+    global local_vector_index_instance
+    if local_vector_index_instance is None:
+        local_vector_index_instance = LocalVectorIndex(qdrant_client)
+    return local_vector_index_instance
@@ -0,0 +1,18 @@
+from app.config.settings import get_settings
+from app.utils.lru_cache import LRUCache
+
+
+settings = get_settings()
+
+# user_id -> (document version, built RAG chain); the chain holds the user's vector store handle.
+# An entry is only used while the user's document version is unchanged, see RAGService._get_chain.
+pipeline_cache_instance = None
+
+def get_pipeline_cache() -> LRUCache:
+    global pipeline_cache_instance
+    if pipeline_cache_instance is None:
+        pipeline_cache_instance = LRUCache(
+            max_size=settings.RAG_PIPELINE_CACHE_SIZE,
+            idle_ttl=settings.RAG_PIPELINE_IDLE_TTL,
+        )
+    return pipeline_cache_instance
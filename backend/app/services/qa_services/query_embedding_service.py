@@ -0,0 +1,137 @@
+import asyncio
+import threading
+from concurrent.futures import Future
+from typing import Dict, List, Optional, Tuple
+from starlette.concurrency import run_in_threadpool
+from app.config.settings import get_settings
+from app.utils.lru_cache import LRUCache
+from app.utils.metrics import track_stage
+from .embedding_batcher_service import EmbeddingBatcher, get_embedding_batcher
+
+
+settings = get_settings()
+
+
+class QueryEmbedder:
+    """Embeds questions for retrieval, remembering recent ones.
+
+    Embeddings only depend on the text, so the cache is shared by every user. Concurrent
+    misses for the same question (the local classifier and speculative retrieval embed it
+    at the same time) share a single embedding, sync and async callers alike.
+    """
+
+    def __init__(
+        self,
+        embeddings,
+        cache_size: int = settings.RAG_QUERY_EMBEDDING_CACHE_SIZE,
+        batcher: Optional[EmbeddingBatcher] = None,
+    ):
+        self.embeddings = embeddings
+        # Misses are batched with other in-flight questions when a batcher is given
+        self.batcher = batcher
+        self.cache = LRUCache(max_size=cache_size)
+        self.stats = {"hits": 0, "misses": 0, "coalesced": 0}
+        self._inflight: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _make_key(question: str) -> str:
+        return " ".join(question.split())
+
+    def _join(self, key: str) -> Tuple[Future, bool]:
+        """The in-flight embedding of `key`, and whether the caller has to compute it"""
+        with self._lock:
+            future = self._inflight.get(key)
+            if future is not None:
+                self.stats["coalesced"] += 1
+                return future, False
+            # Finished between the caller's cache check and here; _finish caches before leaving
+            embedding = self.cache.get(key)
+            if embedding is not None:
+                self.stats["hits"] += 1
+                future = Future()
+                future.set_result(embedding)
+                return future, False
+            future = Future()
+            self._inflight[key] = future
+            self.stats["misses"] += 1
+            return future, True
+
+    def _finish(self, key: str, future: Future, embedding: List[float]) -> List[float]:
+        self.cache.set(key, embedding)
+        future.set_result(embedding)
+        with self._lock:
+            self._inflight.pop(key, None)
+        return embedding
+
+    def _fail(self, key: str, future: Future, error: BaseException) -> None:
+        future.set_exception(error)
+        with self._lock:
+            self._inflight.pop(key, None)
+
+    def _cached(self, key: str) -> Optional[List[float]]:
+        embedding = self.cache.get(key)
+        if embedding is not None:
+            self.stats["hits"] += 1
+        return embedding
+
+    def embed(self, question: str) -> List[float]:
+        with track_stage("rag", "query_embedding"):
+            return self._embed(question)
+
+    def _embed(self, question: str) -> List[float]:
+        key = self._make_key(question)
+        embedding = self._cached(key)
+        if embedding is not None:
+            return embedding
+
+        future, is_leader = self._join(key)
+        if not is_leader:
+            return future.result()
+        try:
+            embedding = self.batcher.embed(key) if self.batcher else self.embeddings.embed_query(key)
+        except BaseException as e:
+            self._fail(key, future, e)
+            raise
+        return self._finish(key, future, embedding)
+
+    async def aembed(self, question: str) -> List[float]:
+        with track_stage("rag", "query_embedding"):
+            key = self._make_key(question)
+            embedding = self._cached(key)
+            if embedding is not None:
+                return embedding
+
+            future, is_leader = self._join(key)
+            if not is_leader:
+                return await asyncio.wrap_future(future)
+            try:
+                if self.batcher:
+                    embedding = await self.batcher.aembed(key)
+                else:
+                    embedding = await run_in_threadpool(self.embeddings.embed_query, key)
+            except BaseException as e:
+                # Includes cancellation, so callers waiting on this question aren't left hanging
+                self._fail(key, future, e)
+                raise
+            return self._finish(key, future, embedding)
+
+    # Embeddings interface, so the embedder can stand in for the model (e.g. in the local classifier)
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed(text)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return await self.aembed(text)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.embeddings.embed_documents(texts)
+
+
+query_embedder_instance = None
+
+def get_query_embedder() -> QueryEmbedder:
+    global query_embedder_instance
+    if query_embedder_instance is None:
+        batcher = get_embedding_batcher()
+        query_embedder_instance = QueryEmbedder(batcher.embeddings, batcher=batcher)
+    return query_embedder_instance
@@ -1,8 +1,57 @@
+import re
 import json
+import asyncio
+import hashlib
+import threading
+from concurrent.futures import Future
+import numpy as np
+from starlette.concurrency import run_in_threadpool
 from langchain_core.output_parsers import StrOutputParser
 from langchain_core.runnables import RunnableLambda
 from langchain.prompts import ChatPromptTemplate, SystemMessagePromptTemplate, HumanMessagePromptTemplate
-from typing import List
+from typing import Dict, List, Optional, Tuple
+from app.utils.lru_cache import LRUCache
+from app.utils.metrics import track_stage
+
+VALID_CATEGORIES = ["work", "health", "personal", "reflection"]
+# Used when a question can't be classified; never cached, so a transient failure doesn't stick
+FALLBACK_CATEGORIES = ["personal"]
+
+
+class ClassificationError(Exception):
+    """The classification LLM call failed or its reply couldn't be parsed"""
+
+# Extra labelled questions on top of the few-shot examples in CLASSIFICATION_PROMPT
+SEED_EXAMPLES: List[Tuple[str, List[str]]] = [
+    ("What deadlines do I have at the office?", ["work"]),
+    ("When is my next team meeting or client call?", ["work"]),
+    ("Which project tasks should I finish first?", ["work"]),
+    ("What is my workout plan for today?", ["health"]),
+    ("What should I eat for lunch on my diet?", ["health"]),
+    ("When is my gym session or doctor appointment?", ["health"]),
+    ("When am I meeting my friends this weekend?", ["personal"]),
+    ("Which house chores do I need to do?", ["personal"]),
+    ("When do I have time for painting or learning a language?", ["personal"]),
+    ("How have I been feeling lately?", ["reflection"]),
+    ("What did I write about my mood this week?", ["reflection"]),
+    ("Why do I feel anxious and unmotivated?", ["reflection"]),
+]
+
+
+def parse_seed_examples(prompt_template: str) -> List[Tuple[str, List[str]]]:
+    """Pull the category descriptions and few-shot examples out of the classification prompt"""
+    seeds = []
+    for label, description in re.findall(r"^\s*-\s*(work|health|personal|reflection):\s*(.+)$", prompt_template, re.M):
+        seeds.append((description.strip(), [label]))
+
+    for question, categories in re.findall(r"Question:\s*(.+?)\s*\n\s*Categories:\s*(\[.*?\])", prompt_template):
+        try:
+            labels = [cat for cat in json.loads(categories) if cat in VALID_CATEGORIES]
+        except json.JSONDecodeError:
+            continue
+        if labels:
+            seeds.append((question.strip(), labels))
+    return seeds
 
 
 class QuestionClassifier:
@@ -14,9 +63,9 @@ class QuestionClassifier:
         ])
         self.chain = self.classification_prompt | self.llm | StrOutputParser()
 
-    def _parse_categories(self, response_text: str) -> List[str]:
-        """Parse categories from LLM response, handling various formats"""
-        valid_cats = ["work", "health", "personal", "reflection"]
+    def _parse_categories(self, response_text: str) -> Optional[List[str]]:
+        """Parse categories from LLM response, handling various formats; None if nothing usable"""
+        valid_cats = VALID_CATEGORIES
         
         try:
             # First, try direct JSON parsing
@@ -37,30 +86,297 @@ class QuestionClassifier:
         except Exception as e:
             print(f"Parsing error: {e}")
         
-        # Ultimate fallback
-        return ["personal"]
+        return None
 
-    def _classify(self, question: str) -> List[str]:
-        """Classify question and return array of categories"""
+    def _classify_strict(self, question: str) -> List[str]:
+        """Classify question and return array of categories; raises ClassificationError on failure"""
         try:
             # Get LLM response
             llm_response = self.chain.invoke({"question": question})
-            
-            # Extract text content
-            response_text = llm_response.content.strip() if hasattr(llm_response, 'content') else str(llm_response).strip()
-            
-            # Parse categories
-            categories = self._parse_categories(response_text)
-            
-            return categories
+        except Exception as e:
+            raise ClassificationError(f"{type(e).__name__}: {e}") from e
+        return self._to_categories(llm_response)
+
+    async def _aclassify_strict(self, question: str) -> List[str]:
+        try:
+            # Async all the way down, so a hedged model can cancel the slower request
+            llm_response = await self.chain.ainvoke({"question": question})
+        except Exception as e:
+            raise ClassificationError(f"{type(e).__name__}: {e}") from e
+        return self._to_categories(llm_response)
+
+    def _to_categories(self, llm_response) -> List[str]:
+        # Extract text content
+        response_text = llm_response.content.strip() if hasattr(llm_response, 'content') else str(llm_response).strip()
+
+        # Parse categories
+        categories = self._parse_categories(response_text)
+        if categories is None:
+            raise ClassificationError(f"Unparseable classification reply: {response_text!r}")
+        return categories
+
+    def _classify(self, question: str) -> List[str]:
+        """Classify question and return array of categories"""
+        try:
+            return self._classify_strict(question)
+        except ClassificationError as e:
+            print(f"Classification error: {str(e)}")
+            return list(FALLBACK_CATEGORIES)
+
+    async def _aclassify(self, question: str) -> List[str]:
+        try:
+            return await self._aclassify_strict(question)
+        except ClassificationError as e:
+            print(f"Classification error: {str(e)}")
+            return list(FALLBACK_CATEGORIES)
+
+    def as_runnable(self):
+        return RunnableLambda(self._classify, afunc=self._aclassify)
+
+
+class LocalQuestionClassifier:
+    """Classifies questions against labelled prototype embeddings, asking the LLM only when unsure.
+
+    Each category scores the best cosine similarity among its prototypes. Every category
+    within `margin` of the best one is returned, so a question can still get several labels.
+    """
+
+    def __init__(
+        self,
+        embeddings,
+        fallback: QuestionClassifier,
+        seed_examples: List[Tuple[str, List[str]]],
+        threshold: float,
+        margin: float,
+    ):
+        self.embeddings = embeddings
+        self.fallback = fallback
+        self.threshold = threshold
+        self.margin = margin
+        self.stats = {"local": 0, "llm_fallback": 0}
+
+        texts = [text for text, _ in seed_examples]
+        self.prototypes = self._normalize(np.asarray(embeddings.embed_documents(texts), dtype=np.float32))
+        # (n_prototypes, n_categories) membership mask
+        self.membership = np.array(
+            [[cat in labels for cat in VALID_CATEGORIES] for _, labels in seed_examples], dtype=bool
+        )
+
+    @staticmethod
+    def _normalize(vectors: np.ndarray) -> np.ndarray:
+        norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+
+    def _score(self, question: str) -> Dict[str, float]:
+        return self._score_vector(self.embeddings.embed_query(question))
+
+    def _score_vector(self, vector: List[float]) -> Dict[str, float]:
+        query = self._normalize(np.asarray(vector, dtype=np.float32))
+        similarities = self.prototypes @ query
+        scores = {}
+        for i, category in enumerate(VALID_CATEGORIES):
+            mask = self.membership[:, i]
+            scores[category] = float(similarities[mask].max()) if mask.any() else -1.0
+        return scores
+
+    def _pick(self, scores: Optional[Dict[str, float]]) -> Optional[List[str]]:
+        """Categories within `margin` of the best score, or None when the LLM should decide"""
+        best = max(scores.values()) if scores else None
+        if best is None or best < self.threshold:
+            self.stats["llm_fallback"] += 1
+            return None
+
+        self.stats["local"] += 1
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+        return [category for category, score in ranked if score >= best - self.margin]
+
+    def _try_score(self, question: str) -> Optional[Dict[str, float]]:
+        try:
+            return self._score(question)
+        except Exception as e:
+            print(f"Local classification error: {e}")
+            return None
 
+    async def _atry_score(self, question: str) -> Optional[Dict[str, float]]:
+        try:
+            # Batched with other questions by the embedder, the model never runs on the loop
+            return self._score_vector(await self.embeddings.aembed_query(question))
         except Exception as e:
+            print(f"Local classification error: {e}")
+            return None
+
+    def _classify_strict(self, question: str) -> List[str]:
+        categories = self._pick(self._try_score(question))
+        if categories is None:
+            return self.fallback._classify_strict(question)
+        return categories
+
+    async def _aclassify_strict(self, question: str) -> List[str]:
+        categories = self._pick(await self._atry_score(question))
+        if categories is None:
+            return await self.fallback._aclassify_strict(question)
+        return categories
+
+    def _classify(self, question: str) -> List[str]:
+        try:
+            return self._classify_strict(question)
+        except ClassificationError as e:
             print(f"Classification error: {str(e)}")
-            print(f"Exception type: {type(e)}")
-            return ["personal"]  # fallback
+            return list(FALLBACK_CATEGORIES)
+
+    async def _aclassify(self, question: str) -> List[str]:
+        try:
+            return await self._aclassify_strict(question)
+        except ClassificationError as e:
+            print(f"Classification error: {str(e)}")
+            return list(FALLBACK_CATEGORIES)
+
+    def as_runnable(self):
+        return RunnableLambda(self._classify, afunc=self._aclassify)
+
+
+class CachedQuestionClassifier:
+    """Caches classifications by normalized question in an in-process LRU backed by Redis.
+
+    Concurrent misses for the same question in this process share a single call to the
+    wrapped classifier instead of each hitting the LLM. When that call fails the question
+    gets FALLBACK_CATEGORIES, which are not cached, so the next ask tries again.
+    """
+
+    KEY_PREFIX = "rag:classification"
+
+    def __init__(self, classifier, redis_client, ttl: int, max_size: int):
+        self.classifier = classifier
+        self.redis_client = redis_client
+        self.ttl = ttl
+        self.local_cache = LRUCache(max_size=max_size, idle_ttl=ttl)
+        self.stats = {"local_hits": 0, "redis_hits": 0, "misses": 0, "coalesced": 0, "failures": 0}
+        self._inflight: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def normalize(question: str) -> str:
+        return re.sub(r"\s+", " ", question.lower()).strip().rstrip("?!. ")
+
+    def _make_key(self, question: str) -> str:
+        digest = hashlib.sha256(self.normalize(question).encode("utf-8")).hexdigest()
+        return f"{self.KEY_PREFIX}:{digest}"
+
+    def _get_from_redis(self, key: str):
+        try:
+            raw = self.redis_client.get(key)
+            return json.loads(raw) if raw else None
+        except Exception as e:
+            print(f"Classification cache read failed: {e}")
+            return None
+
+    def _set_in_redis(self, key: str, categories: List[str]) -> None:
+        try:
+            self.redis_client.set(key, json.dumps(categories), ex=self.ttl)
+        except Exception as e:
+            print(f"Classification cache write failed: {e}")
+
+    def _classify(self, question: str) -> List[str]:
+        with track_stage("rag", "classification"):
+            return self._classify_cached(question)
+
+    async def _aclassify(self, question: str) -> List[str]:
+        with track_stage("rag", "classification"):
+            return await self._aclassify_cached(question)
+
+    def _join(self, key: str) -> Tuple[Future, bool]:
+        """The in-flight classification for `key`, and whether the caller has to run it"""
+        with self._lock:
+            future = self._inflight.get(key)
+            if future is not None:
+                return future, False
+            future = Future()
+            self._inflight[key] = future
+            return future, True
+
+    def _leave(self, key: str) -> None:
+        with self._lock:
+            self._inflight.pop(key, None)
+
+    def _fallback(self, future: Future, error: ClassificationError) -> List[str]:
+        print(f"Classification error, answering with the fallback uncached: {error}")
+        self.stats["failures"] += 1
+        categories = list(FALLBACK_CATEGORIES)
+        future.set_result(categories)
+        return list(categories)
+
+    def _classify_cached(self, question: str) -> List[str]:
+        key = self._make_key(question)
+
+        categories = self.local_cache.get(key)
+        if categories is not None:
+            self.stats["local_hits"] += 1
+            return list(categories)
+
+        future, is_leader = self._join(key)
+        if not is_leader:
+            # Someone else is already classifying this question
+            self.stats["coalesced"] += 1
+            return list(future.result())
+
+        try:
+            categories = self._get_from_redis(key)
+            if categories is not None:
+                self.stats["redis_hits"] += 1
+            else:
+                self.stats["misses"] += 1
+                try:
+                    categories = self.classifier._classify_strict(question)
+                except ClassificationError as e:
+                    return self._fallback(future, e)
+                self._set_in_redis(key, categories)
+
+            self.local_cache.set(key, categories)
+            future.set_result(categories)
+            return list(categories)
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            self._leave(key)
+
+    async def _aclassify_cached(self, question: str) -> List[str]:
+        key = self._make_key(question)
+
+        categories = self.local_cache.get(key)
+        if categories is not None:
+            self.stats["local_hits"] += 1
+            return list(categories)
+
+        future, is_leader = self._join(key)
+        if not is_leader:
+            self.stats["coalesced"] += 1
+            return list(await asyncio.wrap_future(future))
+
+        try:
+            categories = await run_in_threadpool(self._get_from_redis, key)
+            if categories is not None:
+                self.stats["redis_hits"] += 1
+            else:
+                self.stats["misses"] += 1
+                try:
+                    categories = await self.classifier._aclassify_strict(question)
+                except ClassificationError as e:
+                    return self._fallback(future, e)
+                await run_in_threadpool(self._set_in_redis, key, categories)
+
+            self.local_cache.set(key, categories)
+            future.set_result(categories)
+            return list(categories)
+        except BaseException as e:
+            # Includes cancellation, so callers waiting on this question aren't left hanging
+            future.set_exception(e)
+            raise
+        finally:
+            self._leave(key)
 
     def as_runnable(self):
-        return RunnableLambda(self._classify)
+        return RunnableLambda(self._classify, afunc=self._aclassify)
 
 
 
@@ -82,4 +398,4 @@ class QuestionClassifier:
             #     categories = [cat.strip().strip('"\'') for cat in response_text.split(',')]
             #     valid_categories = [cat.lower().strip() for cat in categories if cat.lower().strip() in valid_cats]
             #     if valid_categories:
-            #         return valid_categorie
\ No newline at end of file
+            #         return valid_categorie
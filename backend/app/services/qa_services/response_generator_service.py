@@ -1,46 +1,110 @@
+import asyncio
+import re
+from typing import AsyncIterator, Optional, Tuple, Union
 from langchain.prompts import ChatPromptTemplate, SystemMessagePromptTemplate, HumanMessagePromptTemplate
 from langchain_core.output_parsers import StrOutputParser
-from langchain_core.runnables import RunnableLambda
 from app.services.chat_services.chat_db_service import ChatDBService
+from app.services.chat_services.chat_write_behind_service import ChatWriteBehindService
+from app.services.chat_services.chat_summary_service import ChatSummaryService
+from app.utils.metrics import track_stage
+
+GENERATION_ERROR_MESSAGE = "I'm sorry, something went wrong while generating the response."
 
 # gets question, classification, context, source count as input but only uses question and context
 class ResponseGenerator:
-    def __init__(self, llm, generation_prompt: str, chat_service: ChatDBService, user_id: str, chat_id: str):
+    def __init__(
+        self, llm, generation_prompt: str, chat_service: Union[ChatDBService, ChatWriteBehindService], history_turns: int = 10,
+        summary_service: Optional[ChatSummaryService] = None,
+    ):
         self.llm = llm
         self.prompt_template = ChatPromptTemplate.from_messages([
             SystemMessagePromptTemplate.from_template(generation_prompt),  # The system-level instruction
             HumanMessagePromptTemplate.from_template("Please help me with this question: {question}") 
         ])
-        self.user_id = user_id
-        self.chat_id = chat_id
         self.chat_service = chat_service
+        self.history_turns = history_turns
+        # Covers the turns older than history_turns; without it they are simply dropped
+        self.summary_service = summary_service
+        self.chain = self.prompt_template | self.llm | StrOutputParser()
+
+    @staticmethod
+    def _format_history(chat_history, summary: str = "") -> str:
+        # Format chat history (you may need to adjust based on your prompt)
+        turns = "\n".join(
+            [f"User: {msg['user_input']}\nAssistant: {msg['assistant_response']}" for msg in chat_history]
+        )
+        if not summary:
+            return turns
+        return f"Summary of the earlier conversation:\n{summary}\n\nMost recent turns:\n{turns}"
+
+    async def _aload_history(self, chat_id: str, user_id: str) -> Tuple[str, int]:
+        with track_stage("rag", "chat_history"):
+            if self.summary_service is None:
+                messages, summary = await self.chat_service.aget_recent_messages(chat_id, user_id, self.history_turns), ""
+            else:
+                messages, summary = await asyncio.gather(
+                    self.chat_service.aget_recent_messages(chat_id, user_id, self.history_turns),
+                    self._aload_summary(chat_id, user_id),
+                )
+            return self._format_history(messages, summary), len(messages)
 
-    def _generate_response(self, inputs):
+    async def _aload_summary(self, chat_id: str, user_id: str) -> str:
         try:
-            question = inputs["question"]
-            context = inputs["context"]
+            return await self.summary_service.aget_summary(chat_id, user_id)
+        except Exception as e:
+            print(f"Loading chat summary failed, answering from recent turns only: {e}")
+            return ""
 
-            chat_history = self.chat_service.get_or_create_chat_session(self.chat_id, self.user_id).get("messages", [])
-            # Format chat history (you may need to adjust based on your prompt)
-            formatted_history = "\n".join(
-                [f"User: {msg['user_input']}\nAssistant: {msg['assistant_response']}" for msg in chat_history[-10:]]
-            )
+    async def _asave_turn(self, chat_id: str, user_id: str, question: str, response: str) -> None:
+        with track_stage("rag", "chat_persistence"):
+            await self.chat_service.aappend_chat_messages(chat_id, user_id, [{"user_input": question, "assistant_response": response}])
 
-            # Proper chain
-            chain = self.prompt_template | self.llm | StrOutputParser()
+    async def astream(self, inputs, outcome: Optional[dict] = None) -> AsyncIterator[str]:
+        """Stream answer tokens as the LLM produces them, saving the full answer once done.
 
-            response = chain.invoke({
+        When given, `outcome` gets the full answer under "answer" and "completed" set to True,
+        but only once both the LLM stream and the turn save have succeeded.
+        """
+        try:
+            question = inputs["question"]
+            chat_id = inputs["chat_id"]
+            user_id = inputs["user_id"]
+            formatted_history, recent_turns = await self._aload_history(chat_id, user_id)
+
+            chunks = []
+            async for token in self.chain.astream({
                 "question": question,
-                "context": context,
+                "context": inputs["context"],
                 "chat_history": formatted_history
-            })
+            }):
+                if not token:
+                    continue
+                chunks.append(token)
+                yield token
 
             # Save the response to the chat history
-            self.chat_service.update_chat_session(self.chat_id, [{"user_input": question, "assistant_response": response}])
-            return response
+            answer = "".join(chunks)
+            await self._asave_turn(chat_id, user_id, question, answer)
+            if outcome is not None:
+                outcome["answer"] = answer
+                outcome["completed"] = True
+            if self.summary_service and self.summary_service.needs_summary(recent_turns):
+                self.summary_service.aschedule(chat_id, user_id)
         except Exception as e:
             print(f"Error generating response: {e}")
-            return "I'm sorry, something went wrong while generating the response."
+            yield GENERATION_ERROR_MESSAGE
+
+    async def areplay(self, inputs, answer: str) -> AsyncIterator[str]:
+        """Stream a cached answer in word-sized chunks and record it as a turn like a generated one"""
+        for chunk in re.findall(r"\s*\S+\s*", answer):
+            yield chunk
 
-    def as_runnable(self):
-        return RunnableLambda(self._generate_response)
\ No newline at end of file
+        chat_id = inputs["chat_id"]
+        user_id = inputs["user_id"]
+        try:
+            await self._asave_turn(chat_id, user_id, inputs["question"], answer)
+            if self.summary_service:
+                # History wasn't read, so let the task decide whether anything needs folding
+                self.summary_service.aschedule(chat_id, user_id)
+        except Exception as e:
+            print(f"Saving replayed answer failed: {e}")
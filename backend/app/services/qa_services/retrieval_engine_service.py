@@ -1,12 +1,141 @@
+from langchain_core.documents import Document
 from langchain_core.runnables import RunnableLambda
-from app.utils.qa_utils import create_search_filter
-from typing import List
+from qdrant_client.models import QueryRequest
+from app.utils.qa_utils import (
+    canonical_file_type,
+    create_candidate_filter,
+    create_search_filter,
+    create_tenant_filter,
+    normalize_classification,
+)
+from app.config.qdrant_client import is_collection_ready
+from typing import List, Optional
+from app.utils.metrics import track_stage
+from .query_embedding_service import QueryEmbedder
+from .context_builder_service import ContextBuilder, NO_CONTEXT_MESSAGE
 
 class RetrievalEngine:
-    def __init__(self, vectorstore, k: int, allow_fallback: bool = True):
+    def __init__(
+        self, vectorstore, k: int, allow_fallback: bool = True, tenant_id: Optional[str] = None,
+        local_index=None, query_embedder: Optional[QueryEmbedder] = None, speculative_k: int = 0,
+        context_builder: Optional[ContextBuilder] = None,
+    ):
         self.vectorstore = vectorstore
         self.retrieval_k = k
         self.allow_fallback = allow_fallback
+        # Set when the vectorstore is the shared multitenant collection
+        self.tenant_id = tenant_id
+        # Optional in-memory exact search for small corpora, Qdrant is used when it declines
+        self.local_index = local_index
+        self.query_embedder = query_embedder or QueryEmbedder(vectorstore.embeddings)
+        # Wider candidate set fetched while the question is still being classified, 0 disables it
+        self.speculative_k = speculative_k
+        # Over-fetches and packs chunks into a token budget; without it the top k chunks are joined whole
+        self.context_builder = context_builder
+
+    def _fetch_k(self, classification) -> int:
+        if self.context_builder is None:
+            return self.retrieval_k
+        return self.context_builder.fetch_k(classification)
+
+    def _local_search(self, user_id, embedding, k, classification=None, week_start=None):
+        if self.local_index is None or not user_id:
+            return None
+        with track_stage("rag", "local_search"):
+            return self.local_index.search(
+                user_id,
+                self.vectorstore.collection_name,
+                self.tenant_id,
+                embedding,
+                k,
+                classification=classification,
+                week_start=week_start,
+            )
+
+    def _to_document(self, point) -> Document:
+        payload = point.payload or {}
+        return Document(
+            page_content=payload.get(self.vectorstore.content_payload_key, ""),
+            metadata=payload.get(self.vectorstore.metadata_payload_key) or {},
+        )
+
+    def _qdrant_search(self, embedding, k, classification, week_start):
+        """Filtered search and, if allowed, the fallback in one Qdrant round trip"""
+        filters = [create_search_filter(classification, week_start, self.tenant_id)]
+        if self.allow_fallback:
+            filters.append(create_tenant_filter(self.tenant_id) if self.tenant_id else None)
+
+        with track_stage("rag", "qdrant_search"):
+            responses = self.vectorstore.client.query_batch_points(
+                collection_name=self.vectorstore.collection_name,
+                requests=[
+                    QueryRequest(
+                        query=embedding,
+                        using=self.vectorstore.vector_name,
+                        filter=filter,
+                        limit=k,
+                        with_payload=True,
+                    )
+                    for filter in filters
+                ],
+            )
+        for response in responses:
+            if response.points:
+                return [self._to_document(point) for point in response.points]
+        return []
+
+    def _search(self, user_id, embedding, k, classification, week_start):
+        docs = self._local_search(user_id, embedding, k, classification, week_start)
+        if docs is not None:
+            if not docs and self.allow_fallback:
+                docs = self._local_search(user_id, embedding, k)
+            if docs is not None:
+                return docs
+        return self._qdrant_search(embedding, k, classification, week_start)
+
+    def prefetch(self, inputs) -> Optional[dict]:
+        """Embed the question and fetch candidates without a file_type filter, run alongside classification"""
+        try:
+            if not is_collection_ready(self.vectorstore.collection_name):
+                return None
+
+            embedding = self.query_embedder.embed(inputs["question"])
+            user_id = inputs.get("user_id")
+            # In-memory search is cheaper than any candidate query, just warm it up
+            if self.local_index is not None and user_id and self.local_index.covers(
+                user_id, self.vectorstore.collection_name, self.tenant_id
+            ):
+                return None
+
+            with track_stage("rag", "speculative_search"):
+                response = self.vectorstore.client.query_points(
+                    collection_name=self.vectorstore.collection_name,
+                    query=embedding,
+                    using=self.vectorstore.vector_name,
+                    query_filter=create_candidate_filter(inputs.get("week_start"), self.tenant_id),
+                    limit=self.speculative_k,
+                    with_payload=True,
+                )
+            return {
+                "docs": [self._to_document(point) for point in response.points],
+                # Fewer points than asked for means every point matching the week filter is here
+                "complete": len(response.points) < self.speculative_k,
+            }
+        except Exception as e:
+            # Speculation is only an optimization, retrieval still runs the normal way
+            print(f"Speculative retrieval failed: {e}")
+            return None
+
+    def _from_candidates(self, candidates: Optional[dict], k: int, classification) -> Optional[list]:
+        """Filter prefetched candidates by file_type, or None if a real query is still needed"""
+        if not candidates:
+            return None
+
+        categories = set(normalize_classification(classification))
+        docs = [doc for doc in candidates["docs"] if canonical_file_type(doc.metadata.get("file_type")) in categories]
+        if len(docs) >= k or (docs and candidates["complete"]):
+            return docs[:k]
+        return None
 
     def as_runnable(self):
         def retrieve(inputs):            
@@ -15,34 +144,40 @@ class RetrievalEngine:
                 week_start: List[str] = inputs.get("week_start", None) # will be an array
                 classification: List[str] = inputs.get("classification", ["personal"]) # will be an array
 
-                filter = create_search_filter(classification, week_start)
-
-                retriever = self.vectorstore.as_retriever(
-                    search_kwargs={
-                        "k": self.retrieval_k,
-                        "filter": filter,
+                # Users who never uploaded have no collection to search
+                if not is_collection_ready(self.vectorstore.collection_name):
+                    return {
+                        "context": NO_CONTEXT_MESSAGE,
+                        "question": question,
+                        "classification": classification,
+                        "sources_count": 0,
+                        "user_id": inputs.get("user_id"),
+                        "chat_id": inputs.get("chat_id")
                     }
-                )
 
+                k = self._fetch_k(classification)
+                docs = self._from_candidates(inputs.get("candidates"), k, classification)
+                if docs is None:
+                    # Embed once, the fallback search reuses the same vector
+                    embedding = self.query_embedder.embed(question)
+                    docs = self._search(inputs.get("user_id"), embedding, k, classification or ["personal"], week_start)
 
-                docs = retriever.invoke(question)
-                
-                if not docs and self.allow_fallback:
-                    fallback_retriever = self.vectorstore.as_retriever(
-                        search_kwargs={"k": self.retrieval_k}
-                    )
-                    docs = fallback_retriever.invoke(question)
-                
-                context = "\n\n".join([
-                    f"[File Type: {doc.metadata.get('file_type', 'unknown')}]:\n{doc.page_content}"
-                    for doc in docs
-                ]) if docs else "No relevant documents found in your personal knowledge base."
+                if self.context_builder is not None:
+                    context, sources_count = self.context_builder.build(docs)
+                else:
+                    context = "\n\n".join([
+                        f"[File Type: {doc.metadata.get('file_type', 'unknown')}]:\n{doc.page_content}"
+                        for doc in docs
+                    ]) if docs else NO_CONTEXT_MESSAGE
+                    sources_count = len(docs)
                 
                 result = {
                     "context": context,
                     "question": question,
                     "classification": classification,
-                    "sources_count": len(docs)
+                    "sources_count": sources_count,
+                    "user_id": inputs.get("user_id"),
+                    "chat_id": inputs.get("chat_id")
                 }
 
                 return result
@@ -1,15 +1,32 @@
+import time
+import threading
 from operator import itemgetter
 from typing import AsyncGenerator, List
-from langchain_core.runnables import RunnableParallel
-from app.config.qdrant_client import get_user_vector_store
+from langchain_core.runnables import RunnableLambda, RunnableParallel
+from starlette.concurrency import run_in_threadpool
+from app.config.qdrant_client import get_user_vector_store, get_tenant_id
 from app.config.settings import get_settings
-from .question_classifier_service import QuestionClassifier
+from .question_classifier_service import (
+    QuestionClassifier,
+    LocalQuestionClassifier,
+    CachedQuestionClassifier,
+    SEED_EXAMPLES,
+    parse_seed_examples,
+)
 from .retrieval_engine_service import RetrievalEngine
 from .response_generator_service import ResponseGenerator
 from app.config.model_loader import get_llm_manager
-from app.services.chat_services.chat_db_service import ChatDBService
+from app.services.chat_services.chat_write_behind_service import get_chat_write_behind_service
+from app.services.chat_services.chat_summary_service import get_chat_summary_service
+from .pipeline_cache_service import get_pipeline_cache
+from app.services.doc_services.doc_version_service import DocVersionService
+from .local_vector_index_service import get_local_vector_index
+from .query_embedding_service import get_query_embedder
+from .context_builder_service import ContextBuilder
+from .answer_cache_service import get_answer_cache
+from app.config.redis_client import redis_client
+from app.utils.metrics import ACTIVE_STREAMS, log_spans, record_stage
 # from app.utils.redis_cache import RedisCache
-# from app.config.redis_client import redis_client
 
 
 #  TODO: change this incorporate multiple classification categories
@@ -25,10 +42,21 @@ class RAGConfig:
         self.max_question_length = settings.RAG_MAX_QUESTION_LENGTH
         self.classification_retries = settings.RAG_CLASSIFICATION_RETRIES
         self.cache_ttl = settings.RAG_CACHE_TTL
+        self.chat_history_turns = settings.RAG_CHAT_HISTORY_TURNS
+        self.chat_summary_enabled = settings.CHAT_SUMMARY_ENABLED
+        self.classification_cache_size = settings.RAG_CLASSIFICATION_CACHE_SIZE
         self.streaming_delay_ms = settings.RAG_STREAMING_DELAY_MS
         self.max_concurrent_streams = settings.RAG_MAX_CONCURRENT_STREAMS
         self.classification_prompt = settings.CLASSIFICATION_PROMPT
+        self.local_classifier_enabled = settings.RAG_LOCAL_CLASSIFIER_ENABLED
+        self.local_classifier_threshold = settings.RAG_LOCAL_CLASSIFIER_THRESHOLD
+        self.local_classifier_margin = settings.RAG_LOCAL_CLASSIFIER_MARGIN
+        self.local_search_enabled = settings.RAG_LOCAL_SEARCH_ENABLED
+        self.speculative_retrieval = settings.RAG_SPECULATIVE_RETRIEVAL
+        self.context_builder_enabled = settings.RAG_CONTEXT_BUILDER_ENABLED
+        self.speculative_k = settings.RAG_SPECULATIVE_K
         self.generation_prompt = settings.GENERATION_PROMPT
+        self.answer_cache_enabled = settings.RAG_ANSWER_CACHE_ENABLED
 
 
 class RAGService:
@@ -36,67 +64,198 @@ class RAGService:
     
     def __init__(self):
         self.config = RAGConfig()
+        # History reads come from Redis and turns are persisted after the stream closes
+        self.chat_service = get_chat_write_behind_service()
+        self.pipeline_cache = get_pipeline_cache()
+        self.doc_version_service = DocVersionService()
+        self.answer_cache = get_answer_cache() if self.config.answer_cache_enabled else None
+        self._classifier = None
+        self._generator = None
+        self._components_lock = threading.Lock()
         # self.redis_cache = RedisCache(redis_client)
         
         # Stats tracking
-        # self.stats = {
-        #     "active_streams": 0,
-        #     "total_streamed": 0,
-        #     "total_chunks_sent": 0
-        # }
-
-    def _build_sync_chain(self, user_id: str, chat_id: str, week_start: List[str]):
-        """Build a sync Runnable chain for non-streaming chat"""
+        self.stats = {
+            "active_streams": 0,
+            "total_streamed": 0,
+            "total_chunks_sent": 0,
+            "answer_cache_hits": 0,
+            "last_ttft_ms": None
+        }
+
+    def _get_shared_components(self):
+        """Classifier and generator are user-independent, so build them once.
+
+        Building embeds every classifier prototype and creates the LLM clients, so it blocks:
+        call it from a thread (see _aget_shared_components) or at startup, never on the event loop.
+        """
+        if self._generator is None:
+            with self._components_lock:
+                # Concurrent first requests wait here for a single build
+                if self._generator is None:
+                    self._build_shared_components()
+        return self._classifier, self._generator
+
+    def _build_shared_components(self) -> None:
+        llm_manager = get_llm_manager()
+        # A few-token label doesn't need the answer model
+        classifier = QuestionClassifier(llm_manager.get_llm("classification"), self.config.classification_prompt)
+        if self.config.local_classifier_enabled:
+            # Shares the question embedding with retrieval through the embedder's cache
+            classifier = LocalQuestionClassifier(
+                get_query_embedder(),
+                fallback=classifier,
+                seed_examples=parse_seed_examples(self.config.classification_prompt) + SEED_EXAMPLES,
+                threshold=self.config.local_classifier_threshold,
+                margin=self.config.local_classifier_margin,
+            )
+        self._classifier = CachedQuestionClassifier(
+            classifier,
+            redis_client,
+            ttl=self.config.cache_ttl,
+            max_size=self.config.classification_cache_size,
+        )
+        # Assigned last: a non-None generator means both components are ready
+        self._generator = ResponseGenerator(
+            llm_manager.get_llm("generation"),
+            self.config.generation_prompt,
+            self.chat_service,
+            history_turns=self.config.chat_history_turns,
+            summary_service=get_chat_summary_service() if self.config.chat_summary_enabled else None,
+        )
+
+    async def _aget_shared_components(self):
+        if self._generator is not None:
+            return self._classifier, self._generator
+        return await run_in_threadpool(self._get_shared_components)
+
+    async def warm_up(self) -> None:
+        """Build the shared components before the first question arrives"""
+        try:
+            await self._aget_shared_components()
+        except Exception as e:
+            print(f"RAG warm-up failed, components will be built on first use: {e}")
+
+    def _build_retrieval_chain(self, user_id: str):
+        """Build the classification + retrieval chain for a user; per-chat state is passed in at call time"""
         try:
-            chat_service = ChatDBService()
             vectorstore = get_user_vector_store(user_id)
 
-            llm_manager = get_llm_manager()
-            shared_llm = llm_manager.shared_llm
-            classifier = QuestionClassifier(shared_llm, self.config.classification_prompt)
-            retriever = RetrievalEngine(vectorstore, self.config.retrieval_k)
-            generator = ResponseGenerator(shared_llm, self.config.generation_prompt, chat_service, user_id, chat_id)
-
-            chain = (
-                RunnableParallel({
-                    "question": itemgetter("question"),
-                    "week_start": itemgetter("week_start"),
-                    "classification": itemgetter("question") | classifier.as_runnable()
-                })
-                | retriever.as_runnable()
-                | generator.as_runnable()
+            classifier, _ = self._get_shared_components()
+            local_index = get_local_vector_index() if self.config.local_search_enabled else None
+            retriever = RetrievalEngine(
+                vectorstore,
+                self.config.retrieval_k,
+                tenant_id=get_tenant_id(user_id),
+                local_index=local_index,
+                query_embedder=get_query_embedder(),
+                speculative_k=self.config.speculative_k if self.config.speculative_retrieval else 0,
+                context_builder=ContextBuilder() if self.config.context_builder_enabled else None,
             )
 
+            branches = {
+                "question": itemgetter("question"),
+                "week_start": itemgetter("week_start"),
+                "user_id": itemgetter("user_id"),
+                "chat_id": itemgetter("chat_id"),
+                "classification": itemgetter("question") | classifier.as_runnable()
+            }
+            if retriever.speculative_k:
+                # Candidates are fetched while the classifier runs and filtered once categories are known
+                branches["candidates"] = RunnableLambda(retriever.prefetch)
+
+            chain = RunnableParallel(branches) | retriever.as_runnable()
+
             return chain
         except Exception as e:
-            print("Error building sync chain:", e)
+            print("Error building retrieval chain:", e)
             raise
 
+    def _get_chain(self, user_id: str):
+        """Return the user's cached chain, rebuilding it once their document version has moved on"""
+        version = self.doc_version_service.get_version(user_id)
+        entry = self.pipeline_cache.get(user_id)
+        if entry is not None and version >= 0 and entry[0] == version:
+            return entry[1]
+
+        chain = self._build_retrieval_chain(user_id)
+        # An unknown version (Redis down) could be stale by the time it's read back, so don't cache it
+        if version >= 0:
+            self.pipeline_cache.set(user_id, (version, chain))
+        return chain
+
+    async def _ais_new_chat(self, chat_id: str, user_id: str) -> bool:
+        """Whether the chat has no turns yet, so no history or summary feeds the prompt"""
+        # Follow-ups like "why?" depend on the conversation, which the answer cache doesn't key on.
+        # Also warms the recent-turns cache the generator reads next.
+        try:
+            return not await self.chat_service.aget_recent_messages(chat_id, user_id, 1)
+        except Exception as e:
+            print(f"Chat history check failed, skipping the answer cache: {e}")
+            return False
+
     async def run_question_streaming(
         self, question: str, user_id: str, chat_id: str, week_start: List[str]
     ) -> AsyncGenerator[str, None]:
         """Stream response chunks as Server-Sent Events"""
+        started_at = time.perf_counter()
+        first_token_at = None
+        self.stats["active_streams"] += 1
+        ACTIVE_STREAMS.inc()
         try:
-            chain = self._build_sync_chain(user_id, chat_id, week_start)
-
-            async for chunk in chain.astream({
+            _, generator = await self._aget_shared_components()
+            request = {
                 "question": question,
-                "week_start": week_start
-            }):
-                if isinstance(chunk, dict):
-                    text = chunk.get("output", "")
-                elif isinstance(chunk, str):
-                    text = chunk
-                else:
-                    text = ""
-                
+                "week_start": week_start,
+                "user_id": user_id,
+                "chat_id": chat_id
+            }
+
+            cached_answer, doc_version = None, -1
+            outcome = {"completed": False}
+            use_answer_cache = self.answer_cache is not None and await self._ais_new_chat(chat_id, user_id)
+            if use_answer_cache:
+                cached_answer, doc_version = await run_in_threadpool(self.answer_cache.lookup, user_id, week_start, question)
+
+            if cached_answer is not None:
+                # Repeated question against unchanged documents: skip classification, retrieval and generation
+                self.stats["answer_cache_hits"] += 1
+                stream = generator.areplay(request, cached_answer)
+            else:
+                # A cache miss touches Qdrant, keep it off the event loop
+                chain = await run_in_threadpool(self._get_chain, user_id)
+                inputs = await chain.ainvoke(request)
+                # Classification and retrieval together, including any overlap between them
+                record_stage("rag", "retrieval", time.perf_counter() - started_at)
+                stream = generator.astream(inputs, outcome)
+            generation_started_at = time.perf_counter()
+
+            async for text in stream:
+                if first_token_at is None:
+                    first_token_at = time.perf_counter()
+                    self.stats["last_ttft_ms"] = (first_token_at - started_at) * 1000
+                    record_stage("rag", "ttft", first_token_at - started_at)
+                self.stats["total_chunks_sent"] += 1
+
                 # Escape newlines to ensure single SSE message
                 text = text.replace("\n", "\\n")
                 yield f"data: {text}\n\n"
 
+            self.stats["total_streamed"] += 1
+            record_stage("rag", "generation", time.perf_counter() - generation_started_at)
+
+            # Only answers that streamed and saved in full; a failure anywhere leaves "completed" False
+            if cached_answer is None and use_answer_cache and outcome["completed"]:
+                await run_in_threadpool(self.answer_cache.store, user_id, week_start, question, outcome["answer"], doc_version)
+
         except Exception as e:
             print(f"Error during streaming RAG: {str(e)}")
             yield f"data: Something went wrong during streaming.\n\n"
+        finally:
+            self.stats["active_streams"] -= 1
+            ACTIVE_STREAMS.dec()
+            record_stage("rag", "total", time.perf_counter() - started_at)
+            log_spans(f"RAG stream for chat {chat_id}")
 
 
 
@@ -1,4 +1,5 @@
 from app.config.supabase_client import supabase
+from app.utils.db_executor import run_in_db_executor
 
 
 class UserDBService:
@@ -41,4 +42,20 @@ class UserDBService:
     def get_all_users(self) -> list:
         """Get all users"""
         response = self.supabase.table(self.table_name).select("*").execute()
-        return response.data if response.data else []
\ No newline at end of file
+        return response.data if response.data else []
+
+    # Async variants for request handlers
+    async def aget_user(self, user_id: str) -> dict:
+        return await run_in_db_executor(self.get_user, user_id)
+
+    async def aupdate_user(self, user_id: str, user_data: dict) -> dict:
+        return await run_in_db_executor(self.update_user, user_id, user_data)
+
+    async def adelete_user(self, user_id: str) -> dict:
+        return await run_in_db_executor(self.delete_user, user_id)
+
+    async def aupdate_user_weeks(self, user_id: str, newWeek: str) -> dict:
+        return await run_in_db_executor(self.update_user_weeks, user_id, newWeek)
+
+    async def aget_all_users(self) -> list:
+        return await run_in_db_executor(self.get_all_users)
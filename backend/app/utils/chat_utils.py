@@ -0,0 +1,28 @@
+import asyncio
+from app.config.celery_app import celery_app
+from app.config.redis_client import create_async_redis_client
+from app.services.chat_services.chat_db_service import ChatDBService
+from app.services.chat_services.chat_write_behind_service import ChatWriteBehindService
+from app.services.chat_services.chat_summary_service import ChatSummaryService
+
+async def _flush_pending_chat_turns():
+    # asyncio.run gives every task a fresh loop, so it needs its own Redis connections
+    redis = create_async_redis_client()
+    try:
+        await ChatWriteBehindService(ChatDBService(), redis_client=redis).flush_all_pending()
+    finally:
+        await redis.aclose()
+
+@celery_app.task
+def flush_pending_chat_turns():
+    """Writes chat turns left queued in Redis to the database"""
+    asyncio.run(_flush_pending_chat_turns())
+    return {"status": "completed"}
+
+@celery_app.task
+def summarize_chat_task(chat_id, user_id):
+    """Folds chat turns that left the prompt window into the chat's rolling summary"""
+    # Imported here so the worker only builds the LLM clients when it summarizes
+    from app.config.model_loader import get_llm_manager
+    folded = ChatSummaryService(ChatDBService()).summarize(chat_id, user_id, get_llm_manager().get_llm("summarization"))
+    return {"status": "completed", "folded_turns": folded}
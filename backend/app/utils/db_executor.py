@@ -0,0 +1,22 @@
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+from typing import Any, Callable
+from app.config.settings import get_settings
+
+
+settings = get_settings()
+
+# Dedicated pool for the blocking Supabase client, so slow PostgREST calls
+# can't starve the default threadpool or block the event loop
+db_executor = ThreadPoolExecutor(
+    max_workers=settings.DB_EXECUTOR_POOL_SIZE,
+    thread_name_prefix="supabase-db",
+)
+
+async def run_in_db_executor(func: Callable[..., Any], *args, **kwargs) -> Any:
+    """Run a blocking database call on the DB executor and await its result"""
+    loop = asyncio.get_running_loop()
+    # run_in_executor doesn't carry contextvars over, the request id and span dict go along explicitly
+    return await loop.run_in_executor(db_executor, functools.partial(copy_context().run, func, *args, **kwargs))
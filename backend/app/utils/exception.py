@@ -30,6 +30,12 @@ class GenerationException(RAGException):
     """Exception raised when answer generation fails"""
     pass
 
+class AdmissionRejectedException(RAGException):
+    """Exception raised when a question can't get a stream slot in time"""
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
 async def rag_exception_handler(request: Request, exc: RAGException):
     return JSONResponse(
         status_code=500,
@@ -40,3 +46,13 @@ async def rag_exception_handler(request: Request, exc: RAGException):
         }
     )
 
+async def admission_rejected_handler(request: Request, exc: AdmissionRejectedException):
+    return JSONResponse(
+        status_code=429,
+        content={
+            "error": str(exc),
+            "type": exc.__class__.__name__,
+            "timestamp": datetime.now().isoformat()
+        },
+        headers={"Retry-After": str(exc.retry_after)}
+    )
@@ -0,0 +1,65 @@
+import time
+import threading
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+
+class LRUCache:
+    """Thread-safe, size-bounded LRU cache with optional idle expiry.
+
+    Entries not touched for `idle_ttl` seconds are dropped lazily on the next access.
+    """
+
+    def __init__(self, max_size: int, idle_ttl: Optional[float] = None):
+        self.max_size = max_size
+        self.idle_ttl = idle_ttl
+        self._data: "OrderedDict[Hashable, list]" = OrderedDict()  # key -> [value, last_access]
+        self._lock = threading.Lock()
+
+    def _evict_idle(self, now: float) -> None:
+        if not self.idle_ttl:
+            return
+        # Least recently used entries sit at the front
+        while self._data:
+            key, (_, last_access) = next(iter(self._data.items()))
+            if now - last_access < self.idle_ttl:
+                break
+            self._data.popitem(last=False)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        now = time.monotonic()
+        with self._lock:
+            self._evict_idle(now)
+            entry = self._data.get(key)
+            if entry is None:
+                return default
+            entry[1] = now
+            self._data.move_to_end(key)
+            return entry[0]
+
+    def set(self, key: Hashable, value: Any) -> None:
+        if self.max_size <= 0:
+            return
+        now = time.monotonic()
+        with self._lock:
+            self._evict_idle(now)
+            self._data[key] = [value, now]
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def pop(self, key: Hashable) -> Any:
+        with self._lock:
+            entry = self._data.pop(key, None)
+            return entry[0] if entry else None
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self.get(key) is not None
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._data)
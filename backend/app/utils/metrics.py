@@ -0,0 +1,78 @@
+import os
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Optional
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest
+from prometheus_client import multiprocess
+from app.config.settings import get_settings
+
+
+settings = get_settings()
+
+REQUEST_ID_HEADER = "X-Request-ID"
+
+request_id_var: ContextVar[Optional[str]] = ContextVar("request_id", default=None)
+# Stage durations (ms) of the current request. Threads started from the request copy the
+# context, so they add to the same dict.
+request_spans_var: ContextVar[Optional[Dict[str, float]]] = ContextVar("request_spans", default=None)
+
+STAGE_DURATION = Histogram(
+    "stage_duration_seconds",
+    "Time spent in one stage of a pipeline",
+    ["pipeline", "stage"],
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120),
+)
+ACTIVE_STREAMS = Gauge("rag_active_streams", "RAG answers currently streaming in this worker", multiprocess_mode="livesum")
+ADMISSION_QUEUE_SECONDS = Histogram(
+    "rag_admission_queue_seconds",
+    "Time a question waited for a stream slot",
+    buckets=(0, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+ADMISSION_REJECTED = Counter("rag_admission_rejected_total", "Questions turned away with a 429", ["reason"])
+
+
+def start_request(request_id: Optional[str] = None) -> str:
+    """Bind a request id and a fresh span dict to the current context"""
+    request_id = request_id or uuid.uuid4().hex
+    request_id_var.set(request_id)
+    request_spans_var.set({})
+    return request_id
+
+def get_request_id() -> Optional[str]:
+    return request_id_var.get()
+
+def record_stage(pipeline: str, stage: str, seconds: float) -> None:
+    STAGE_DURATION.labels(pipeline, stage).observe(seconds)
+    spans = request_spans_var.get()
+    if spans is not None:
+        spans[stage] = spans.get(stage, 0.0) + seconds * 1000
+
+@contextmanager
+def track_stage(pipeline: str, stage: str):
+    started_at = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(pipeline, stage, time.perf_counter() - started_at)
+
+def format_spans() -> str:
+    """One-line summary of the current request, for the logs"""
+    spans = request_spans_var.get() or {}
+    timings = " ".join(f"{stage}={ms:.0f}ms" for stage, ms in spans.items())
+    return f"[{get_request_id() or '-'}] {timings}".rstrip()
+
+def log_spans(label: str) -> None:
+    """Print the current request's timings, when LOG_REQUEST_SPANS is on"""
+    if settings.LOG_REQUEST_SPANS:
+        print(f"{label}: {format_spans()}")
+
+def render_metrics():
+    """Prometheus exposition of this process, or of all workers in multiprocess mode"""
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
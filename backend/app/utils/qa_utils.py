@@ -1,6 +1,23 @@
 from qdrant_client.http.models import Filter, FieldCondition, MatchValue, MatchAny
 
-def create_search_filter(classification, week_start=None):
+def create_tenant_filter(user_id):
+    """Filter restricting a search to one user's points in the shared collection"""
+    return Filter(must=[FieldCondition(key="metadata.user_id", match=MatchValue(value=user_id))])
+
+# Uploads are tagged with their form field name, the classifier uses the singular
+FILE_TYPE_ALIASES = {"reflections": "reflection"}
+
+def canonical_file_type(file_type):
+    """The classifier's name for a category, whichever spelling its documents were stored with"""
+    name = (file_type or "").strip().lower()
+    return FILE_TYPE_ALIASES.get(name, name)
+
+def stored_file_types(classification):
+    """Every metadata.file_type value the documents of these categories may carry"""
+    categories = normalize_classification(classification)
+    return categories + [alias for alias, category in FILE_TYPE_ALIASES.items() if category in categories]
+
+def normalize_classification(classification):
     # Normalize classification to list
     if not classification:
         classification = ["personal"]
@@ -10,9 +27,28 @@ def create_search_filter(classification, week_start=None):
         classification = ["personal"]
     
     # Clean up classification list
-    classification = [cat.strip() for cat in classification if cat and cat.strip()]
+    classification = list(dict.fromkeys(canonical_file_type(cat) for cat in classification if cat and cat.strip()))
     if not classification:
         classification = ["personal"]
+    return classification
+
+def normalize_week_start(week_start):
+    if not week_start:
+        return None
+    return week_start if isinstance(week_start, list) else [week_start]
+
+def create_candidate_filter(week_start=None, user_id=None):
+    """Filter for speculative retrieval: everything create_search_filter applies except file_type"""
+    conditions = []
+    week_start = normalize_week_start(week_start)
+    if week_start:
+        conditions.append(FieldCondition(key="metadata.week_start", match=MatchAny(any=week_start)))
+    if user_id:
+        conditions.append(FieldCondition(key="metadata.user_id", match=MatchValue(value=user_id)))
+    return Filter(must=conditions) if conditions else None
+
+def create_search_filter(classification, week_start=None, user_id=None):
+    classification = stored_file_types(classification)
     
     conditions = []
     
@@ -54,5 +90,14 @@ def create_search_filter(classification, week_start=None):
                 )
             )
     
+    # Shared collection: never let a search cross into another user's points
+    if user_id:
+        conditions.append(
+            FieldCondition(
+                key="metadata.user_id",
+                match=MatchValue(value=user_id)
+            )
+        )
+
     filter = Filter(must=conditions)
     return filter
\ No newline at end of file
@@ -0,0 +1,300 @@
+"""Offline load test of the real FastAPI app against local stand-ins.
+
+Usage (from backend/):
+    python -m benchmarks.run_benchmark --concurrency 1 4 16 --requests 40 --output results.json
+
+Uploads documents for every benchmark user through /api/docs/upload_doc, then drives
+/api/qa/ask-stream at each concurrency level and writes latency percentiles, time to
+first token and throughput to a JSON file so runs can be compared.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import socket
+import subprocess
+import threading
+import time
+import uuid
+from typing import Dict, List, Optional
+
+from .stand_ins import install_stand_ins, make_pdf, make_token_rate_chat_model
+
+QUESTIONS = [
+    "What meetings do I have at work this week?",
+    "What is my workout plan for the next few days?",
+    "Which chores do I still need to finish at home?",
+    "How have I been feeling about my progress lately?",
+    "Which project deadlines are coming up soon?",
+    "When should I go to the gym and what should I eat?",
+    "What did I plan to do with my friends this weekend?",
+    "What did I write about my stress and mood?",
+]
+
+DOCUMENT_LINES = {
+    "work": [
+        "Monday: sprint planning meeting with the product team at 10am.",
+        "Wednesday: client call about the quarterly report deadline.",
+        "Friday: finish the API migration project tasks and code review.",
+    ],
+    "health": [
+        "Workout plan: run 5km on Tuesday, gym strength session on Thursday.",
+        "Diet: high protein lunch, fewer snacks, drink two litres of water.",
+        "Doctor appointment on Saturday morning for a routine checkup.",
+    ],
+    "reflections": [
+        "I felt stressed about deadlines but proud of my progress this week.",
+        "My mood improved after sleeping better and taking short walks.",
+        "I want to worry less and celebrate small wins more often.",
+    ],
+    "personal": [
+        "Chores: laundry, groceries and cleaning the kitchen on Sunday.",
+        "Dinner with friends on Saturday evening, call my parents on Sunday.",
+        "Practice painting for an hour and study Spanish on Wednesday.",
+    ],
+}
+
+ANSWER = (
+    "Based on your plan for this week, you have a sprint planning meeting on Monday, a client call "
+    "on Wednesday and a code review on Friday. Keep some time free for your workout on Tuesday."
+)
+
+
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * pct / 100
+    low, high = int(rank), min(int(rank) + 1, len(ordered) - 1)
+    return round(ordered[low] + (ordered[high] - ordered[low]) * (rank - low), 2)
+
+
+def summarize(latencies_ms: List[float]) -> dict:
+    return {
+        "p50_ms": percentile(latencies_ms, 50),
+        "p95_ms": percentile(latencies_ms, 95),
+        "p99_ms": percentile(latencies_ms, 99),
+        "mean_ms": round(sum(latencies_ms) / len(latencies_ms), 2) if latencies_ms else None,
+        "max_ms": round(max(latencies_ms), 2) if latencies_ms else None,
+    }
+
+
+def make_token(user_id: str, secret: str) -> str:
+    import jwt
+    now = int(time.time())
+    return jwt.encode(
+        {"sub": user_id, "aud": "authenticated", "role": "authenticated", "iat": now, "exp": now + 24 * 3600},
+        secret,
+        algorithm="HS256",
+    )
+
+
+class ServerThread:
+    """Runs the app under uvicorn on a free local port, in its own thread and event loop"""
+
+    def __init__(self, app):
+        import uvicorn
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            self.port = sock.getsockname()[1]
+        config = uvicorn.Config(app, host="127.0.0.1", port=self.port, log_level="warning", lifespan="on")
+        self.server = uvicorn.Server(config)
+        self.thread = threading.Thread(target=self.server.run, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    def __enter__(self):
+        self.thread.start()
+        while not self.server.started:
+            time.sleep(0.05)
+        return self
+
+    def __exit__(self, *exc):
+        self.server.should_exit = True
+        self.thread.join(timeout=10)
+
+
+async def upload_documents(client, token: str, week_start: str) -> dict:
+    files = {
+        file_type: (f"{file_type}.pdf", make_pdf(lines), "application/pdf")
+        for file_type, lines in DOCUMENT_LINES.items()
+    }
+    started_at = time.perf_counter()
+    response = await client.post(
+        "/api/docs/upload_doc",
+        files=files,
+        data={"week_start": week_start},
+        headers={"Authorization": f"Bearer {token}"},
+    )
+    return {"ok": response.status_code == 200, "status": response.status_code, "latency_ms": (time.perf_counter() - started_at) * 1000}
+
+
+async def ask_question(client, token: str, chat_id: str, question: str, week_start: str) -> dict:
+    started_at = time.perf_counter()
+    first_token_ms = None
+    chunks = 0
+    async with client.stream(
+        "POST",
+        "/api/qa/ask-stream",
+        json={"question": question, "chat_id": chat_id, "week_start": [week_start]},
+        headers={"Authorization": f"Bearer {token}"},
+    ) as response:
+        if response.status_code != 200:
+            await response.aread()
+            return {"ok": False, "status": response.status_code, "latency_ms": (time.perf_counter() - started_at) * 1000}
+        async for line in response.aiter_lines():
+            if not line.startswith("data:"):
+                continue
+            if first_token_ms is None:
+                first_token_ms = (time.perf_counter() - started_at) * 1000
+            chunks += 1
+    return {
+        "ok": True,
+        "status": 200,
+        "latency_ms": (time.perf_counter() - started_at) * 1000,
+        "ttft_ms": first_token_ms,
+        "chunks": chunks,
+    }
+
+
+async def run_level(client, tokens: Dict[str, str], concurrency: int, total_requests: int, week_start: str, seed: int) -> dict:
+    """Send `total_requests` questions with at most `concurrency` in flight"""
+    rng = random.Random(seed)
+    jobs = [
+        (user_id, str(uuid.uuid4()), rng.choice(QUESTIONS))
+        for user_id in rng.choices(list(tokens), k=total_requests)
+    ]
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run(job):
+        user_id, chat_id, question = job
+        async with semaphore:
+            try:
+                return await ask_question(client, tokens[user_id], chat_id, question, week_start)
+            except Exception as e:
+                return {"ok": False, "status": None, "error": str(e), "latency_ms": None}
+
+    started_at = time.perf_counter()
+    results = await asyncio.gather(*[run(job) for job in jobs])
+    wall_seconds = time.perf_counter() - started_at
+
+    succeeded = [r for r in results if r["ok"]]
+    statuses: Dict[str, int] = {}
+    for r in results:
+        statuses[str(r["status"])] = statuses.get(str(r["status"]), 0) + 1
+    chunks = sum(r["chunks"] for r in succeeded)
+    return {
+        "concurrency": concurrency,
+        "requests": total_requests,
+        "succeeded": len(succeeded),
+        "statuses": statuses,
+        "wall_seconds": round(wall_seconds, 3),
+        "throughput_rps": round(len(succeeded) / wall_seconds, 2) if wall_seconds else None,
+        "chunks_per_second": round(chunks / wall_seconds, 1) if wall_seconds else None,
+        "latency": summarize([r["latency_ms"] for r in succeeded]),
+        "ttft": summarize([r["ttft_ms"] for r in succeeded if r["ttft_ms"] is not None]),
+    }
+
+
+async def run_uploads(client, tokens: Dict[str, str], concurrency: int, week_start: str) -> dict:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run(token):
+        async with semaphore:
+            return await upload_documents(client, token, week_start)
+
+    started_at = time.perf_counter()
+    results = await asyncio.gather(*[run(token) for token in tokens.values()])
+    wall_seconds = time.perf_counter() - started_at
+    succeeded = [r for r in results if r["ok"]]
+    return {
+        "concurrency": concurrency,
+        "requests": len(results),
+        "succeeded": len(succeeded),
+        "wall_seconds": round(wall_seconds, 3),
+        "throughput_rps": round(len(succeeded) / wall_seconds, 2) if wall_seconds else None,
+        "latency": summarize([r["latency_ms"] for r in succeeded]),
+    }
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True, stderr=subprocess.DEVNULL).strip()
+    except Exception:
+        return None
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Offline benchmark of the RAG API against local stand-ins")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16], help="Concurrency levels for ask-stream")
+    parser.add_argument("--requests", type=int, default=40, help="Questions sent per concurrency level")
+    parser.add_argument("--users", type=int, default=8, help="Distinct benchmark users")
+    parser.add_argument("--upload-concurrency", type=int, default=2, help="Concurrent document uploads")
+    parser.add_argument("--tokens-per-second", type=float, default=50.0, help="Fake LLM streaming rate, 0 for no delay")
+    parser.add_argument("--first-token-ms", type=float, default=200.0, help="Fake LLM delay before its first token")
+    parser.add_argument("--classification-ms", type=float, default=100.0, help="Fake classification LLM latency")
+    parser.add_argument("--db-latency-ms", type=float, default=5.0, help="Latency added to every fake Supabase call")
+    parser.add_argument("--answer-cache", action="store_true", help="Keep the answer cache on; repeated questions are then mostly replays")
+    parser.add_argument("--real-embeddings", action="store_true", help="Use the real MiniLM model instead of hash embeddings")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--output", default="benchmark_results.json", help="Where to write the JSON report")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    stand_ins = install_stand_ins(
+        db_latency_ms=args.db_latency_ms, real_embeddings=args.real_embeddings, answer_cache=args.answer_cache
+    )
+
+    # Imported only now, so the app picks up the stand-ins
+    from app.config import model_loader
+    from app.main import app
+
+    llm_manager = model_loader.get_llm_manager()
+    llm_manager.llms["classification"] = make_token_rate_chat_model('["work", "personal"]', 0, args.classification_ms)
+    llm_manager.llms["generation"] = make_token_rate_chat_model(ANSWER, args.tokens_per_second, args.first_token_ms)
+
+    week_start = "2024-01-01"
+    user_ids = [str(uuid.uuid4()) for _ in range(args.users)]
+    for user_id in user_ids:
+        stand_ins.supabase.table("users").insert({"id": user_id, "weeks": []}).execute()
+    secret = os.environ["SUPABASE_JWT_SECRET"]
+    tokens = {user_id: make_token(user_id, secret) for user_id in user_ids}
+
+    async def drive(base_url: str) -> dict:
+        import httpx
+        limits = httpx.Limits(max_connections=max(args.concurrency) * 2)
+        async with httpx.AsyncClient(base_url=base_url, timeout=120, limits=limits) as client:
+            uploads = await run_uploads(client, tokens, args.upload_concurrency, week_start)
+            # One warm-up question per user builds their pipelines outside the measured runs
+            await asyncio.gather(*[
+                ask_question(client, token, str(uuid.uuid4()), QUESTIONS[0], week_start) for token in tokens.values()
+            ])
+            levels = []
+            for concurrency in args.concurrency:
+                levels.append(await run_level(client, tokens, concurrency, args.requests, week_start, args.seed))
+                print(f"concurrency={concurrency}: {json.dumps(levels[-1])}")
+            return {"upload": uploads, "ask_stream": levels}
+
+    with ServerThread(app) as server:
+        results = asyncio.run(drive(server.base_url))
+
+    report = {
+        "started_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "git_revision": git_revision(),
+        "python": platform.python_version(),
+        "config": vars(args),
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote {args.output}")
+
+
+if __name__ == "__main__":
+    main()
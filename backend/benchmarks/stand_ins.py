@@ -0,0 +1,364 @@
+"""Local stand-ins for the services the backend talks to, so the real app can be benchmarked offline.
+
+install_stand_ins() must run before anything under `app` is imported: the app builds its
+Supabase, Qdrant, Redis and embedding clients at import time.
+"""
+import asyncio
+import hashlib
+import itertools
+import os
+import threading
+import time
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional
+
+import numpy as np
+
+EMBEDDING_DIM = 384
+
+
+# ---------------------------------------------------------------- Supabase / PostgREST
+
+class FakeResponse:
+    def __init__(self, data):
+        self.data = data
+
+
+# Database-side column defaults that the app relies on
+COLUMN_DEFAULTS = {
+    "chats": {"summary": "", "summary_message_id": 0},
+}
+
+
+class FakeQuery:
+    """The subset of the PostgREST query builder the app uses, over in-memory rows"""
+
+    def __init__(self, db: "FakeSupabase", table: str):
+        self.db = db
+        self.table = table
+        self.action = "select"
+        self.payload = None
+        self.filters = []
+        self.order_by = None
+        self.limit_count = None
+        self.single_row = False
+
+    def select(self, columns: str = "*"):
+        self.action = "select"
+        return self
+
+    def insert(self, payload):
+        self.action, self.payload = "insert", payload
+        return self
+
+    def update(self, payload):
+        self.action, self.payload = "update", payload
+        return self
+
+    def delete(self):
+        self.action = "delete"
+        return self
+
+    def eq(self, column, value):
+        self.filters.append(lambda row: row.get(column) == value)
+        return self
+
+    def gt(self, column, value):
+        self.filters.append(lambda row: row.get(column) is not None and row.get(column) > value)
+        return self
+
+    def lt(self, column, value):
+        self.filters.append(lambda row: row.get(column) is not None and row.get(column) < value)
+        return self
+
+    def order(self, column, desc: bool = False):
+        self.order_by = (column, desc)
+        return self
+
+    def limit(self, count: int):
+        self.limit_count = count
+        return self
+
+    def single(self):
+        self.single_row = True
+        return self
+
+    def maybe_single(self):
+        return self.single()
+
+    def execute(self) -> FakeResponse:
+        self.db.simulate_latency()
+        with self.db.lock:
+            rows = self.db.tables.setdefault(self.table, [])
+            if self.action == "insert":
+                new_rows = self.payload if isinstance(self.payload, list) else [self.payload]
+                inserted = []
+                for row in new_rows:
+                    row = {**COLUMN_DEFAULTS.get(self.table, {}), **row}
+                    row.setdefault("id", next(self.db.ids))
+                    rows.append(row)
+                    inserted.append(dict(row))
+                return FakeResponse(inserted)
+
+            matched = [row for row in rows if all(check(row) for check in self.filters)]
+            if self.action == "update":
+                for row in matched:
+                    row.update(self.payload)
+            elif self.action == "delete":
+                self.db.tables[self.table] = [row for row in rows if row not in matched]
+
+            result = [dict(row) for row in matched]
+            if self.order_by:
+                column, desc = self.order_by
+                result.sort(key=lambda row: row.get(column), reverse=desc)
+            if self.limit_count is not None:
+                result = result[:self.limit_count]
+            if self.single_row:
+                return FakeResponse(result[0] if result else None)
+            return FakeResponse(result)
+
+
+class FakeRPC:
+    def __init__(self, db: "FakeSupabase", name: str, params: dict):
+        self.db, self.name, self.params = db, name, params
+
+    def execute(self) -> FakeResponse:
+        self.db.simulate_latency()
+        if self.name != "append_chat_messages":
+            raise NotImplementedError(f"RPC {self.name} has no stand-in")
+        return FakeResponse(self.db.append_chat_messages(**self.params))
+
+
+class FakeBucket:
+    def __init__(self, db: "FakeSupabase", bucket: str):
+        self.db, self.bucket = db, bucket
+
+    def upload(self, path: str, data: bytes, file_options: Optional[dict] = None):
+        self.db.simulate_latency()
+        with self.db.lock:
+            self.db.files[(self.bucket, path)] = len(data)
+        return {"path": path}
+
+    def get_public_url(self, path: str) -> str:
+        return f"https://storage.invalid/{self.bucket}/{path}"
+
+
+class FakeStorage:
+    def __init__(self, db: "FakeSupabase"):
+        self.db = db
+
+    def from_(self, bucket: str) -> FakeBucket:
+        return FakeBucket(self.db, bucket)
+
+
+class FakeSupabase:
+    """In-memory Supabase client: tables, the append_chat_messages RPC and storage uploads.
+
+    `latency_ms` is added to every call to stand in for the network round trip.
+    """
+
+    def __init__(self, latency_ms: float = 0.0):
+        self.latency = latency_ms / 1000
+        self.lock = threading.Lock()
+        self.tables: Dict[str, List[dict]] = {}
+        self.files: Dict[tuple, int] = {}
+        self.ids = itertools.count(1)
+        self.storage = FakeStorage(self)
+
+    def simulate_latency(self) -> None:
+        if self.latency:
+            time.sleep(self.latency)
+
+    def table(self, name: str) -> FakeQuery:
+        return FakeQuery(self, name)
+
+    def rpc(self, name: str, params: dict) -> FakeRPC:
+        return FakeRPC(self, name, params)
+
+    def append_chat_messages(self, p_chat_id: str, p_user_id: Optional[str], p_messages: List[dict]) -> int:
+        """Same contract as migrations/002_chat_message_turn_ids.sql"""
+        with self.lock:
+            chats = self.tables.setdefault("chats", [])
+            messages = self.tables.setdefault("chat_messages", [])
+            chat = next((row for row in chats if row["id"] == p_chat_id), None)
+            if chat is None:
+                chat = {**COLUMN_DEFAULTS["chats"], "id": p_chat_id, "user_id": p_user_id, "status": "active", "messages_count": 0}
+                chats.append(chat)
+
+            known_turns = {row.get("turn_id") for row in messages if row["chat_id"] == p_chat_id}
+            for message in p_messages:
+                if message.get("turn_id") and message["turn_id"] in known_turns:
+                    continue
+                known_turns.add(message.get("turn_id"))
+                messages.append({
+                    "id": next(self.ids),
+                    "chat_id": p_chat_id,
+                    "user_id": chat["user_id"],
+                    "turn_id": message.get("turn_id"),
+                    "user_input": message["user_input"],
+                    "assistant_response": message["assistant_response"],
+                    "created_at": time.time(),
+                })
+                chat["messages_count"] += 1
+            return chat["messages_count"]
+
+
+# ---------------------------------------------------------------- Embeddings
+
+class HashEmbeddings:
+    """Deterministic bag-of-words embeddings: every word maps to a fixed random unit vector.
+
+    Texts sharing words land close together, which is enough to exercise retrieval,
+    and nothing has to be downloaded.
+    """
+
+    def __init__(self, model_name: str = "", **kwargs):
+        self.model_name = model_name
+        self._word_vectors: Dict[str, np.ndarray] = {}
+        self._lock = threading.Lock()
+
+    def _word_vector(self, word: str) -> np.ndarray:
+        with self._lock:
+            vector = self._word_vectors.get(word)
+            if vector is None:
+                seed = int.from_bytes(hashlib.md5(word.encode("utf-8")).digest()[:4], "little")
+                vector = np.random.default_rng(seed).standard_normal(EMBEDDING_DIM).astype(np.float32)
+                self._word_vectors[word] = vector
+            return vector
+
+    def _embed(self, text: str) -> List[float]:
+        vector = np.zeros(EMBEDDING_DIM, dtype=np.float32)
+        for word in text.lower().split():
+            vector += self._word_vector(word.strip(".,!?;:\"'()"))
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed(text)
+
+
+# ---------------------------------------------------------------- LLM
+
+def make_token_rate_chat_model(answer: str, tokens_per_second: float, first_token_ms: float):
+    """Chat model that waits `first_token_ms`, then streams `answer` word by word at a fixed rate"""
+    from langchain_core.language_models.chat_models import BaseChatModel
+    from langchain_core.messages import AIMessage, AIMessageChunk
+    from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+    class TokenRateChatModel(BaseChatModel):
+        reply: str
+        tokens_per_second: float
+        first_token_ms: float
+
+        @property
+        def _llm_type(self) -> str:
+            return "token-rate-fake"
+
+        def _tokens(self) -> List[str]:
+            words = self.reply.split(" ")
+            return [word if i == 0 else " " + word for i, word in enumerate(words)]
+
+        def _delay(self) -> float:
+            return 1 / self.tokens_per_second if self.tokens_per_second > 0 else 0.0
+
+        def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+            time.sleep(self.first_token_ms / 1000 + self._delay() * len(self._tokens()))
+            return ChatResult(generations=[ChatGeneration(message=AIMessage(content=self.reply))])
+
+        def _stream(self, messages, stop=None, run_manager=None, **kwargs) -> Iterator[ChatGenerationChunk]:
+            time.sleep(self.first_token_ms / 1000)
+            for token in self._tokens():
+                yield ChatGenerationChunk(message=AIMessageChunk(content=token))
+                time.sleep(self._delay())
+
+        async def _astream(self, messages, stop=None, run_manager=None, **kwargs) -> AsyncIterator[ChatGenerationChunk]:
+            await asyncio.sleep(self.first_token_ms / 1000)
+            for token in self._tokens():
+                yield ChatGenerationChunk(message=AIMessageChunk(content=token))
+                await asyncio.sleep(self._delay())
+
+    return TokenRateChatModel(reply=answer, tokens_per_second=tokens_per_second, first_token_ms=first_token_ms)
+
+
+# ---------------------------------------------------------------- PDFs
+
+def make_pdf(lines: List[str]) -> bytes:
+    """Smallest valid one-page PDF with the given lines of text"""
+    def escape(text: str) -> str:
+        return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+    text_ops = "BT /F1 11 Tf 50 780 Td 14 TL " + " ".join(f"({escape(line)}) Tj T*" for line in lines) + " ET"
+    objects = [
+        "<< /Type /Catalog /Pages 2 0 R >>",
+        "<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+        "<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents 4 0 R /Resources << /Font << /F1 5 0 R >> >> >>",
+        f"<< /Length {len(text_ops)} >>\nstream\n{text_ops}\nendstream",
+        "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    out = b"%PDF-1.4\n"
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += f"{number} 0 obj\n{body}\nendobj\n".encode("latin-1")
+    xref_at = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode("latin-1")
+    out += "".join(f"{offset:010d} 00000 n \n" for offset in offsets).encode("latin-1")
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref_at}\n%%EOF\n".encode("latin-1")
+    return out
+
+
+# ---------------------------------------------------------------- Wiring
+
+class StandIns:
+    def __init__(self, supabase: FakeSupabase, redis_server: Any):
+        self.supabase = supabase
+        self.redis_server = redis_server
+
+
+def install_stand_ins(db_latency_ms: float = 0.0, real_embeddings: bool = False, answer_cache: bool = False) -> StandIns:
+    """Point the app at in-memory Qdrant, a fake Supabase, fakeredis and (optionally) hash embeddings"""
+    import fakeredis
+    import qdrant_client
+    import supabase as supabase_module
+
+    # Settings and module-level clients read these at import time
+    os.environ.setdefault("SUPABASE_URL", "http://supabase.invalid")
+    os.environ.setdefault("SUPABASE_SERVICE_KEY", "benchmark")
+    os.environ.setdefault("SUPABASE_JWT_SECRET", "benchmark-jwt-secret")
+    os.environ.setdefault("QDRANT_URL", "http://qdrant.invalid")
+    os.environ.setdefault("QDRANT_API_KEY", "benchmark")
+    os.environ.setdefault("LLM_BACKEND", "fake")
+    # Child processes would each need the stand-ins too
+    os.environ.setdefault("PDF_EXTRACT_WORKERS", "1")
+    os.environ.pop("REDIS_URL", None)
+    # The benchmark repeats a handful of questions, so cached answers would replace most generations
+    os.environ["RAG_ANSWER_CACHE_ENABLED"] = "true" if answer_cache else "false"
+
+    fake_supabase = FakeSupabase(latency_ms=db_latency_ms)
+    supabase_module.create_client = lambda url, key, *args, **kwargs: fake_supabase
+
+    class InMemoryQdrantClient(qdrant_client.QdrantClient):
+        def __init__(self, *args, **kwargs):
+            super().__init__(location=":memory:")
+
+    qdrant_client.QdrantClient = InMemoryQdrantClient
+
+    if not real_embeddings:
+        import langchain.embeddings
+        langchain.embeddings.HuggingFaceEmbeddings = HashEmbeddings
+
+    # Every Redis client, sync or async, shares one fake server
+    server = fakeredis.FakeServer()
+    import app.config.redis_client as redis_config
+    redis_config.redis_client = fakeredis.FakeRedis(server=server, decode_responses=True)
+    redis_config.binary_redis_client = fakeredis.FakeRedis(server=server, decode_responses=False)
+    redis_config.create_async_redis_client = lambda: fakeredis.FakeAsyncRedis(server=server, decode_responses=True)
+    redis_config.async_redis_client = redis_config.create_async_redis_client()
+
+    # Uploads are processed in-process instead of on a worker
+    from app.config.celery_app import celery_app
+    celery_app.conf.task_always_eager = True
+
+    return StandIns(fake_supabase, server)
@@ -0,0 +1,84 @@
+-- Append-only chat message storage.
+-- Each turn becomes one row in chat_messages instead of being appended to the
+-- chats.messages JSON array, so a turn costs O(1) and concurrent turns can't
+-- overwrite each other. Run in the Supabase SQL editor.
+
+create table if not exists public.chat_messages (
+    id bigint generated always as identity primary key,
+    chat_id uuid not null references public.chats(id) on delete cascade,
+    user_id uuid not null,
+    user_input text not null,
+    assistant_response text not null default '',
+    created_at timestamptz not null default now()
+);
+
+-- Serves "last N turns" and cursor pagination (id < cursor) for a chat
+create index if not exists chat_messages_chat_id_id_idx
+    on public.chat_messages (chat_id, id desc);
+
+
+-- Appends turns atomically and keeps chats.messages_count in step.
+-- When p_user_id is given the chat is created if missing and must belong to that user.
+create or replace function public.append_chat_messages(
+    p_chat_id uuid,
+    p_user_id uuid,
+    p_messages jsonb
+) returns integer
+language plpgsql
+as $$
+declare
+    v_owner uuid;
+    v_added integer;
+    v_count integer;
+begin
+    if p_user_id is not null then
+        insert into public.chats (id, user_id, messages, status, messages_count)
+        values (p_chat_id, p_user_id, '[]'::jsonb, 'active', 0)
+        on conflict (id) do nothing;
+    end if;
+
+    -- Row lock serialises concurrent appends to the same chat
+    select user_id into v_owner from public.chats where id = p_chat_id for update;
+    if v_owner is null then
+        raise exception 'Chat session not found';
+    end if;
+    if p_user_id is not null and v_owner <> p_user_id then
+        raise exception 'Chat session belongs to another user';
+    end if;
+
+    insert into public.chat_messages (chat_id, user_id, user_input, assistant_response)
+    select p_chat_id, v_owner, m.value->>'user_input', coalesce(m.value->>'assistant_response', '')
+    from jsonb_array_elements(p_messages) with ordinality as m(value, position)
+    order by m.position;
+    get diagnostics v_added = row_count;
+
+    update public.chats
+    set messages_count = messages_count + v_added,
+        updated_at = now()
+    where id = p_chat_id
+    returning messages_count into v_count;
+
+    return v_count;
+end;
+$$;
+
+
+-- Backfill: copy existing chats.messages arrays into rows, keeping their order.
+-- Chats that already have rows are skipped, so this is safe to re-run.
+insert into public.chat_messages (chat_id, user_id, user_input, assistant_response, created_at)
+select c.id,
+       c.user_id,
+       coalesce(m.value->>'user_input', ''),
+       coalesce(m.value->>'assistant_response', ''),
+       c.created_at
+from public.chats c
+cross join lateral jsonb_array_elements(coalesce(c.messages, '[]'::jsonb)) with ordinality as m(value, position)
+where not exists (select 1 from public.chat_messages cm where cm.chat_id = c.id)
+order by c.id, m.position;
+
+update public.chats c
+set messages_count = (select count(*) from public.chat_messages cm where cm.chat_id = c.id);
+
+-- chats.messages is no longer written by the backend. Once the backfill is
+-- verified it can be emptied to reclaim space:
+-- update public.chats set messages = '[]'::jsonb;
@@ -0,0 +1,58 @@
+-- Idempotent chat appends.
+-- Turns are written behind the response stream and retried on failure, so the
+-- same turn can reach append_chat_messages twice. A client-generated turn_id
+-- lets the second write be ignored.
+
+alter table public.chat_messages add column if not exists turn_id uuid;
+
+create unique index if not exists chat_messages_turn_id_key
+    on public.chat_messages (turn_id);
+
+
+create or replace function public.append_chat_messages(
+    p_chat_id uuid,
+    p_user_id uuid,
+    p_messages jsonb
+) returns integer
+language plpgsql
+as $$
+declare
+    v_owner uuid;
+    v_added integer;
+    v_count integer;
+begin
+    if p_user_id is not null then
+        insert into public.chats (id, user_id, messages, status, messages_count)
+        values (p_chat_id, p_user_id, '[]'::jsonb, 'active', 0)
+        on conflict (id) do nothing;
+    end if;
+
+    -- Row lock serialises concurrent appends to the same chat
+    select user_id into v_owner from public.chats where id = p_chat_id for update;
+    if v_owner is null then
+        raise exception 'Chat session not found';
+    end if;
+    if p_user_id is not null and v_owner <> p_user_id then
+        raise exception 'Chat session belongs to another user';
+    end if;
+
+    insert into public.chat_messages (chat_id, user_id, user_input, assistant_response, turn_id)
+    select p_chat_id,
+           v_owner,
+           m.value->>'user_input',
+           coalesce(m.value->>'assistant_response', ''),
+           (m.value->>'turn_id')::uuid
+    from jsonb_array_elements(p_messages) with ordinality as m(value, position)
+    order by m.position
+    on conflict (turn_id) do nothing;
+    get diagnostics v_added = row_count;
+
+    update public.chats
+    set messages_count = messages_count + v_added,
+        updated_at = now()
+    where id = p_chat_id
+    returning messages_count into v_count;
+
+    return v_count;
+end;
+$$;
@@ -0,0 +1,8 @@
+-- Rolling chat summaries.
+-- The generation prompt carries only the last few turns verbatim; everything
+-- older is folded into chats.summary by a background task. summary_message_id
+-- is the last chat_messages.id folded in, so the task resumes from there and
+-- updates conditioned on it can't fold the same turns twice.
+
+alter table public.chats add column if not exists summary text not null default '';
+alter table public.chats add column if not exists summary_message_id bigint not null default 0;
@@ -0,0 +1,95 @@
+"""Copy every per-user collection (user_<id>_docs) into the shared multitenant collection.
+
+Points keep their ids, vectors and payloads, with metadata.user_id added. Each source
+collection is streamed with scroll, so memory stays at one batch regardless of size.
+
+Run from the backend directory, then switch QDRANT_MULTITENANT on:
+    python -m scripts.migrate_to_shared_collection [--batch-size 256] [--delete-source] [--dry-run]
+"""
+import re
+import argparse
+from qdrant_client.models import PointStruct
+from app.config.qdrant_client import (
+    qdrant_client,
+    ensure_collection,
+    collection_registry,
+    SHARED_COLLECTION_NAME,
+)
+from app.utils.qa_utils import create_tenant_filter
+
+USER_COLLECTION_PATTERN = re.compile(r"^user_(.+)_docs$")
+
+
+def migrate_collection(collection_name: str, user_id: str, batch_size: int, dry_run: bool) -> int:
+    """Stream one user's points into the shared collection, returns how many were copied"""
+    copied = 0
+    offset = None
+    while True:
+        points, offset = qdrant_client.scroll(
+            collection_name=collection_name,
+            limit=batch_size,
+            offset=offset,
+            with_payload=True,
+            with_vectors=True,
+        )
+        if not points:
+            break
+
+        batch = []
+        for point in points:
+            payload = dict(point.payload or {})
+            metadata = dict(payload.get("metadata") or {})
+            metadata["user_id"] = user_id
+            payload["metadata"] = metadata
+            batch.append(PointStruct(id=point.id, vector=point.vector, payload=payload))
+
+        if not dry_run:
+            qdrant_client.upsert(collection_name=SHARED_COLLECTION_NAME, points=batch, wait=True)
+        copied += len(batch)
+
+        if offset is None:
+            break
+    return copied
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Move per-user Qdrant collections into the shared collection")
+    parser.add_argument("--batch-size", type=int, default=256, help="Points per scroll/upsert request")
+    parser.add_argument("--delete-source", action="store_true", help="Delete each user collection once its copy is verified")
+    parser.add_argument("--dry-run", action="store_true", help="Only report what would be copied")
+    args = parser.parse_args()
+
+    if not args.dry_run:
+        ensure_collection(qdrant_client, SHARED_COLLECTION_NAME)
+
+    collections = [c.name for c in qdrant_client.get_collections().collections]
+    total = 0
+    for collection_name in collections:
+        match = USER_COLLECTION_PATTERN.match(collection_name)
+        if not match:
+            continue
+        user_id = match.group(1)
+
+        copied = migrate_collection(collection_name, user_id, args.batch_size, args.dry_run)
+        total += copied
+        print(f"{collection_name}: {copied} points {'would be ' if args.dry_run else ''}copied")
+
+        if args.dry_run or not args.delete_source:
+            continue
+
+        source_count = qdrant_client.count(collection_name, exact=True).count
+        target_count = qdrant_client.count(
+            SHARED_COLLECTION_NAME, count_filter=create_tenant_filter(user_id), exact=True
+        ).count
+        if target_count < source_count:
+            print(f"{collection_name}: only {target_count}/{source_count} points in the shared collection, keeping source")
+            continue
+        qdrant_client.delete_collection(collection_name)
+        collection_registry.forget(collection_name)
+        print(f"{collection_name}: deleted")
+
+    print(f"Done, {total} points {'would be ' if args.dry_run else ''}copied into {SHARED_COLLECTION_NAME}")
+
+
+if __name__ == "__main__":
+    main()
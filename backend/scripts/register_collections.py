@@ -0,0 +1,30 @@
+"""Register every existing Qdrant collection and create its missing payload indexes.
+
+The query path never changes collection schemas, so collections created before the
+collection registry existed keep searching without their payload indexes until their
+user uploads again. Run this once after deploying to index them all up front:
+    python -m scripts.register_collections [--dry-run]
+"""
+import argparse
+from app.config.qdrant_client import qdrant_client, ensure_collection, collection_registry
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Create missing payload indexes and register existing collections")
+    parser.add_argument("--dry-run", action="store_true", help="Only list collections that are not registered as ready")
+    args = parser.parse_args()
+
+    collections = [c.name for c in qdrant_client.get_collections().collections]
+    pending = [name for name in collections if not collection_registry.is_ready(name)]
+    for collection_name in pending:
+        if args.dry_run:
+            print(f"{collection_name}: not registered")
+            continue
+        ensure_collection(qdrant_client, collection_name)
+        print(f"{collection_name}: registered")
+
+    print(f"Done, {len(pending)} of {len(collections)} collections {'need' if args.dry_run else 'were'} registering")
+
+
+if __name__ == "__main__":
+    main()
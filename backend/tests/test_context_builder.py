@@ -0,0 +1,35 @@
+from benchmarks.stand_ins import make_pdf
+from app.services.doc_services.pdf_extraction_service import PDFPageExtractor
+from app.services.qa_services.context_builder_service import ContextBuilder
+from app.utils.qa_utils import create_search_filter
+
+# The upload form's field name, which documents are tagged with (routes/doc.py)
+UPLOAD_FIELD = "reflections"
+
+
+def extract_upload(tmp_path, lines):
+    path = tmp_path / f"{UPLOAD_FIELD}_user_week.pdf"
+    path.write_bytes(make_pdf(lines))
+    return list(PDFPageExtractor(backend="pypdf", max_workers=1).iter_pages([(str(path), UPLOAD_FIELD)]))
+
+
+def test_category_budget_applies_to_uploaded_reflections(tmp_path):
+    docs = extract_upload(tmp_path, ["I felt stressed about deadlines but proud of my progress this week."])
+    assert docs and docs[0].metadata["file_type"] == UPLOAD_FIELD
+
+    builder = ContextBuilder(default_budget=1000, category_budgets={"reflection": 5}, use_mmr=False)
+    assert builder.budget_for(docs[0].metadata["file_type"]) == 5
+
+
+def test_stored_spelling_also_works_as_budget_key(tmp_path):
+    docs = extract_upload(tmp_path, ["My mood improved after sleeping better."])
+
+    builder = ContextBuilder(default_budget=1000, category_budgets={"reflections": 5}, use_mmr=False)
+    assert builder.budget_for(docs[0].metadata["file_type"]) == 5
+    assert builder.budget_for("reflection") == 5
+
+
+def test_search_filter_matches_stored_reflections():
+    condition = create_search_filter(["reflection"]).must[0]
+    assert condition.key == "metadata.file_type"
+    assert set(condition.match.any) == {"reflection", UPLOAD_FIELD}
@@ -110,17 +110,21 @@ export async function fetchLLMResponseStream({
 
     const reader = response.body.getReader();
     const decoder = new TextDecoder("utf-8");
+    // Events can be split across reads, keep the incomplete tail for the next one
+    let buffer = "";
 
     while (true) {
       const { done, value } = await reader.read();
       if (done) break;
 
-      const chunk = decoder.decode(value, { stream: true });
-      const lines = chunk.split("\n\n");
+      buffer += decoder.decode(value, { stream: true });
+      const events = buffer.split("\n\n");
+      buffer = events.pop() ?? "";
 
-      for (const line of lines) {
-        if (line.startsWith("data: ")) {
-          const token = line.replace("data: ", "").replace(/\\n/g, "\n").trim();
+      for (const event of events) {
+        if (event.startsWith("data: ")) {
+          // Tokens carry their own leading/trailing spaces, so don't trim them
+          const token = event.slice("data: ".length).replace(/\\n/g, "\n");
           if (token) onToken(token);
         }
       }